@@ -47,6 +47,11 @@ urlpatterns = [
         translator_views.update_environment,
         name="update_environment",
     ),
+    re_path(
+        r"^movement_stream/(?P<sim_code>[\w-]+)/(?P<step>[\w-]+)/$",
+        translator_views.movement_stream,
+        name="movement_stream",
+    ),
     re_path(r"^path_tester/$", translator_views.path_tester, name="path_tester"),
     re_path(
         r"^path_tester_update/$",
@@ -6,12 +6,20 @@ File: views.py
 import datetime
 import json
 import os
+import time
 
-from django.http import HttpRequest, HttpResponse, JsonResponse
+from django.http import (
+    HttpRequest,
+    HttpResponse,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import render
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 
+from generative_agents.backend.global_methods import segment_paths
+from generative_agents.steplog import open_step_log
 from global_methods import check_if_file_exists, find_filenames
 
 from .validation import (
@@ -20,9 +28,22 @@ from .validation import (
     safe_storage_path,
     validate_camera_data,
     validate_environment_request,
+    validate_step,
     validate_update_request,
 )
 
+# The longest update_environment holds a request while waiting for the
+# backend to finish a step. The frontend asks again right after a request
+# that came back without the step.
+UPDATE_WAIT_SECONDS = 10
+# How often movement_stream sends a comment while the backend is still on a
+# step, so that the connection is not dropped as idle.
+STREAM_KEEPALIVE_SECONDS = 15
+# How long movement_stream waits for a new step before it ends the stream.
+# An EventSource reconnects on its own and resumes from its Last-Event-ID,
+# so a paused simulation does not hold a worker forever.
+STREAM_IDLE_SECONDS = 600
+
 
 def landing(request):
     context = {}
@@ -138,17 +159,11 @@ def home(request):
             persona_names_set.add(x)
 
     persona_init_pos = []
-    file_count = []
-    for i in find_filenames(f"storage/{sim_code}/environment", ".json"):
-        x = i.split("/")[-1].strip()
-        if x[0] != ".":
-            file_count += [int(x.split(".")[0])]
-    curr_json = f"storage/{sim_code}/environment/{str(max(file_count))}.json"
-    with open(curr_json) as json_file:
-        persona_init_pos_dict = json.load(json_file)
-        for key, val in persona_init_pos_dict.items():
-            if key in persona_names_set:
-                persona_init_pos += [[key, val["x"], val["y"]]]
+    environment_log = open_step_log(f"storage/{sim_code}/environment")
+    persona_init_pos_dict = environment_log.read(environment_log.last_step())
+    for key, val in persona_init_pos_dict.items():
+        if key in persona_names_set:
+            persona_init_pos += [[key, val["x"], val["y"]]]
 
     context = {
         "sim_code": sim_code,
@@ -174,17 +189,11 @@ def replay(request, sim_code, step):
             persona_names_set.add(x)
 
     persona_init_pos = []
-    file_count = []
-    for i in find_filenames(f"storage/{sim_code}/environment", ".json"):
-        x = i.split("/")[-1].strip()
-        if x[0] != ".":
-            file_count += [int(x.split(".")[0])]
-    curr_json = f"storage/{sim_code}/environment/{str(max(file_count))}.json"
-    with open(curr_json) as json_file:
-        persona_init_pos_dict = json.load(json_file)
-        for key, val in persona_init_pos_dict.items():
-            if key in persona_names_set:
-                persona_init_pos += [[key, val["x"], val["y"]]]
+    environment_log = open_step_log(f"storage/{sim_code}/environment")
+    persona_init_pos_dict = environment_log.read(environment_log.last_step())
+    for key, val in persona_init_pos_dict.items():
+        if key in persona_names_set:
+            persona_init_pos += [[key, val["x"], val["y"]]]
 
     context = {
         "sim_code": sim_code,
@@ -217,8 +226,25 @@ def replay_persona_state(request, sim_code, step, persona_name):
     with open(os.path.join(memory, "spatial_memory.json")) as json_file:
         spatial = json.load(json_file)
 
-    with open(os.path.join(memory, "associative_memory", "nodes.json")) as json_file:
-        associative = json.load(json_file)
+    # Memories are saved as an append-only log with one node per line, split
+    # into segments (nodes.jsonl, nodes.1.jsonl, ...); older simulations have
+    # a single nodes.json.
+    nodes_log = segment_paths(
+        os.path.join(memory, "associative_memory"), "nodes.jsonl"
+    )
+    if nodes_log:
+        associative = dict()
+        for segment in nodes_log:
+            with open(segment) as log_file:
+                for line in log_file:
+                    if line.endswith("\n"):
+                        node_details = json.loads(line)
+                        associative[node_details["node_id"]] = node_details
+    else:
+        with open(
+            os.path.join(memory, "associative_memory", "nodes.json")
+        ) as json_file:
+            associative = json.load(json_file)
 
     a_mem_event = []
     a_mem_chat = []
@@ -288,11 +314,8 @@ def process_environment(request: HttpRequest) -> HttpResponse:
     if output_path is None:
         return HttpResponse("Invalid path parameters", status=400)
 
-    # Ensure parent directory exists
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-
-    with open(output_path, "w") as outfile:
-        json.dump(environment, outfile, indent=2)
+    # The environment of each step is appended to the simulation's step log.
+    open_step_log(output_path.parent).append(step, environment)
 
     return HttpResponse("received")
 
@@ -303,7 +326,10 @@ def update_environment(request: HttpRequest) -> HttpResponse:
     """Send backend persona movement data to the frontend.
 
     This endpoint reads movement data computed by the backend simulation
-    and returns it to the frontend for visualization.
+    and returns it to the frontend for visualization. If the backend has not
+    finished the step yet, the request is held until it does (for at most
+    UPDATE_WAIT_SECONDS), so the frontend gets the movements as soon as they
+    exist instead of on its next poll.
 
     Args:
         request: Django request containing JSON with step and sim_code.
@@ -328,14 +354,93 @@ def update_environment(request: HttpRequest) -> HttpResponse:
         return HttpResponse("Invalid path parameters", status=400)
 
     response_data: dict = {"<step>": -1}
-    if movement_path.exists():
-        with open(movement_path) as json_file:
-            response_data = json.load(json_file)
-            response_data["<step>"] = step
+    movement = open_step_log(movement_path.parent).wait(
+        step, timeout=UPDATE_WAIT_SECONDS
+    )
+    if movement is not None:
+        response_data = movement
+        response_data["<step>"] = step
 
     return JsonResponse(response_data)
 
 
+def movement_events(
+    movement_log,
+    step,
+    keepalive=STREAM_KEEPALIVE_SECONDS,
+    idle_timeout=STREAM_IDLE_SECONDS,
+):
+    """Yield the movements of <step> and the steps after it as server-sent events.
+
+    Each event is sent as soon as the backend writes the step. Its id is the
+    step, and its data is the movement payload of update_environment. The
+    events end once no step was written for <idle_timeout> seconds.
+
+    Args:
+        movement_log: The simulation's movement StepLog.
+        step: The first step to send.
+        keepalive: Seconds after which a comment is sent while waiting.
+        idle_timeout: Seconds without a new step after which the events end.
+
+    Yields:
+        Server-sent event strings.
+    """
+    deadline = time.monotonic() + idle_timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        movement = movement_log.wait(step, timeout=min(keepalive, remaining))
+        if movement is None:
+            yield ": keep-alive\n\n"
+            continue
+        movement["<step>"] = step
+        yield f"id: {step}\ndata: {json.dumps(movement)}\n\n"
+        step += 1
+        deadline = time.monotonic() + idle_timeout
+
+
+def movement_stream(request: HttpRequest, sim_code: str, step: str) -> HttpResponse:
+    """Stream backend persona movement data to the frontend.
+
+    This is the push counterpart of update_environment: a single
+    server-sent event stream (EventSource) that delivers the movements of
+    every step from <step> on as the backend produces them. A reconnecting
+    EventSource sends the id of the last event it received, and the stream
+    resumes after it.
+
+    Args:
+        request: Django request.
+        sim_code: The simulation code.
+        step: The first step to stream.
+
+    Returns:
+        StreamingHttpResponse of text/event-stream, or HTTP 400 on validation
+        failure.
+    """
+    first_step = validate_step(step)
+    if first_step is None:
+        return HttpResponse(
+            "Validation error (step): Must be a non-negative integer", status=400
+        )
+
+    # Build safe path preventing traversal attacks
+    movement_path = safe_storage_path(sim_code, "movement")
+    if movement_path is None:
+        return HttpResponse("Invalid path parameters", status=400)
+
+    last_event_id = validate_step(request.headers.get("Last-Event-ID", ""))
+    if last_event_id is not None:
+        first_step = last_event_id + 1
+
+    response = StreamingHttpResponse(
+        movement_events(open_step_log(movement_path), first_step),
+        content_type="text/event-stream",
+    )
+    response["Cache-Control"] = "no-cache"
+    return response
+
+
 @csrf_exempt
 @require_POST
 def path_tester_update(request: HttpRequest) -> HttpResponse:
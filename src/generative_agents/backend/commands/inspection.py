@@ -2,6 +2,8 @@
 
 from typing import TYPE_CHECKING
 
+from generative_agents.backend.persona.prompt_template import gpt_structure
+
 from . import registry
 from .base import CommandResult
 
@@ -201,3 +203,51 @@ def cmd_print_tile_details(server: "ReverieServer", command: str) -> CommandResu
         f"{key}: {val}" for key, val in server.maze.access_tile(coordinate).items()
     ]
     return CommandResult.ok("\n".join(lines))
+
+
+# --- Path Commands ---
+
+
+@registry.register(
+    "print path cache stats",
+    help_text="Show path cache hits, misses and size",
+)
+def cmd_print_path_cache_stats(server: "ReverieServer", command: str) -> CommandResult:
+    """Print the counters of the maze's path cache."""
+    stats = server.maze.path_cache.stats()
+    lookups = stats["hits"] + stats["misses"]
+    hit_rate = stats["hits"] / lookups if lookups else 0.0
+    output = (
+        f"hits: {stats['hits']}\n"
+        f"misses: {stats['misses']}\n"
+        f"hit rate: {hit_rate:.1%}\n"
+        f"entries: {stats['entries']} / {stats['max_entries']}\n"
+        f"collision revision: {server.maze.collision_revision}"
+    )
+    return CommandResult.ok(output)
+
+
+# --- LLM Commands ---
+
+
+@registry.register(
+    "print llm cache stats",
+    help_text="Show LLM response cache hits, misses and size",
+)
+def cmd_print_llm_cache_stats(server: "ReverieServer", command: str) -> CommandResult:
+    """Print the counters of the persistent LLM response cache."""
+    response_cache = gpt_structure.response_cache
+    if response_cache is None:
+        return CommandResult.ok("LLM response cache is off (LLM_CACHE_MODE=off)")
+    stats = response_cache.stats()
+    lookups = stats["hits"] + stats["misses"]
+    hit_rate = stats["hits"] / lookups if lookups else 0.0
+    output = (
+        f"mode: {stats['mode']}\n"
+        f"hits: {stats['hits']}\n"
+        f"misses: {stats['misses']}\n"
+        f"hit rate: {hit_rate:.1%}\n"
+        f"entries: {stats['entries']}\n"
+        f"size: {stats['size_bytes'] / (1024 * 1024):.1f} MB"
+    )
+    return CommandResult.ok(output)
@@ -1,4 +1,4 @@
-"""Simulation control commands: run, save, fin, exit."""
+"""Simulation control commands: run, run headless, save, fin, exit."""
 
 import shutil
 from typing import TYPE_CHECKING
@@ -43,3 +43,15 @@ def cmd_run(server: "ReverieServer", command: str) -> CommandResult:
     int_count = int(command.split()[-1])
     server.start_server(int_count)
     return CommandResult.ok()
+
+
+@registry.register(
+    "run headless",
+    match_prefix=True,
+    help_text="Run N steps without the frontend (e.g., 'run headless 100')",
+)
+def cmd_run_headless(server: "ReverieServer", command: str) -> CommandResult:
+    """Run simulation for specified number of steps without the frontend."""
+    int_count = int(command.split()[-1])
+    server.start_server(int_count, headless=True)
+    return CommandResult.ok()
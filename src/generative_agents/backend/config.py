@@ -189,3 +189,144 @@ MODEL_PLAN = model_config.PLAN
 MODEL_REFLECT = model_config.REFLECT
 MODEL_EXECUTE = model_config.EXECUTE
 MODEL_CONVERSE = model_config.CONVERSE
+
+
+def _env_int(name: str, default: int) -> int:
+    """Read an integer setting from the environment.
+
+    Args:
+        name: Environment variable name
+        default: Value used when the variable is unset or empty
+
+    Returns:
+        The parsed integer setting
+    """
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_model_map(name: str) -> Dict[str, str]:
+    """Read a per-model setting such as "gpt-5=4,gpt-5-mini=8".
+
+    Args:
+        name: Environment variable name
+
+    Returns:
+        Dictionary mapping model names to their (unparsed) values
+    """
+    mapping = {}
+    for item in os.getenv(name, "").split(","):
+        if "=" in item:
+            model, value = item.split("=", 1)
+            mapping[model.strip()] = value.strip()
+    return mapping
+
+
+# Runtime configuration (performance knobs, also not secrets)
+# PERSONA_WORKERS: how many personas may run their cognitive sequence
+# (perceive/retrieve/plan/reflect/execute) at the same time within one step.
+# 1 keeps the original one-after-another loop.
+PERSONA_WORKERS = _env_int("PERSONA_WORKERS", 1)
+
+# PERSONA_LOADING: "eager" loads every persona's memory when the server
+# starts; "lazy" only loads the scratch, and a persona's spatial and
+# associative memory on first access. In both modes, loaded associative
+# memories read their embedding vectors only when retrieval needs them.
+PERSONA_LOADING = os.getenv("PERSONA_LOADING", "eager")
+if PERSONA_LOADING not in ("eager", "lazy"):
+    raise ValueError(
+        f"Unknown PERSONA_LOADING: {PERSONA_LOADING}. Available: eager, lazy"
+    )
+# PERSONA_LOAD_WORKERS: how many personas are loaded concurrently at start.
+PERSONA_LOAD_WORKERS = _env_int("PERSONA_LOAD_WORKERS", 8)
+
+# FORK_MODE: how a new simulation gets the files of the one it forks from.
+# "copy" copies everything. "link" hardlinks the files that never change (past
+# step files, step log segments and the segments of the append-only memory
+# files, which are never written to once shared) and copies the rest.
+FORK_MODE = os.getenv("FORK_MODE", "copy")
+if FORK_MODE not in ("link", "copy"):
+    raise ValueError(f"Unknown FORK_MODE: {FORK_MODE}. Available: link, copy")
+
+# LLM_MAX_IN_FLIGHT: maximum number of OpenAI requests in flight at once,
+# across all models and all personas.
+LLM_MAX_IN_FLIGHT = _env_int("LLM_MAX_IN_FLIGHT", 16)
+# LLM_MODEL_CONCURRENCY: optional per-model caps below LLM_MAX_IN_FLIGHT,
+# e.g. "gpt-5=4,gpt-5-mini=8".
+LLM_MODEL_CONCURRENCY = {
+    model: int(limit)
+    for model, limit in _env_model_map("LLM_MODEL_CONCURRENCY").items()
+}
+
+# LLM_CACHE_MODE: persistent cache of LLM responses, keyed on (model, prompt,
+# params). "off" disables it, "readwrite" serves hits and stores new
+# responses, "replay" serves hits only and fails on a miss (offline re-runs).
+LLM_CACHE_MODE = os.getenv("LLM_CACHE_MODE", "off")
+# LLM_CACHE_PATH: cache file; defaults to environment/frontend_server/cache.
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "")
+# LLM_CACHE_MAX_MB: size above which least recently used responses are evicted.
+LLM_CACHE_MAX_MB = _env_int("LLM_CACHE_MAX_MB", 512)
+
+# EMBEDDING_STORE_PATH: embedding store shared by all personas and
+# simulations; defaults to environment/frontend_server/cache.
+EMBEDDING_STORE_PATH = os.getenv("EMBEDDING_STORE_PATH", "")
+# EMBEDDING_STORE_MEMORY_MB: size of the in-memory layer of the embedding
+# store; least recently used embeddings above it are read from disk again.
+EMBEDDING_STORE_MEMORY_MB = _env_int("EMBEDDING_STORE_MEMORY_MB", 256)
+
+# EMBEDDING_BATCH_SIZE / EMBEDDING_BATCH_TOKENS: limits of one embeddings
+# request; get_embeddings() splits larger batches into several requests.
+EMBEDDING_BATCH_SIZE = _env_int("EMBEDDING_BATCH_SIZE", 2048)
+EMBEDDING_BATCH_TOKENS = _env_int("EMBEDDING_BATCH_TOKENS", 300000)
+
+# LLM_MODEL_RPM / LLM_MODEL_TPM: initial per-model requests and tokens per
+# minute, e.g. "gpt-5=500,gpt-5-mini=5000". Models without a budget are not
+# paced until the API reports their limits in x-ratelimit-* headers.
+LLM_MODEL_RPM = {
+    model: int(limit) for model, limit in _env_model_map("LLM_MODEL_RPM").items()
+}
+LLM_MODEL_TPM = {
+    model: int(limit) for model, limit in _env_model_map("LLM_MODEL_TPM").items()
+}
+# LLM_MAX_RETRIES: retries of a request that hit a rate limit, a connection
+# error or a server error, with exponential backoff and jitter in between.
+LLM_MAX_RETRIES = _env_int("LLM_MAX_RETRIES", 6)
+
+# RETRIEVAL_MODE: "exact" scores every memory node for every focal point;
+# "approximate" first shortlists nodes with an IVF index over the node
+# embeddings (plus the most recent/important nodes) and scores only those.
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "exact")
+if RETRIEVAL_MODE not in ("exact", "approximate"):
+    raise ValueError(
+        f"Unknown RETRIEVAL_MODE: {RETRIEVAL_MODE}. Available: exact, approximate"
+    )
+# RETRIEVAL_ANN_MIN_NODES: approximate mode only kicks in above this many
+# nodes; smaller memories are always scored exactly.
+RETRIEVAL_ANN_MIN_NODES = _env_int("RETRIEVAL_ANN_MIN_NODES", 2000)
+# RETRIEVAL_ANN_PROBES: clusters of the index searched per focal point.
+RETRIEVAL_ANN_PROBES = _env_int("RETRIEVAL_ANN_PROBES", 8)
+# RETRIEVAL_ANN_SHORTLIST: nodes shortlisted by relevance, and again by
+# recency/importance, per focal point.
+RETRIEVAL_ANN_SHORTLIST = _env_int("RETRIEVAL_ANN_SHORTLIST", 256)
+
+# PATH_CACHE_SIZE: number of path searches kept in the least recently used
+# path cache of the maze; 0 disables it.
+PATH_CACHE_SIZE = _env_int("PATH_CACHE_SIZE", 10000)
+# PATH_CACHE_PERSIST: "on" saves the path cache with the simulation
+# (reverie/path_cache.json) and loads it when the simulation is forked or
+# resumed; "off" keeps it in memory only.
+PATH_CACHE_PERSIST = os.getenv("PATH_CACHE_PERSIST", "on")
+if PATH_CACHE_PERSIST not in ("on", "off"):
+    raise ValueError(
+        f"Unknown PATH_CACHE_PERSIST: {PATH_CACHE_PERSIST}. Available: on, off"
+    )
+
+# PATH_MODE: "exact" searches the tile grid for every path; "hierarchical"
+# plans routes between tiles at least PATH_HIERARCHICAL_MIN_DISTANCE apart
+# (Manhattan) over an abstract graph of the maze's regions and the portals
+# between them, which is cheaper on large maps but gives routes that are not
+# always the shortest.
+PATH_MODE = os.getenv("PATH_MODE", "exact")
+if PATH_MODE not in ("exact", "hierarchical"):
+    raise ValueError(f"Unknown PATH_MODE: {PATH_MODE}. Available: exact, hierarchical")
+PATH_HIERARCHICAL_MIN_DISTANCE = _env_int("PATH_HIERARCHICAL_MIN_DISTANCE", 40)
@@ -19,6 +19,11 @@ __all__ = [
     "average",
     "std",
     "copyanything",
+    "linkanything",
+    "segment_path",
+    "segment_paths",
+    "segment_base_name",
+    "is_shared_file",
 ]
 import os
 import numpy
@@ -237,3 +242,89 @@ def copyanything(src, dst):
             shutil.copy(src, dst)
         else:
             raise
+
+
+def linkanything(src, dst, should_link):
+    """
+    Copy over everything in the src folder to dst folder, like copyanything,
+    but hardlink the files that are never modified in place. Where hardlinks
+    are not supported (e.g. across devices), the file is copied instead.
+    ARGS:
+      src: address of the source folder
+      dst: address of the destination folder (must not exist yet)
+      should_link: function of a file's path relative to src that returns
+                   whether the file may be hardlinked
+    RETURNS:
+      None
+    """
+    os.makedirs(dst)
+    for root, dirs, files in os.walk(src):
+        relative_root = os.path.relpath(root, src)
+        for name in dirs:
+            os.makedirs(os.path.join(dst, relative_root, name))
+        for name in files:
+            relative = os.path.normpath(os.path.join(relative_root, name))
+            source = os.path.join(src, relative)
+            target = os.path.join(dst, relative)
+            if should_link(relative):
+                try:
+                    os.link(source, target)
+                    continue
+                except OSError:
+                    pass
+            shutil.copy2(source, target)
+
+
+def segment_path(folder, name, segment):
+    """
+    Path of a segment of an append-only file that is split into segments, so
+    that a forked simulation can keep sharing the segments written before the
+    fork (see linkanything): segment 0 is <name> itself, the later ones are
+    <stem>.1<ext>, <stem>.2<ext>, ...
+    ARGS:
+      folder: address of the folder of the file
+      name: file name of the first segment, e.g. "nodes.jsonl"
+      segment: number of the segment
+    RETURNS:
+      the address of the segment
+    """
+    if segment == 0:
+        return os.path.join(folder, name)
+    stem, ext = os.path.splitext(name)
+    return os.path.join(folder, f"{stem}.{segment}{ext}")
+
+
+def segment_paths(folder, name):
+    """
+    Addresses of the segments of <name> in <folder> that exist, in order.
+    ARGS:
+      folder: address of the folder of the file
+      name: file name of the first segment
+    RETURNS:
+      a list of addresses, empty if there is no first segment
+    """
+    paths = []
+    while os.path.exists(segment_path(folder, name, len(paths))):
+        paths.append(segment_path(folder, name, len(paths)))
+    return paths
+
+
+def segment_base_name(file_name):
+    """
+    The file name of the first segment of the file that <file_name> is a
+    segment of ("nodes.2.jsonl" -> "nodes.jsonl"); other file names are
+    returned as is.
+    """
+    stem, ext = os.path.splitext(file_name)
+    base, _, number = stem.rpartition(".")
+    if base and number.isdigit():
+        return base + ext
+    return file_name
+
+
+def is_shared_file(path):
+    """
+    Whether the file at <path> is hardlinked, i.e. shared with a forked
+    simulation (see linkanything). Shared files must not be modified.
+    """
+    return os.stat(path).st_nlink > 1
@@ -6,11 +6,33 @@ Description: Defines the Maze class, which represents the map of the simulated
 world in a 2-dimensional matrix.
 """
 
+import functools
+import hashlib
 import json
+import os
+import threading
 from typing import TypedDict
 
+import numpy as np
+
+from generative_agents.backend.config import (
+    PATH_CACHE_SIZE,
+    PATH_HIERARCHICAL_MIN_DISTANCE,
+    PATH_MODE,
+)
 from generative_agents.backend.global_methods import read_file_to_list
-from generative_agents.backend.utils import env_matrix
+from generative_agents.backend.path_finder import (
+    PathCache,
+    RegionGraph,
+    descend_distance_field,
+    distance_field,
+    find_path_to_any,
+)
+from generative_agents.backend.utils import collision_block_id, env_matrix, fs_cache
+
+# Folder where the distance fields of the addresses are cached. It is kept out
+# of the maze assets, which may be installed read-only.
+DISTANCE_FIELDS_FOLDER = f"{fs_cache}/distance_fields"
 
 
 class TileDetails(TypedDict):
@@ -194,6 +216,210 @@ class Maze:
                     else:
                         self.address_tiles[add] = {(j, i)}
 
+        # <collision_revision> is incremented whenever <collision_maze>
+        # changes (see set_collision), so that cached paths of an older
+        # revision are no longer used.
+        self.collision_revision = 0
+        # <path_cache> caches the path searches of find_path(_to_any).
+        self.path_cache = PathCache(PATH_CACHE_SIZE)
+        # <_distance_fields> caches the distance field of each address in
+        # <address_tiles>, built on first use (see distance_field).
+        self._distance_fields = {}
+        self._distance_fields_lock = threading.Lock()
+
+    @functools.cached_property
+    def collision_grid(self):
+        """
+        The collision maze as a boolean NumPy array indexed by [y, x] that is
+        True for the tiles personas cannot walk on. Built once, for the path
+        finder.
+        """
+        return np.array(self.collision_maze) == collision_block_id
+
+    @functools.cached_property
+    def collision_digest(self):
+        """A digest of <collision_grid>, to tag what was computed on it."""
+        grid = self.collision_grid
+        digest = hashlib.sha1(f"{grid.shape}".encode() + grid.tobytes())
+        return digest.hexdigest()[:16]
+
+    @functools.cached_property
+    def region_graph(self):
+        """
+        The abstract graph of the maze's arenas, sectors and streets for
+        hierarchical path finding (see path_finder.RegionGraph). Built on
+        first use.
+        """
+        area_ids = {}
+        labels = np.zeros((self.maze_height, self.maze_width), dtype=np.int32)
+        for y, row in enumerate(self.tiles):
+            for x, tile in enumerate(row):
+                if tile["sector"]:
+                    area = (tile["sector"], tile["arena"])
+                    labels[y, x] = area_ids.setdefault(area, len(area_ids) + 1)
+        return RegionGraph(self.collision_grid, labels)
+
+    def set_collision(self, tile, collision):
+        """
+        Makes a tile walkable or not, and moves on to a new collision
+        revision.
+
+        INPUT
+          tile: The (x, y) tile.
+          collision: Whether personas cannot walk on the tile.
+        OUTPUT
+          None
+        """
+        x, y = tile
+        self.collision_maze[y][x] = collision_block_id if collision else "0"
+        self.tiles[y][x]["collision"] = collision
+        with self._distance_fields_lock:
+            self.collision_revision += 1
+            self._distance_fields = {}
+            self.__dict__.pop("collision_grid", None)
+            self.__dict__.pop("collision_digest", None)
+            self.__dict__.pop("region_graph", None)
+
+    def find_path(self, start, end):
+        """
+        A shortest path between two tiles (see path_finder.find_path), from
+        <path_cache> if it was searched before.
+        """
+        return self.find_path_to_any(start, [end])[0]
+
+    def find_path_to_any(self, start, ends):
+        """
+        A shortest path to the closest of several tiles (see
+        path_finder.find_path_to_any), from <path_cache> if it was searched
+        before.
+
+        INPUT
+          start: The (x, y) tile to start from.
+          ends: The (x, y) tiles to go to.
+        OUTPUT
+          (path, end): The path as a list of (x, y) tuples and the element of
+          <ends> it leads to.
+        """
+        mode = self.path_mode()
+        key = PathCache.make_key(start, ends, self.collision_revision, mode)
+        cached = self.path_cache.get(key)
+        if cached is not None:
+            path, chosen = cached
+            return list(path), ends[chosen]
+        start, goals = key[0], key[1]
+        found = None
+        if mode != "exact" and all(
+            abs(start[0] - goal[0]) + abs(start[1] - goal[1])
+            >= PATH_HIERARCHICAL_MIN_DISTANCE
+            for goal in goals
+        ):
+            found = self._find_hierarchical_path(start, goals)
+        if found is None:
+            path, end = find_path_to_any(self.collision_grid, start, list(goals))
+            found = (path, goals.index(end))
+        path, chosen = found
+        self.path_cache.put(key, (tuple(path), chosen))
+        return path, ends[chosen]
+
+    @staticmethod
+    def path_mode():
+        """
+        The path mode searches run in (see PATH_MODE), with the distance
+        from which routes are planned hierarchically, since both change the
+        paths that are found.
+        """
+        if PATH_MODE == "hierarchical":
+            return f"hierarchical:{PATH_HIERARCHICAL_MIN_DISTANCE}"
+        return PATH_MODE
+
+    def _find_hierarchical_path(self, start, goals):
+        """
+        The shortest of the routes <region_graph> plans to each of <goals>
+        (the first of them on ties), as (path, index of the goal), or None if
+        it cannot plan all of them.
+        """
+        best = None
+        for chosen, goal in enumerate(goals):
+            path = self.region_graph.find_path(start, goal)
+            if path is None:
+                return None
+            if best is None or len(path) < len(best[0]):
+                best = (path, chosen)
+        return best
+
+    def save_path_cache(self, path):
+        """
+        Saves <path_cache> for the current collision maze and path mode to
+        <path>.
+        """
+        self.path_cache.save(
+            path, self.collision_revision, self.collision_digest, self.path_mode()
+        )
+
+    def load_path_cache(self, path):
+        """
+        Loads the paths saved to <path>, if searched on this collision maze in
+        the current path mode.
+        """
+        self.path_cache.load(
+            path, self.collision_revision, self.collision_digest, self.path_mode()
+        )
+
+    def distance_field(self, address):
+        """
+        The walking distance from every tile to the closest tile of an
+        address (see path_finder.distance_field). Each field is computed once
+        and saved as a .npy file under DISTANCE_FIELDS_FOLDER, in a subfolder
+        per maze and collision maze so that editing the map does not reuse
+        stale fields.
+
+        INPUT
+          address: A key of <address_tiles>.
+        OUTPUT
+          int32 NumPy array indexed by [y, x]; -1 where the address cannot be
+          reached from.
+        """
+        with self._distance_fields_lock:
+            if address in self._distance_fields:
+                return self._distance_fields[address]
+            address_digest = hashlib.sha1(address.encode()).hexdigest()
+            path = (
+                f"{DISTANCE_FIELDS_FOLDER}/{self.maze_name}/{self.collision_digest}/"
+                f"{address_digest}.npy"
+            )
+            try:
+                field = np.load(path)
+            except (OSError, ValueError):
+                field = distance_field(
+                    self.collision_grid, self.address_tiles[address]
+                )
+                try:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    tmp_path = f"{path}.{os.getpid()}.tmp"
+                    with open(tmp_path, "wb") as f:
+                        np.save(f, field)
+                    os.replace(tmp_path, path)
+                except OSError:
+                    # The cache is an optimization; without a writable cache
+                    # folder the fields are recomputed instead.
+                    pass
+            self._distance_fields[address] = field
+            return field
+
+    def path_to_address(self, tile, address):
+        """
+        A shortest path from a tile to the closest tile of an address, read
+        off the address's distance field.
+
+        INPUT
+          tile: The (x, y) tile to start from.
+          address: A key of <address_tiles>.
+        OUTPUT
+          The path as a list of (x, y) tuples, <tile> included, or None if the
+          address cannot be reached from <tile>.
+        """
+        return descend_distance_field(self.distance_field(address), tuple(tile))
+
     def access_tile(self, tile: tuple[int, int]) -> TileDetails:
         """
         Returns the tiles details dictionary that is stored in self.tiles of the
@@ -6,10 +6,22 @@ Description: Implements various path finding functions for generative agents.
 Some of the functions are defunct.
 """
 
+import heapq
+import json
+import os
+import threading
+from collections import OrderedDict, deque
+
 import numpy as np
 
 __all__ = [
     "print_maze",
+    "find_path",
+    "find_path_to_any",
+    "distance_field",
+    "descend_distance_field",
+    "PathCache",
+    "RegionGraph",
     "path_finder_v1",
     "path_finder_v2",
     "path_finder",
@@ -165,18 +177,532 @@ def path_finder_v2(a, start, end, collision_block_char, verbose=False):
     return the_path
 
 
-def path_finder(maze, start, end, collision_block_char, verbose=False):
-    # EMERGENCY PATCH
-    start = (start[1], start[0])
-    end = (end[1], end[0])
-    # END EMERGENCY PATCH
+# Size of the square blocks the unlabeled tiles of a maze (e.g., the streets)
+# are split into for hierarchical path finding (see RegionGraph).
+REGION_BLOCK_SIZE = 16
+
+
+def _neighbors(x, y, width, height):
+    # Up, left, down, right -- the order the path finders prefer.
+    if y > 0:
+        yield x, y - 1
+    if x > 0:
+        yield x - 1, y
+    if y < height - 1:
+        yield x, y + 1
+    if x < width - 1:
+        yield x + 1, y
+
+
+def find_path(collision_grid, start, end):
+    """
+    Finds a shortest path between two tiles with A* (Manhattan distance as
+    the heuristic, 4-connected moves).
+
+    It returns the same path as path_finder_v2 -- among the shortest paths,
+    the one that walking back from <end> prefers going up, left, down and
+    then right -- but only expands the tiles that can lie on a shortest path
+    instead of rescanning the whole maze once per step, and has no limit on
+    the path length.
+
+    INPUT:
+      collision_grid: Boolean NumPy array indexed by [y, x] that is True for
+                      the tiles that cannot be walked on. (Maze.collision_grid)
+      start: The (x, y) tile to start from.
+      end: The (x, y) tile to go to.
+    OUTPUT:
+      The path as a list of (x, y) tuples, <start> and <end> included. If
+      <end> cannot be reached, it is [<end>].
+    """
+    return find_path_to_any(collision_grid, start, [end])[0]
+
+
+def find_path_to_any(collision_grid, start, ends):
+    """
+    Finds a shortest path from a tile to the closest of several tiles, in a
+    single A* search (see find_path) towards all of them at once.
+
+    Among equally close tiles, the one listed first in <ends> is chosen, and
+    the path is the one find_path returns for it -- so this gives the same
+    result as calling find_path for each tile and keeping the first of the
+    shortest paths to a reachable tile.
+
+    INPUT:
+      collision_grid: Boolean NumPy array indexed by [y, x] that is True for
+                      the tiles that cannot be walked on. (Maze.collision_grid)
+      start: The (x, y) tile to start from.
+      ends: The (x, y) tiles to go to.
+    OUTPUT:
+      (path, end): The path as a list of (x, y) tuples, <start> and the
+      chosen element <end> of <ends> included. If none of <ends> can be
+      reached, it is ([<ends>[0]], <ends>[0]).
+    """
+    height, width = collision_grid.shape
+    blocked = collision_grid.ravel().tolist()
+    start_x, start_y = start
+    goals = {}
+    for order, end in enumerate(ends):
+        goals.setdefault(end[1] * width + end[0], order)
+    goal_tiles = [(end[0], end[1]) for end in ends]
+
+    def estimate_from(x, y):
+        return min(abs(x - end_x) + abs(y - end_y) for end_x, end_y in goal_tiles)
+
+    # <distance> holds the distance from <start> of the tiles reached so far;
+    # it is exact for the tiles in <closed>.
+    distance = {start_y * width + start_x: 0}
+    closed = set()
+    frontier = [(estimate_from(start_x, start_y), 0, start_x, start_y)]
+    length = None
+    # The order in <ends> of the closest tile reached so far.
+    reached = None
+    while frontier:
+        estimate, negative_distance, x, y = heapq.heappop(frontier)
+        # Once a tile of <ends> is reached, we keep going until every tile that
+        # can lie on a shortest path has its exact distance, so that walking
+        # back picks the same path as path_finder_v2 does, and every equally
+        # close tile of <ends> is reached too.
+        if length is not None and estimate > length:
+            break
+        index = y * width + x
+        if index in closed:
+            continue
+        closed.add(index)
+        if index in goals:
+            if length is None:
+                length = -negative_distance
+            if -negative_distance == length and (
+                reached is None or goals[index] < reached
+            ):
+                reached = goals[index]
+            continue
+        next_distance = 1 - negative_distance
+        for next_x, next_y in _neighbors(x, y, width, height):
+            next_index = next_y * width + next_x
+            if blocked[next_index] or next_distance >= distance.get(
+                next_index, next_distance + 1
+            ):
+                continue
+            distance[next_index] = next_distance
+            heapq.heappush(
+                frontier,
+                (
+                    next_distance + estimate_from(next_x, next_y),
+                    -next_distance,
+                    next_x,
+                    next_y,
+                ),
+            )
+
+    if reached is None:
+        return [goal_tiles[0]], ends[0]
+
+    x, y = goal_tiles[reached]
+    the_path = [(x, y)]
+    for k in range(length - 1, -1, -1):
+        x, y = next(
+            (prev_x, prev_y)
+            for prev_x, prev_y in _neighbors(x, y, width, height)
+            if prev_y * width + prev_x in closed
+            and distance[prev_y * width + prev_x] == k
+        )
+        the_path.append((x, y))
+    the_path.reverse()
+    return the_path, ends[reached]
+
+
+def distance_field(collision_grid, sources):
+    """
+    Computes the walking distance from every tile to the closest of a set of
+    tiles, with a breadth-first search from all of them at once.
+
+    INPUT:
+      collision_grid: Boolean NumPy array indexed by [y, x] that is True for
+                      the tiles that cannot be walked on. (Maze.collision_grid)
+      sources: The (x, y) tiles to measure the distance to. Those that cannot
+               be walked on are left out.
+    OUTPUT:
+      An int32 NumPy array indexed by [y, x] with the distance of each tile,
+      or -1 for the tiles from which none of <sources> can be reached.
+    """
+    height, width = collision_grid.shape
+    blocked = collision_grid.ravel().tolist()
+    distance = [-1] * (width * height)
+    queue = deque()
+    for x, y in sources:
+        index = y * width + x
+        if not blocked[index] and distance[index] < 0:
+            distance[index] = 0
+            queue.append((x, y))
+    while queue:
+        x, y = queue.popleft()
+        next_distance = distance[y * width + x] + 1
+        for next_x, next_y in _neighbors(x, y, width, height):
+            next_index = next_y * width + next_x
+            if not blocked[next_index] and distance[next_index] < 0:
+                distance[next_index] = next_distance
+                queue.append((next_x, next_y))
+    return np.array(distance, dtype=np.int32).reshape(height, width)
+
+
+def descend_distance_field(field, start):
+    """
+    Reads a shortest path off a distance field by walking downhill from
+    <start>, one tile closer at each step.
+
+    INPUT:
+      field: A distance field from distance_field.
+      start: The (x, y) tile to start from. As with find_path, it may be a
+             tile that cannot be walked on itself.
+    OUTPUT:
+      The path as a list of (x, y) tuples, <start> and the closest source
+      tile included, or None if no source can be reached from <start>.
+    """
+    height, width = field.shape
+    x, y = start
+    remaining = int(field[y, x])
+    if remaining < 0:
+        # <start> is not walkable (or cut off); step onto its best neighbor.
+        reachable = [
+            int(field[next_y, next_x])
+            for next_x, next_y in _neighbors(x, y, width, height)
+            if field[next_y, next_x] >= 0
+        ]
+        if not reachable:
+            return None
+        remaining = min(reachable) + 1
+    the_path = [(x, y)]
+    for k in range(remaining - 1, -1, -1):
+        x, y = next(
+            (next_x, next_y)
+            for next_x, next_y in _neighbors(x, y, width, height)
+            if field[next_y, next_x] == k
+        )
+        the_path.append((x, y))
+    return the_path
 
-    path = path_finder_v2(maze, start, end, collision_block_char, verbose)
 
-    new_path = [(i[1], i[0]) for i in path]
-    path = new_path
+class PathCache:
+    """
+    Least recently used cache of path searches (see find_path_to_any), keyed
+    on the start tile, the goal tiles, the revision of the collision maze the
+    search ran on and the path mode it ran in (see Maze.path_mode). Personas
+    walk the same routes day after day, so most searches have been done
+    before.
+    """
+
+    def __init__(self, max_entries):
+        # <max_entries> of 0 disables the cache.
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(start, ends, revision, mode):
+        return (
+            (start[0], start[1]),
+            tuple((end[0], end[1]) for end in ends),
+            revision,
+            mode,
+        )
 
-    return path
+    def get(self, key):
+        """
+        The cached (path, index of the chosen goal) of <key>, or None.
+        """
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            if self.max_entries <= 0:
+                return
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        """Counters for the CLI: hits, misses and entries."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+            }
+
+    def save(self, path, revision, collision_digest, mode):
+        """
+        Writes the entries of a revision and path mode to <path>, least
+        recently used first, tagged with the digest of its collision maze and
+        the mode.
+        """
+        with self._lock:
+            entries = [
+                [list(start), [list(end) for end in ends], *value]
+                for (start, ends, *tag), value in self._entries.items()
+                if tag == [revision, mode]
+            ]
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as outfile:
+            json.dump(
+                {"collision": collision_digest, "mode": mode, "entries": entries},
+                outfile,
+            )
+        os.replace(tmp_path, path)
+
+    def load(self, path, revision, collision_digest, mode):
+        """
+        Reads the entries written by save() into <revision>, unless they were
+        searched on a different collision maze or in a different path mode.
+        """
+        try:
+            with open(path) as infile:
+                saved = json.load(infile)
+        except (OSError, ValueError):
+            return
+        if saved.get("collision") != collision_digest or saved.get("mode") != mode:
+            return
+        for start, ends, path_tiles, chosen in saved["entries"]:
+            self.put(
+                self.make_key(start, ends, revision, mode),
+                ([tuple(tile) for tile in path_tiles], chosen),
+            )
+
+
+class RegionGraph:
+    """
+    Abstract graph of a maze for hierarchical path finding (HPA*).
+
+    The walkable tiles are split into regions: the connected parts of each
+    labeled area (e.g., an arena), and of square blocks of REGION_BLOCK_SIZE
+    tiles where there is no label (e.g., the streets). Where two regions
+    touch, each contiguous stretch of their border gets one portal: a pair
+    of adjacent tiles, one on each side. The graph's nodes are the portal
+    tiles, linked by a step across each portal and by the shortest path
+    within a region between each two of its portals, which are computed
+    once when the graph is built.
+
+    A route is then planned over the portals and refined with the
+    precomputed paths, so its cost depends on the number of portals rather
+    than on the number of tiles. The routes are short but not always the
+    shortest: they cross each border at its portal.
+    """
+
+    def __init__(self, collision_grid, labels, block_size=None):
+        """
+        INPUT
+          collision_grid: Boolean NumPy array indexed by [y, x] that is True
+                          for the tiles that cannot be walked on.
+          labels: Integer NumPy array indexed by [y, x] with the area of each
+                  tile, or 0 where it has none.
+          block_size: The size of the blocks unlabeled tiles are grouped in.
+        """
+        block_size = block_size or REGION_BLOCK_SIZE
+        self.height, self.width = collision_grid.shape
+        blocked = collision_grid.ravel().tolist()
+        labels = labels.ravel().tolist()
+
+        def area(index):
+            if labels[index]:
+                return labels[index]
+            y, x = divmod(index, self.width)
+            blocks_per_row = -(-self.width // block_size)
+            return -1 - (y // block_size * blocks_per_row + x // block_size)
+
+        # <region> holds the region of each tile, or -1 if it is blocked.
+        self.region = [-1] * (self.width * self.height)
+        region_count = 0
+        for index in range(self.width * self.height):
+            if blocked[index] or self.region[index] >= 0:
+                continue
+            tile_area = area(index)
+            self.region[index] = region_count
+            queue = deque([index])
+            while queue:
+                y, x = divmod(queue.popleft(), self.width)
+                for next_x, next_y in _neighbors(x, y, self.width, self.height):
+                    next_index = next_y * self.width + next_x
+                    if (
+                        not blocked[next_index]
+                        and self.region[next_index] < 0
+                        and area(next_index) == tile_area
+                    ):
+                        self.region[next_index] = region_count
+                        queue.append(next_index)
+            region_count += 1
+
+        # Borders between regions, by the pair of regions and the line they
+        # run along, as the tile pairs across them.
+        borders = {}
+        for y in range(self.height):
+            for x in range(self.width):
+                here = self.region[y * self.width + x]
+                if here < 0:
+                    continue
+                for next_x, next_y in ((x + 1, y), (x, y + 1)):
+                    if next_x >= self.width or next_y >= self.height:
+                        continue
+                    there = self.region[next_y * self.width + next_x]
+                    if there >= 0 and there != here:
+                        line = (next_x == x, x if next_y == y else y)
+                        borders.setdefault((here, there, line), []).append(
+                            ((x, y), (next_x, next_y))
+                        )
+
+        # <edges> maps each portal tile to its (neighbor, cost) pairs, and
+        # <_paths> holds the path within a region between two of its portals.
+        self.edges = {}
+        self._paths = {}
+        region_portals = {}
+        for crossings in borders.values():
+            for run in self._contiguous_runs(crossings):
+                a, b = run[len(run) // 2]
+                for tile, other in ((a, b), (b, a)):
+                    self.edges.setdefault(tile, []).append((other, 1))
+                    region_portals.setdefault(self.region_of(tile), set()).add(tile)
+        for region, portals in region_portals.items():
+            for portal in portals:
+                paths = self.paths_within_region(portal, portals)
+                for other, path in paths.items():
+                    if other != portal:
+                        self.edges[portal].append((other, len(path) - 1))
+                        self._paths[(portal, other)] = path
+        self.region_portals = region_portals
+
+    @staticmethod
+    def _contiguous_runs(crossings):
+        """Splits the crossings of a border into its contiguous stretches."""
+        crossings.sort()
+        runs = [[crossings[0]]]
+        for crossing in crossings[1:]:
+            (last_x, last_y), _ = runs[-1][-1]
+            (x, y), _ = crossing
+            if abs(x - last_x) + abs(y - last_y) == 1:
+                runs[-1].append(crossing)
+            else:
+                runs.append([crossing])
+        return runs
+
+    def region_of(self, tile):
+        """The region of an (x, y) tile, or -1 if it is blocked."""
+        return self.region[tile[1] * self.width + tile[0]]
+
+    def paths_within_region(self, start, targets):
+        """
+        Shortest paths from a tile to the given tiles of its region, without
+        leaving the region.
+
+        OUTPUT
+          {target: path} for the targets that can be reached, the paths being
+          lists of (x, y) tuples with <start> and the target included.
+        """
+        region = self.region_of(start)
+        targets = set(targets)
+        parent = {start: None}
+        queue = deque([start])
+        found = []
+        while queue and len(found) < len(targets):
+            tile = queue.popleft()
+            if tile in targets:
+                found.append(tile)
+            for next_tile in _neighbors(tile[0], tile[1], self.width, self.height):
+                if next_tile not in parent and self.region_of(next_tile) == region:
+                    parent[next_tile] = tile
+                    queue.append(next_tile)
+        paths = {}
+        for target in found:
+            path = [target]
+            while parent[path[-1]] is not None:
+                path.append(parent[path[-1]])
+            path.reverse()
+            paths[target] = path
+        return paths
+
+    def find_path(self, start, end):
+        """
+        Plans a route between two tiles over the portals and refines it into
+        a path of tiles.
+
+        INPUT
+          start: The (x, y) tile to start from.
+          end: The (x, y) tile to go to.
+        OUTPUT
+          The path as a list of (x, y) tuples, <start> and <end> included, or
+          None if the tiles are in the same region, either is blocked, or no
+          route was found -- those are left to find_path.
+        """
+        start_region, end_region = self.region_of(start), self.region_of(end)
+        if start_region < 0 or end_region < 0 or start_region == end_region:
+            return None
+        first_legs = self.paths_within_region(
+            start, self.region_portals.get(start_region, ())
+        )
+        last_legs = self.paths_within_region(
+            end, self.region_portals.get(end_region, ())
+        )
+        if not first_legs or not last_legs:
+            return None
+
+        def estimate(tile):
+            return abs(tile[0] - end[0]) + abs(tile[1] - end[1])
+
+        # A* over the portals; <end> is reached from the portals of its region
+        # through <last_legs>.
+        cost = {}
+        previous = {}
+        frontier = []
+        for portal, leg in first_legs.items():
+            cost[portal] = len(leg) - 1
+            previous[portal] = None
+            heapq.heappush(frontier, (cost[portal] + estimate(portal), portal))
+        closed = set()
+        best = None
+        while frontier:
+            estimated, tile = heapq.heappop(frontier)
+            if best is not None and estimated >= best[0]:
+                break
+            if tile in closed:
+                continue
+            closed.add(tile)
+            if tile in last_legs:
+                total = cost[tile] + len(last_legs[tile]) - 1
+                if best is None or total < best[0]:
+                    best = (total, tile)
+            for neighbor, step in self.edges[tile]:
+                next_cost = cost[tile] + step
+                if next_cost < cost.get(neighbor, next_cost + 1):
+                    cost[neighbor] = next_cost
+                    previous[neighbor] = tile
+                    heapq.heappush(
+                        frontier, (next_cost + estimate(neighbor), neighbor)
+                    )
+        if best is None:
+            return None
+
+        route = [best[1]]
+        while previous[route[-1]] is not None:
+            route.append(previous[route[-1]])
+        route.reverse()
+        the_path = list(first_legs[route[0]])
+        for tile, next_tile in zip(route, route[1:]):
+            the_path += self._paths.get((tile, next_tile), [tile, next_tile])[1:]
+        the_path += last_legs[route[-1]][-2::-1]
+        return the_path
+
+
+def path_finder(maze, start, end, collision_block_char, verbose=False):
+    collision_grid = np.array(maze) == collision_block_char
+    return find_path(collision_grid, tuple(start), tuple(end))
 
 
 def closest_coordinate(curr_coordinate, target_coordinates):
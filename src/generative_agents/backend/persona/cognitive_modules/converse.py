@@ -10,8 +10,12 @@ import datetime
 from generative_agents.backend.utils import debug
 from generative_agents.backend.persona.prompt_template.gpt_structure import (
     get_embedding,
+    get_embeddings,
+)
+from generative_agents.backend.persona.cognitive_modules.retrieve import (
+    batch_retrieve,
+    new_retrieve,
 )
-from generative_agents.backend.persona.cognitive_modules.retrieve import new_retrieve
 from generative_agents.backend.persona.prompt_template.run_gpt_prompt import (
     run_gpt_generate_iterative_chat_utt,
     run_gpt_generate_safety_score,
@@ -92,7 +96,7 @@ def agent_chat_v1(maze, init_persona, target_persona):
             f"{relationship}",
             f"{p_2.scratch.name} is {p_2.scratch.act_description}",
         ]
-        retrieved = new_retrieve(p_1, focal_points, 25)
+        retrieved = batch_retrieve(p_1, focal_points, 25)
         summarized_idea = generate_agent_chat_summarize_ideas(
             p_1, p_2, retrieved, curr_context
         )
@@ -146,7 +150,7 @@ def agent_chat_v2(maze, init_persona, target_persona):
         ]
         if last_chat:
             focal_points.append(last_chat)
-        retrieved = new_retrieve(init_persona, focal_points, 15)
+        retrieved = batch_retrieve(init_persona, focal_points, 15)
         utt, end = generate_one_utterance(
             maze, init_persona, target_persona, retrieved, curr_chat
         )
@@ -167,7 +171,7 @@ def agent_chat_v2(maze, init_persona, target_persona):
         ]
         if last_chat:
             focal_points.append(last_chat)
-        retrieved = new_retrieve(target_persona, focal_points, 15)
+        retrieved = batch_retrieve(target_persona, focal_points, 15)
         utt, end = generate_one_utterance(
             maze, target_persona, init_persona, retrieved, curr_chat
         )
@@ -247,18 +251,23 @@ def generate_poig_score(persona, event_type, description):
 
 
 def load_history_via_whisper(personas, whispers):
-    for row in whispers:
+    # Generating the inner thoughts first so that they can be embedded in one
+    # request.
+    thoughts = [
+        generate_inner_thought(personas[row[0]], row[1]) for row in whispers
+    ]
+    thought_embeddings = get_embeddings(thoughts)
+
+    for row, thought, thought_embedding in zip(whispers, thoughts, thought_embeddings):
         persona = personas[row[0]]
         whisper = row[1]
 
-        thought = generate_inner_thought(persona, whisper)
-
         created = persona.scratch.curr_time
         expiration = persona.scratch.curr_time + datetime.timedelta(days=30)
         s, p, o = generate_action_event_triple(thought, persona)
         keywords = {s, p, o}
         thought_poignancy = generate_poig_score(persona, "event", whisper)
-        thought_embedding_pair = (thought, get_embedding(thought))
+        thought_embedding_pair = (thought, thought_embedding)
         persona.a_mem.add_thought(
             created,
             expiration,
@@ -7,11 +7,8 @@ Description: This defines the "Act" module for generative agents.
 
 import random
 
-from generative_agents.backend.path_finder import path_finder
-from generative_agents.backend.utils import collision_block_id
 
-
-def execute(persona, maze, personas, plan):
+def execute(persona, maze, personas, plan, persona_tiles=None):
     """
     Given a plan (action's string address), we execute the plan (actually
     outputs the tile coordinate path and the next coordinate for the
@@ -27,6 +24,8 @@ def execute(persona, maze, personas, plan):
          indexing (e.g., [-1]) because the latter address elements may not be
          present in some cases.
          e.g., "dolores double studio:double studio:bedroom 1:bed"
+      persona_tiles: The tiles of all personas at the start of the step, or
+         None to read them from the personas' scratch.
 
     OUTPUT:
       execution
@@ -40,38 +39,33 @@ def execute(persona, maze, personas, plan):
         # <target_tiles> is a list of tile coordinates where the persona may go
         # to execute the current action. The goal is to pick one of them.
         target_tiles = None
+        # <address> is set when the plan is an address in the maze, whose
+        # distance field then gives the path to its closest tile.
+        address = None
 
         if "<persona>" in plan:
             # Executing persona-persona interaction.
-            target_p_tile = personas[
-                plan.split("<persona>")[-1].strip()
-            ].scratch.curr_tile
-            potential_path = path_finder(
-                maze.collision_maze,
-                persona.scratch.curr_tile,
-                target_p_tile,
-                collision_block_id,
+            target_name = plan.split("<persona>")[-1].strip()
+            if persona_tiles is not None:
+                target_p_tile = persona_tiles[target_name]
+            else:
+                target_p_tile = personas[target_name].scratch.curr_tile
+            potential_path = maze.find_path(
+                persona.scratch.curr_tile, target_p_tile
             )
             if len(potential_path) <= 2:
                 target_tiles = [potential_path[0]]
             else:
-                potential_1 = path_finder(
-                    maze.collision_maze,
-                    persona.scratch.curr_tile,
-                    potential_path[len(potential_path) // 2],
-                    collision_block_id,
-                )
-                potential_2 = path_finder(
-                    maze.collision_maze,
+                # Of the two tiles in the middle of the path, we head to the
+                # one closer to us.
+                _, middle_tile = maze.find_path_to_any(
                     persona.scratch.curr_tile,
-                    potential_path[len(potential_path) // 2 + 1],
-                    collision_block_id,
-                )
-                target_tiles = (
-                    [potential_path[len(potential_path) // 2]]
-                    if len(potential_1) <= len(potential_2)
-                    else [potential_path[len(potential_path) // 2 + 1]]
+                    [
+                        potential_path[len(potential_path) // 2],
+                        potential_path[len(potential_path) // 2 + 1],
+                    ],
                 )
+                target_tiles = [middle_tile]
         elif "<waiting>" in plan:
             # Executing interaction where the persona has decided to wait before
             # executing their action.
@@ -87,6 +81,7 @@ def execute(persona, maze, personas, plan):
 
         elif plan in maze.address_tiles:
             target_tiles = maze.address_tiles[plan]
+            address = plan
         # else: plan not in maze.address_tiles - target_tiles remains None
 
         # Guard clause: if no target tiles found, fall back to current position
@@ -98,44 +93,54 @@ def execute(persona, maze, personas, plan):
                 return persona.scratch.curr_tile
             target_tiles = [persona.scratch.curr_tile]
 
-        # There are sometimes more than one tile returned from this (e.g., a tabe
-        # may stretch many coordinates). So, we sample a few here. And from that
-        # random sample, we will take the closest ones.
-        if len(target_tiles) < 4:
-            target_tiles = random.sample(list(target_tiles), len(target_tiles))
-        else:
-            target_tiles = random.sample(list(target_tiles), 4)
-        # If possible, we want personas to occupy different tiles when they are
-        # headed to the same location on the maze. It is ok if they end up on the
-        # same time, but we try to lower that probability.
-        # We take care of that overlap here.
         persona_name_set = set(personas.keys())
-        new_target_tiles = []
-        for i in target_tiles:
-            curr_event_set = maze.access_tile(i)["events"]
-            pass_curr_tile = any(j[0] in persona_name_set for j in curr_event_set)
-            if not pass_curr_tile:
-                new_target_tiles += [i]
-        if len(new_target_tiles) == 0:
-            new_target_tiles = target_tiles
-        target_tiles = new_target_tiles
-
-        # Now that we've identified the target tile, we find the shortest path to
-        # one of the target tiles.
-        curr_tile = persona.scratch.curr_tile
-        closest_target_tile = None
+
+        def is_occupied(tile):
+            curr_event_set = maze.access_tile(tile)["events"]
+            return any(j[0] in persona_name_set for j in curr_event_set)
+
+        # For an address, the path to its closest tile is read off the
+        # address's precomputed distance field. Only if another persona is on
+        # that tile (or the address cannot be reached) do we sample tiles and
+        # search for paths to them. Unlike the closest of a random sample of
+        # its tiles, the closest tile of an address is the same every time,
+        # so personas headed there from the same side end up on one tile
+        # unless it is taken.
         path = None
-        for i in target_tiles:
-            # path_finder takes a collision_mze and the curr_tile coordinate as
-            # an input, and returns a list of coordinate tuples that becomes the
-            # path.
+        if address is not None:
+            path = maze.path_to_address(persona.scratch.curr_tile, address)
+            if path is not None and is_occupied(path[-1]):
+                path = None
+
+        if path is None:
+            # There are sometimes more than one tile returned from this (e.g., a
+            # tabe may stretch many coordinates). So, we sample a few here. And
+            # from that random sample, we will take the closest ones.
+            if len(target_tiles) < 4:
+                target_tiles = random.sample(
+                    list(target_tiles), len(target_tiles)
+                )
+            else:
+                target_tiles = random.sample(list(target_tiles), 4)
+            # If possible, we want personas to occupy different tiles when they
+            # are headed to the same location on the maze. It is ok if they end
+            # up on the same time, but we try to lower that probability.
+            # We take care of that overlap here.
+            new_target_tiles = [i for i in target_tiles if not is_occupied(i)]
+            if len(new_target_tiles) == 0:
+                new_target_tiles = target_tiles
+            target_tiles = new_target_tiles
+
+            # Now that we've identified the target tiles, we find the shortest
+            # path to the closest of them, in one search.
+            # find_path_to_any takes the curr_tile coordinate and the target
+            # tiles as an input, and returns a list of coordinate tuples that
+            # becomes the path, along with the tile it leads to. Routes that
+            # were searched before come from the maze's path cache.
             # e.g., [(0, 1), (1, 1), (1, 2), (1, 3), (1, 4)...]
-            curr_path = path_finder(
-                maze.collision_maze, curr_tile, i, collision_block_id
+            path, _ = maze.find_path_to_any(
+                persona.scratch.curr_tile, list(target_tiles)
             )
-            if not closest_target_tile or len(curr_path) < len(path):
-                closest_target_tile = i
-                path = curr_path
         # Actually setting the <planned_path> and <act_path_set>. We cut the
         # first element in the planned_path because it includes the curr_tile.
         persona.scratch.planned_path = path[1:] if path else []
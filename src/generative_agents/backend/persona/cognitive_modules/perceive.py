@@ -10,6 +10,7 @@ from operator import itemgetter
 
 from generative_agents.backend.persona.prompt_template.gpt_structure import (
     get_embedding,
+    get_embeddings,
 )
 from generative_agents.backend.persona.prompt_template.run_gpt_prompt import (
     run_gpt_prompt_chat_poignancy,
@@ -29,6 +30,60 @@ def generate_poig_score(persona, event_type, description):
         ]
 
 
+def event_description(p_event):
+    """
+    Returns the (subject, predicate, object) triple and the description under
+    which a perceived event is stored, and the text used for its embedding.
+
+    INPUT:
+      p_event: A tile event (subject, predicate, object, description).
+    OUTPUT:
+      The tuple ((s, p, o), desc, desc_embedding_in).
+    """
+    s, p, o, desc = p_event
+    if not p:
+        # If the object is not present, then we default the event to "idle".
+        p = "is"
+        o = "idle"
+        desc = "idle"
+    desc = f"{s.split(':')[-1]} is {desc}"
+    desc_embedding_in = desc
+    if "(" in desc:
+        desc_embedding_in = desc_embedding_in.split("(")[1].split(")")[0].strip()
+    return (s, p, o), desc, desc_embedding_in
+
+
+def prefetch_event_embeddings(persona, perceived_events):
+    """
+    Embeds, in one request, the texts that perceive() is going to need: the
+    descriptions of perceived events that are not among the persona's latest
+    events yet, and the persona's own chat if it is perceived.
+
+    INPUT:
+      persona: The current persona.
+      perceived_events: The tile events the persona perceives in this step.
+    OUTPUT:
+      A dictionary from text to embedding.
+    """
+    latest_events = persona.a_mem.get_summarized_latest_events(
+        persona.scratch.retention
+    )
+    texts = []
+    for p_event in perceived_events:
+        triple, desc, desc_embedding_in = event_description(p_event)
+        if triple in latest_events:
+            continue
+        texts.append(desc_embedding_in)
+        if triple[0] == persona.name and triple[1] == "chat with":
+            texts.append(persona.scratch.act_description)
+    texts = [
+        text
+        for text in dict.fromkeys(texts)
+        if text and text not in persona.a_mem.embeddings
+    ]
+    return dict(zip(texts, get_embeddings(texts)))
+
+
 def perceive(persona, maze):
     """
     Perceives events around the persona and saves it to the memory, both events
@@ -107,19 +162,18 @@ def perceive(persona, maze):
     perceived_events = [
         event for dist, event in percept_events_list[: persona.scratch.att_bandwidth]
     ]
+    # Embedding the new events in one request. Events that only become new
+    # within this loop (because the retention window moves) are embedded one
+    # by one below.
+    embeddings = prefetch_event_embeddings(persona, perceived_events)
+
     # Storing events.
     # <ret_events> is a list of <ConceptNode> instances from the persona's
     # associative memory.
     ret_events = []
     for p_event in perceived_events:
-        s, p, o, desc = p_event
-        if not p:
-            # If the object is not present, then we default the event to "idle".
-            p = "is"
-            o = "idle"
-            desc = "idle"
-        desc = f"{s.split(':')[-1]} is {desc}"
-        p_event = (s, p, o)
+        p_event, desc, desc_embedding_in = event_description(p_event)
+        s, p, o = p_event
 
         # We retrieve the latest persona.scratch.retention events. If there is
         # something new that is happening (that is, p_event not in latest_events),
@@ -139,13 +193,10 @@ def perceive(persona, maze):
             keywords.update([sub, obj])
 
             # Get event embedding
-            desc_embedding_in = desc
-            if "(" in desc:
-                desc_embedding_in = (
-                    desc_embedding_in.split("(")[1].split(")")[0].strip()
-                )
             if desc_embedding_in in persona.a_mem.embeddings:
                 event_embedding = persona.a_mem.embeddings[desc_embedding_in]
+            elif desc_embedding_in in embeddings:
+                event_embedding = embeddings[desc_embedding_in]
             else:
                 event_embedding = get_embedding(desc_embedding_in)
             event_embedding_pair = (desc_embedding_in, event_embedding)
@@ -162,6 +213,8 @@ def perceive(persona, maze):
                     chat_embedding = persona.a_mem.embeddings[
                         persona.scratch.act_description
                     ]
+                elif persona.scratch.act_description in embeddings:
+                    chat_embedding = embeddings[persona.scratch.act_description]
                 else:
                     chat_embedding = get_embedding(persona.scratch.act_description)
                 chat_embedding_pair = (persona.scratch.act_description, chat_embedding)
@@ -5,6 +5,7 @@ File: plan.py
 Description: This defines the "Plan" module for generative agents.
 """
 
+import contextlib
 import datetime
 import math
 import random
@@ -12,9 +13,11 @@ import random
 from generative_agents.backend.utils import debug
 from generative_agents.backend.persona.prompt_template.gpt_structure import (
     ChatGPT_single_request,
+    ChatGPT_single_request_async,
+    gather_requests,
     get_embedding,
 )
-from generative_agents.backend.persona.cognitive_modules.retrieve import new_retrieve
+from generative_agents.backend.persona.cognitive_modules.retrieve import batch_retrieve
 from generative_agents.backend.persona.cognitive_modules.converse import (
     agent_chat_v2,
     generate_convo_summary,
@@ -36,6 +39,41 @@ from generative_agents.backend.persona.prompt_template.run_gpt_prompt import (
     run_gpt_prompt_wake_up_hour,
 )
 
+
+@contextlib.contextmanager
+def _reaction_lock(persona, target_persona):
+    """
+    Holds the cognition lock of the persona a reaction is about, and yields
+    whether <persona> may react to it now. Reactions read and rewrite the
+    scratch (and a chat also the associative memory) of the *other* persona,
+    so when personas move concurrently, the target's move() must not run at
+    the same time.
+
+    <persona>'s own lock is held by its move() throughout. The target's lock
+    is only tried, never waited for, so two personas reacting to each other
+    cannot deadlock: if the target is in the middle of its own move(), this
+    yields False and the reaction is deferred to <persona>'s next step (see
+    Persona.deferred_focus). Moving one persona at a time, it always yields
+    True.
+
+    INPUT
+      persona: The <Persona> that reacts, from within its move().
+      target_persona: The <Persona> it reacts to.
+    OUTPUT
+      Whether the reaction can go ahead.
+    """
+    if target_persona is persona:
+        yield True
+        return
+    if not target_persona.cognition_lock.acquire(blocking=False):
+        yield False
+        return
+    try:
+        yield True
+    finally:
+        target_persona.cognition_lock.release()
+
+
 ##############################################################################
 # CHAPTER 2: Generate
 ##############################################################################
@@ -462,7 +500,7 @@ def revise_identity(persona):
         f"{p_name}'s plan for {persona.scratch.get_str_curr_date_str()}.",
         f"Important recent events for {p_name}'s life.",
     ]
-    retrieved = new_retrieve(persona, focal_points)
+    retrieved = batch_retrieve(persona, focal_points)
 
     statements = "[Statements]\n"
     for key, val in retrieved.items():
@@ -477,13 +515,18 @@ def revise_identity(persona):
     plan_prompt += f" *{persona.scratch.curr_time.strftime('%A %B %d')}*? "
     plan_prompt += "If there is any scheduling information, be as specific as possible (include date, time, and location if stated in the statement)\n\n"
     plan_prompt += f"Write the response from {p_name}'s perspective."
-    plan_note = ChatGPT_single_request(plan_prompt)
-    # print (plan_note)
 
     thought_prompt = statements + "\n"
     thought_prompt += f"Given the statements above, how might we summarize {p_name}'s feelings about their days up to now?\n\n"
     thought_prompt += f"Write the response from {p_name}'s perspective."
-    thought_note = ChatGPT_single_request(thought_prompt)
+
+    # The plan note and the thought note are independent, so we request them
+    # concurrently.
+    plan_note, thought_note = gather_requests(
+        ChatGPT_single_request_async(plan_prompt),
+        ChatGPT_single_request_async(thought_prompt),
+    )
+    # print (plan_note)
     # print (thought_note)
 
     currently_prompt = f"{p_name}'s status from {(persona.scratch.curr_time - datetime.timedelta(days=1)).strftime('%A %B %d')}:\n"
@@ -1070,6 +1113,11 @@ def plan(persona, maze, personas, new_day, retrieved):
     focused_event = False
     if retrieved.keys():
         focused_event = _choose_retrieved(persona, retrieved)
+    # A reaction deferred at the last step because its target was busy moving
+    # is taken up again, unless there is something new to focus on.
+    if not focused_event and persona.deferred_focus:
+        focused_event = persona.deferred_focus
+    persona.deferred_focus = None
 
     # Step 2: Once we choose an event, we need to determine whether the
     #         persona will take any actions for the perceived event. There are
@@ -1078,12 +1126,16 @@ def plan(persona, maze, personas, new_day, retrieved):
     #         b) "react"
     #         c) False
     if focused_event:
-        if reaction_mode := _should_react(persona, focused_event, personas):
-            # If we do want to chat, then we generate conversation
-            if reaction_mode[:9] == "chat with":
-                _chat_react(maze, persona, focused_event, reaction_mode, personas)
-            elif reaction_mode[:4] == "wait":
-                _wait_react(persona, reaction_mode)
+        target_persona = personas.get(focused_event["curr_event"].subject, persona)
+        with _reaction_lock(persona, target_persona) as can_react:
+            if not can_react:
+                persona.deferred_focus = focused_event
+            elif reaction_mode := _should_react(persona, focused_event, personas):
+                # If we do want to chat, then we generate conversation
+                if reaction_mode[:9] == "chat with":
+                    _chat_react(maze, persona, focused_event, reaction_mode, personas)
+                elif reaction_mode[:4] == "wait":
+                    _wait_react(persona, reaction_mode)
     # Step 3: Chat-related state clean up.
     # If the persona is not chatting with anyone, we clean up any of the
     # chat-related states here.
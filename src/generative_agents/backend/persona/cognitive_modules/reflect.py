@@ -10,8 +10,9 @@ import datetime
 from generative_agents.backend.utils import debug
 from generative_agents.backend.persona.prompt_template.gpt_structure import (
     get_embedding,
+    get_embeddings,
 )
-from generative_agents.backend.persona.cognitive_modules.retrieve import new_retrieve
+from generative_agents.backend.persona.cognitive_modules.retrieve import batch_retrieve
 from generative_agents.backend.persona.prompt_template.run_gpt_prompt import (
     run_gpt_prompt_chat_poignancy,
     run_gpt_prompt_event_poignancy,
@@ -118,32 +119,35 @@ def run_reflect(persona):
     focal_points = generate_focal_points(persona, 3)
     # Retrieve the relevant Nodes object for each of the focal points.
     # <retrieved> has keys of focal points, and values of the associated Nodes.
-    retrieved = new_retrieve(persona, focal_points)
+    retrieved = batch_retrieve(persona, focal_points)
 
-    # For each of the focal points, generate thoughts and save it in the
-    # agent's memory.
+    # For each of the focal points, generate thoughts. All thoughts are then
+    # embedded in one request and saved in the agent's memory.
+    thoughts = []
     for focal_pt, nodes in retrieved.items():
-        thoughts = generate_insights_and_evidence(persona, nodes, 5)
-        for thought, evidence in thoughts.items():
-            created = persona.scratch.curr_time
-            expiration = persona.scratch.curr_time + datetime.timedelta(days=30)
-            s, p, o = generate_action_event_triple(thought, persona)
-            keywords = {s, p, o}
-            thought_poignancy = generate_poig_score(persona, "thought", thought)
-            thought_embedding_pair = (thought, get_embedding(thought))
-
-            persona.a_mem.add_thought(
-                created,
-                expiration,
-                s,
-                p,
-                o,
-                thought,
-                keywords,
-                thought_poignancy,
-                thought_embedding_pair,
-                evidence,
-            )
+        thoughts += generate_insights_and_evidence(persona, nodes, 5).items()
+    thought_embeddings = get_embeddings([thought for thought, evidence in thoughts])
+
+    for (thought, evidence), thought_embedding in zip(thoughts, thought_embeddings):
+        created = persona.scratch.curr_time
+        expiration = persona.scratch.curr_time + datetime.timedelta(days=30)
+        s, p, o = generate_action_event_triple(thought, persona)
+        keywords = {s, p, o}
+        thought_poignancy = generate_poig_score(persona, "thought", thought)
+        thought_embedding_pair = (thought, thought_embedding)
+
+        persona.a_mem.add_thought(
+            created,
+            expiration,
+            s,
+            p,
+            o,
+            thought,
+            keywords,
+            thought_poignancy,
+            thought_embedding_pair,
+            evidence,
+        )
 
 
 def reflection_trigger(persona):
@@ -5,11 +5,16 @@ File: retrieve.py
 Description: This defines the "Retrieve" module for generative agents.
 """
 
+import numpy as np
 from numpy import dot
 from numpy.linalg import norm
 
+from generative_agents.backend.config import (
+    RETRIEVAL_ANN_MIN_NODES,
+    RETRIEVAL_ANN_SHORTLIST,
+)
 from generative_agents.backend.persona.prompt_template.gpt_structure import (
-    get_embedding,
+    get_embeddings,
 )
 
 
@@ -67,122 +72,130 @@ def cos_sim(a, b):
     return dot(a, b) / (norm(a) * norm(b))
 
 
-def normalize_dict_floats(d, target_min, target_max):
+def normalize_array(values, target_min, target_max):
+    """
+    Scales <values> to the target range, keeping their relative proportions,
+    or sets them all to the middle of the range if they are equal.
     """
-    This function normalizes the float values of a given dictionary 'd' between
-    a target minimum and maximum value. The normalization is done by scaling the
-    values to the target range while maintaining the same relative proportions
-    between the original values.
+    return scale_array(values, values.min(), values.max(), target_min, target_max)
 
-    INPUT:
-      d: Dictionary. The input dictionary whose float values need to be
-         normalized.
-      target_min: Integer or float. The minimum value to which the original
-                  values should be scaled.
-      target_max: Integer or float. The maximum value to which the original
-                  values should be scaled.
-    OUTPUT:
-      d: A new dictionary with the same keys as the input but with the float
-         values normalized between the target_min and target_max.
 
-    Example input:
-      d = {'a':1.2,'b':3.4,'c':5.6,'d':7.8}
-      target_min = -5
-      target_max = 5
-    """
-    min_val = min(d.values())
-    max_val = max(d.values())
+def scale_array(values, min_val, max_val, target_min, target_max):
+    """normalize_array with a known (e.g. running) min and max of <values>."""
     range_val = max_val - min_val
-
     if range_val == 0:
-        for key, val in d.items():
-            d[key] = (target_max - target_min) / 2
-    else:
-        for key, val in d.items():
-            d[key] = (val - min_val) * (
-                target_max - target_min
-            ) / range_val + target_min
-    return d
+        return np.full(len(values), (target_max - target_min) / 2)
+    return (values - min_val) * (target_max - target_min) / range_val + target_min
 
 
-def top_highest_x_values(d, x):
+def top_k_indices(scores, k):
     """
-    This function takes a dictionary 'd' and an integer 'x' as input, and
-    returns a new dictionary containing the top 'x' key-value pairs from the
-    input dictionary 'd' with the highest values.
-
-    INPUT:
-      d: Dictionary. The input dictionary from which the top 'x' key-value pairs
-         with the highest values are to be extracted.
-      x: Integer. The number of top key-value pairs with the highest values to
-         be extracted from the input dictionary.
-    OUTPUT:
-      A new dictionary containing the top 'x' key-value pairs from the input
-      dictionary 'd' with the highest values.
-
-    Example input:
-      d = {'a':1.2,'b':3.4,'c':5.6,'d':7.8}
-      x = 3
+    Indices of the <k> highest scores, highest first. Equal scores keep their
+    order in <scores>, like a stable sort.
     """
-    return dict(sorted(d.items(), key=lambda item: item[1], reverse=True)[:x])
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=int)
+    if k < len(scores):
+        threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+        above = np.flatnonzero(scores > threshold)
+        at = np.flatnonzero(scores == threshold)[: k - len(above)]
+        candidates = np.concatenate([above, at])
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.lexsort((candidates, -scores[candidates]))]
 
 
-def extract_recency(persona, nodes):
+def relevance_shortlists(a_mem, rows, focal_matrix):
     """
-    Gets the current Persona object and a list of nodes that are in a
-    chronological order, and outputs a dictionary that has the recency score
-    calculated.
+    Approximate retrieval: uses the memory's ANN index to find, for each focal
+    point, the nodes that are most relevant to it.
 
     INPUT:
-      persona: Current persona whose memory we are retrieving.
-      nodes: A list of Node object in a chronological order.
+      a_mem: The associative memory (with an ann_index).
+      rows: The rows of the nodes considered by new_retrieve.
+      focal_matrix: Unit-length focal point embeddings, one per row.
     OUTPUT:
-      recency_out: A dictionary whose keys are the node.node_id and whose values
-                   are the float that represents the recency score.
+      A list with, per focal point, the tuple (near, floor): the rows of the
+      shortlisted nodes, and an estimate of the lowest relevance of any node
+      (used to normalize relevance).
     """
-    recency_vals = [persona.scratch.recency_decay**i for i in range(1, len(nodes) + 1)]
-
-    return {node.node_id: recency_vals[count] for count, node in enumerate(nodes)}
-
-
-def extract_importance(persona, nodes):
+    embedding_matrix = a_mem.embedding_matrix()
+    considered = np.zeros(len(embedding_matrix), bool)
+    considered[rows] = True
+
+    shortlists = []
+    results = a_mem.ann_index.search(
+        embedding_matrix, focal_matrix, RETRIEVAL_ANN_SHORTLIST
+    )
+    for (near, far), query in zip(results, focal_matrix):
+        # The index also holds chats and idle nodes, which are dropped here.
+        near = near[considered[near]]
+        floor = (embedding_matrix[far] @ query).min() if len(far) else np.inf
+        shortlists.append((near, floor))
+    return shortlists
+
+
+# Note to self: test out different weights. [1, 1, 1] tends to work
+# decently, but in the future, these weights should likely be learned,
+# perhaps through an RL-like process.
+# gw = [1, 1, 1]
+# gw = [1, 2, 1]
+gw = [0.5, 3, 2]
+
+
+def focal_embedding_matrix(focal_points):
+    """The unit-length embeddings of the focal points, one per row."""
+    focal_matrix = np.asarray(get_embeddings(focal_points), dtype=np.float32)
+    focal_norms = np.linalg.norm(focal_matrix, axis=1, keepdims=True)
+    focal_matrix /= np.where(focal_norms == 0, 1, focal_norms)
+    return focal_matrix
+
+
+def recency_importance_scores(persona, rows):
     """
-    Gets the current Persona object and a list of nodes that are in a
-    chronological order, and outputs a dictionary that has the importance score
-    calculated.
-
-    INPUT:
-      persona: Current persona whose memory we are retrieving.
-      nodes: A list of Node object in a chronological order.
-    OUTPUT:
-      importance_out: A dictionary whose keys are the node.node_id and whose
-                      values are the float that represents the importance score.
+    The weighted recency plus importance of the nodes in <rows> (which are in
+    the order of a_mem.recency_order()).
     """
-    return {node.node_id: node.poignancy for node in nodes}
-
-
-def extract_relevance(persona, nodes, focal_pt):
+    a_mem = persona.a_mem
+    recency = normalize_array(
+        a_mem.recency_powers(persona.scratch.recency_decay, len(rows)), 0, 1
+    )
+    min_poignancy, max_poignancy = a_mem.importance_range()
+    importance = scale_array(
+        a_mem.poignancy_array()[rows], min_poignancy, max_poignancy, 0, 1
+    )
+    recency_out = persona.scratch.recency_w * recency * gw[0]
+    importance_out = persona.scratch.importance_w * importance * gw[2]
+    return recency_out, importance_out
+
+
+def shortlist_scores(persona, rows, base_out, near, floor, focal_vector):
     """
-    Gets the current Persona object, a list of nodes that are in a
-    chronological order, and the focal_pt string and outputs a dictionary
-    that has the relevance score calculated.
+    Approximate mode: the final scores of the nodes in <rows>, with relevance
+    computed only for the shortlist (the ANN hits <near> plus the nodes with
+    the best recency and importance <base_out>). The other nodes score -inf.
 
-    INPUT:
-      persona: Current persona whose memory we are retrieving.
-      nodes: A list of Node object in a chronological order.
-      focal_pt: A string describing the current thought of revent of focus.
     OUTPUT:
-      relevance_out: A dictionary whose keys are the node.node_id and whose values
-                   are the float that represents the relevance score.
+      The tuple (master_out, shortlist_size).
     """
-    focal_embedding = get_embedding(focal_pt)
-
-    relevance_out = {}
-    for node in nodes:
-        node_embedding = persona.a_mem.embeddings[node.embedding_key]
-        relevance_out[node.node_id] = cos_sim(node_embedding, focal_embedding)
-
-    return relevance_out
+    embedding_matrix = persona.a_mem.embedding_matrix()
+    position = np.empty(len(embedding_matrix), dtype=int)
+    position[rows] = np.arange(len(rows))
+    shortlist = np.union1d(
+        position[near], top_k_indices(base_out, RETRIEVAL_ANN_SHORTLIST)
+    )
+    relevance_out = (embedding_matrix[rows[shortlist]] @ focal_vector).astype(
+        np.float64
+    )
+    min_val = min(relevance_out.min(), floor)
+    range_val = relevance_out.max() - min_val
+    relevance_out = (relevance_out - min_val) / range_val if range_val > 0 else 0.5
+    master_out = np.full(len(rows), -np.inf)
+    master_out[shortlist] = (
+        base_out[shortlist] + persona.scratch.relevance_w * relevance_out * gw[1]
+    )
+    return master_out, len(shortlist)
 
 
 def new_retrieve(persona, focal_points, n_count=30):
@@ -191,6 +204,21 @@ def new_retrieve(persona, focal_points, n_count=30):
     thoughts for which we are retrieving), we retrieve a set of nodes for each
     of the focal points and return a dictionary.
 
+    The focal points are retrieved one after the other: the nodes retrieved
+    for a focal point count as accessed (recency) for the next ones. See
+    batch_retrieve for retrieving all of them against the same state.
+
+    Scores are computed over the columnar arrays of the associative memory:
+    relevance for all focal points with one matrix multiply, then recency and
+    the top-k selection per focal point. The memory keeps its nodes ordered
+    by last access (updated as the previous focal points access nodes), the
+    decay powers and the range of importance, so no step re-sorts the nodes.
+
+    In approximate mode (RETRIEVAL_MODE, for memories of at least
+    RETRIEVAL_ANN_MIN_NODES nodes) relevance is only computed for a shortlist:
+    the nodes the ANN index finds most relevant, plus the nodes with the best
+    recency and importance. All other nodes are left out of the ranking.
+
     INPUT:
       persona: The current persona object whose memory we are retrieving.
       focal_points: A list of focal points (string description of the events or
@@ -204,57 +232,127 @@ def new_retrieve(persona, focal_points, n_count=30):
       persona = <persona> object
       focal_points = ["How are you?", "Jane is swimming in the pond"]
     """
+    a_mem = persona.a_mem
     # <retrieved> is the main dictionary that we are returning
     retrieved = {}
-    for focal_pt in focal_points:
-        # Getting all nodes from the agent's memory (both thoughts and events) and
-        # sorting them by the datetime of creation.
-        # You could also imagine getting the raw conversation, but for now.
-        nodes = [
-            [i.last_accessed, i]
-            for i in persona.a_mem.seq_event + persona.a_mem.seq_thought
-            if "idle" not in i.embedding_key
-        ]
-        nodes = sorted(nodes, key=lambda x: x[0])
-        nodes = [i for created, i in nodes]
-
-        # Calculating the component dictionaries and normalizing them.
-        recency_out = extract_recency(persona, nodes)
-        recency_out = normalize_dict_floats(recency_out, 0, 1)
-        importance_out = extract_importance(persona, nodes)
-        importance_out = normalize_dict_floats(importance_out, 0, 1)
-        relevance_out = extract_relevance(persona, nodes, focal_pt)
-        relevance_out = normalize_dict_floats(relevance_out, 0, 1)
+    # Getting all nodes from the agent's memory (both thoughts and events),
+    # least recently accessed first.
+    rows = a_mem.recency_order()
+    if len(rows) == 0 or not focal_points:
+        return {focal_pt: [] for focal_pt in focal_points}
+
+    focal_matrix = focal_embedding_matrix(focal_points)
+    embedding_matrix = a_mem.embedding_matrix()
+    shortlists = None
+    if a_mem.ann_index is not None and len(rows) >= RETRIEVAL_ANN_MIN_NODES:
+        shortlists = relevance_shortlists(a_mem, rows, focal_matrix)
+    else:
+        # Relevance of every node to every focal point in one matrix multiply.
+        # Both sides are unit length, so the dot product is the cosine
+        # similarity. Indexed by row, as the order changes between focal
+        # points.
+        relevance = np.empty((len(embedding_matrix), len(focal_points)), np.float32)
+        relevance[rows] = embedding_matrix[rows] @ focal_matrix.T
+
+    for count, focal_pt in enumerate(focal_points):
+        # All scores are in the order of <rows>, the nodes sorted by the time
+        # they were last accessed.
+        rows = a_mem.recency_order()
+        recency_out, importance_out = recency_importance_scores(persona, rows)
 
         # Computing the final scores that combines the component values.
-        # Note to self: test out different weights. [1, 1, 1] tends to work
-        # decently, but in the future, these weights should likely be learned,
-        # perhaps through an RL-like process.
-        # gw = [1, 1, 1]
-        # gw = [1, 2, 1]
-        gw = [0.5, 3, 2]
-        master_out = {}
-        for key in recency_out.keys():
-            master_out[key] = (
-                persona.scratch.recency_w * recency_out[key] * gw[0]
-                + persona.scratch.relevance_w * relevance_out[key] * gw[1]
-                + persona.scratch.importance_w * importance_out[key] * gw[2]
+        k = n_count
+        if shortlists is None:
+            relevance_out = normalize_array(
+                relevance[rows, count].astype(np.float64), 0, 1
+            )
+            master_out = (
+                recency_out
+                + persona.scratch.relevance_w * relevance_out * gw[1]
+                + importance_out
+            )
+        else:
+            near, floor = shortlists[count]
+            master_out, shortlist_size = shortlist_scores(
+                persona,
+                rows,
+                recency_out + importance_out,
+                near,
+                floor,
+                focal_matrix[count],
             )
+            k = min(n_count, shortlist_size)
 
-        master_out = top_highest_x_values(master_out, len(master_out.keys()))
+        # Extracting the highest x values, ties broken by the sorted order.
+        top = top_k_indices(master_out, k)
+        master_nodes = [a_mem.node_at(row) for row in rows[top]]
+        a_mem.mark_accessed(master_nodes, persona.scratch.curr_time)
 
-        # Extracting the highest x values.
-        # <master_out> has the key of node.id and value of float. Once we get the
-        # highest x values, we want to translate the node.id into nodes and return
-        # the list of nodes.
-        master_out = top_highest_x_values(master_out, n_count)
-        master_nodes = [
-            persona.a_mem.id_to_node[key] for key in list(master_out.keys())
-        ]
+        retrieved[focal_pt] = master_nodes
 
-        for n in master_nodes:
-            n.last_accessed = persona.scratch.curr_time
+    return retrieved
 
-        retrieved[focal_pt] = master_nodes
+
+def batch_retrieve(persona, focal_points, n_count=30):
+    """
+    Retrieves the top <n_count> nodes for each of the focal points, like
+    new_retrieve, but against one snapshot of the memory: the candidate set,
+    recency and importance are computed once, relevance is a single
+    (focal points x nodes) matrix product, and the retrieved nodes are only
+    marked accessed at the end. Focal points therefore do not influence each
+    other's recency, as they do in new_retrieve.
+
+    INPUT:
+      persona: The current persona object whose memory we are retrieving.
+      focal_points: A list of focal points (string description of the events or
+                    thoughts that is the focus of current retrieval).
+      n_count: The number of nodes to retrieve per focal point.
+    OUTPUT:
+      retrieved: A dictionary whose keys are a string focal point, and whose
+                 values are a list of Node object in the agent's associative
+                 memory.
+    """
+    a_mem = persona.a_mem
+    rows = a_mem.recency_order()
+    if len(rows) == 0 or not focal_points:
+        return {focal_pt: [] for focal_pt in focal_points}
+
+    focal_matrix = focal_embedding_matrix(focal_points)
+    recency_out, importance_out = recency_importance_scores(persona, rows)
+    base_out = recency_out + importance_out
+
+    if a_mem.ann_index is not None and len(rows) >= RETRIEVAL_ANN_MIN_NODES:
+        scored = []
+        shortlists = relevance_shortlists(a_mem, rows, focal_matrix)
+        for (near, floor), focal_vector in zip(shortlists, focal_matrix):
+            scored.append(
+                shortlist_scores(persona, rows, base_out, near, floor, focal_vector)
+            )
+    else:
+        relevance = (focal_matrix @ a_mem.embedding_matrix()[rows].T).astype(
+            np.float64
+        )
+        min_val = relevance.min(axis=1, keepdims=True)
+        range_val = relevance.max(axis=1, keepdims=True) - min_val
+        # Per focal point, as in normalize_array.
+        relevance_out = np.where(
+            range_val > 0,
+            (relevance - min_val) / np.where(range_val > 0, range_val, 1),
+            0.5,
+        )
+        master_out = (
+            recency_out
+            + persona.scratch.relevance_w * relevance_out * gw[1]
+            + importance_out
+        )
+        scored = [(scores, len(rows)) for scores in master_out]
+
+    retrieved = {}
+    accessed = []
+    for focal_pt, (master_out, size) in zip(focal_points, scored):
+        top = top_k_indices(master_out, min(n_count, size))
+        retrieved[focal_pt] = [a_mem.node_at(row) for row in rows[top]]
+        accessed += retrieved[focal_pt]
+    a_mem.mark_accessed(accessed, persona.scratch.curr_time)
 
     return retrieved
@@ -0,0 +1,97 @@
+"""
+File: ann_index.py
+Description: Approximate nearest neighbour index over the node embeddings of
+an associative memory. This is an inverted file (IVF) index: the unit-length
+embeddings are clustered with spherical k-means, and a query only scores the
+members of the <n_probe> clusters whose centroids are closest to it.
+
+The index is maintained incrementally. New rows are assigned to their nearest
+centroid as they are added, and the clustering is (re)trained lazily at search
+time, once the memory has grown to twice the size it was trained on.
+"""
+
+import numpy as np
+
+
+class IVFIndex:
+    def __init__(self, n_probe=8, kmeans_iters=8, seed=0):
+        # <n_probe> is the number of clusters scored per query.
+        self.n_probe = n_probe
+        self.kmeans_iters = kmeans_iters
+        self.rng = np.random.default_rng(seed)
+
+        # <centroids> is None until the index is trained. <lists> holds the
+        # rows of each cluster.
+        self.centroids = None
+        self.lists = []
+        self.trained_size = 0
+        self.size = 0
+
+    def add(self, matrix, row):
+        """
+        Registers row <row> of the embedding matrix.
+
+        INPUT:
+          matrix: The (unit-length) embedding matrix, including <row>.
+          row: The index of the new row.
+        """
+        self.size = max(self.size, row + 1)
+        if self.centroids is not None:
+            cluster = int(np.argmax(self.centroids @ matrix[row]))
+            self.lists[cluster].append(row)
+
+    def train(self, matrix):
+        """Clusters the first <size> rows of the matrix with spherical k-means."""
+        data = matrix[: self.size]
+        n_lists = max(1, int(np.sqrt(len(data))))
+        # Training on a sample keeps the cost bounded for large memories.
+        sample_size = min(len(data), 32 * n_lists)
+        sample = data[self.rng.choice(len(data), sample_size, replace=False)]
+        centroids = sample[self.rng.choice(sample_size, n_lists, replace=False)]
+        for _ in range(self.kmeans_iters):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # Empty clusters keep their previous centroid.
+            centroids = np.where(norms > 0, sums / np.where(norms > 0, norms, 1), centroids)
+
+        assignment = np.argmax(data @ centroids.T, axis=1)
+        self.centroids = centroids
+        self.lists = [[] for _ in range(n_lists)]
+        for row, cluster in enumerate(assignment.tolist()):
+            self.lists[cluster].append(row)
+        self.trained_size = len(data)
+
+    def search(self, matrix, queries, k):
+        """
+        Finds approximately the <k> rows most similar to each query.
+
+        INPUT:
+          matrix: The (unit-length) embedding matrix.
+          queries: Unit-length query vectors, one per row.
+          k: Number of rows to return per query.
+        OUTPUT:
+          A list with, per query, the tuple (rows, far_rows): the approximate
+          top-k rows (highest similarity first), and the members of the
+          cluster farthest from the query, which callers can use to estimate
+          the lowest similarity in the memory.
+        """
+        if self.centroids is None or self.size >= 2 * self.trained_size:
+            self.train(matrix)
+
+        results = []
+        centroid_scores = queries @ self.centroids.T
+        for query, scores in zip(queries, centroid_scores):
+            n_probe = min(self.n_probe, len(self.lists))
+            probed = np.argpartition(-scores, n_probe - 1)[:n_probe]
+            rows = np.array(
+                [row for cluster in probed for row in self.lists[cluster]], dtype=int
+            )
+            similarity = matrix[rows] @ query
+            if len(rows) > k:
+                top = np.argpartition(-similarity, k - 1)[:k]
+                rows, similarity = rows[top], similarity[top]
+            far_rows = np.array(self.lists[int(np.argmin(scores))], dtype=int)
+            results.append((rows[np.argsort(-similarity)], far_rows))
+        return results
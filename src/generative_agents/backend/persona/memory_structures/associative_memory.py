@@ -6,51 +6,273 @@ Description: Defines the core long-term memory module for generative agents.
 
 Note (May 1, 2023) -- this class is the Memory Stream module in the generative
 agents paper.
+
+The nodes are persisted as an append-only log (nodes.jsonl, one node per line
+in creation order): save() only writes the nodes created since the last save,
+and compaction rewrites the log (and the embedding table) in full. A legacy
+nodes.json is still loaded, and converted to the log on the next save.
+
+In memory, the scalar fields of the nodes (times, poignancy, type, depth) are
+kept in columnar numpy arrays, and a ConceptNode is a slotted view of its row
+that only holds the node's (interned) strings.
 """
 
+import bisect
 import datetime
 import json
+import os
+import sys
+import threading
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+
+from generative_agents.backend.config import RETRIEVAL_ANN_PROBES, RETRIEVAL_MODE
+from generative_agents.backend.global_methods import (
+    is_shared_file,
+    segment_path,
+    segment_paths,
+)
+from generative_agents.backend.persona.memory_structures.ann_index import IVFIndex
+from generative_agents.backend.persona.memory_structures.embedding_table import (
+    EmbeddingTable,
+)
+
+# Datetimes are stored in the numpy arrays as int64 microseconds since
+# <_EPOCH>; <_NO_TIME> stands for None (a node without expiration).
+_EPOCH = datetime.datetime(1970, 1, 1)
+_MICROSECOND = datetime.timedelta(microseconds=1)
+_NO_TIME = np.iinfo(np.int64).min
+
+NODE_TYPES = ("event", "thought", "chat")
+
+
+def _micros(dt):
+    if dt is None:
+        return _NO_TIME
+    return (dt - _EPOCH) // _MICROSECOND
+
+
+def _datetime(micros):
+    if micros == _NO_TIME:
+        return None
+    return _EPOCH + datetime.timedelta(microseconds=int(micros))
+
+
+def _intern(value):
+    # Subjects, predicates, objects and keywords repeat across thousands of
+    # nodes; interning keeps one copy of each.
+    if type(value) is str:
+        return sys.intern(value)
+    return value
+
+
+NODE_LOG_FILE = "nodes.jsonl"
+LEGACY_NODES_FILE = "nodes.json"
+
+
+def read_node_log(path):
+    """
+    Reads the node log.
+
+    INPUT:
+      path: Path of nodes.jsonl.
+    OUTPUT:
+      The tuple (records, valid_bytes): the node records in creation order,
+      and the length of the log up to the last complete line (a save that
+      was interrupted can leave a partial line behind).
+    """
+    records = []
+    valid_bytes = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            records.append(json.loads(line))
+            valid_bytes += len(line)
+    return records, valid_bytes
+
+
+def read_node_segments(folder):
+    """
+    Reads the node log of an associative memory folder. The log is split
+    into segments (nodes.jsonl, nodes.1.jsonl, ...; see segment_path) so that
+    a forked simulation keeps sharing the nodes saved before the fork.
+
+    INPUT:
+      folder: The associative memory folder.
+    OUTPUT:
+      The tuple (records, segment, valid_bytes): the node records in
+      creation order, the number of the last segment, and the length of that
+      segment up to its last complete line.
+    """
+    records = []
+    node_ids = set()
+    segment, valid_bytes = 0, 0
+    for segment, path in enumerate(segment_paths(folder, NODE_LOG_FILE)):
+        segment_records, valid_bytes = read_node_log(path)
+        # A rewrite of the log that was interrupted before the later
+        # segments were removed leaves nodes that nodes.jsonl already holds.
+        for record in segment_records:
+            if record["node_id"] not in node_ids:
+                node_ids.add(record["node_id"])
+                records.append(record)
+    return records, segment, valid_bytes
+
+
+class NewestFirst(Sequence):
+    """
+    Read-only, newest-first view of a list that is appended to in creation
+    order. Appending is O(1), where prepending to a list is O(n).
+    """
+
+    __slots__ = ("_items",)
+
+    def __init__(self, items):
+        self._items = items
+
+    def __len__(self):
+        return len(self._items)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._items[-1 - i] for i in range(len(self._items))[index]]
+        if index < 0:
+            index += len(self._items)
+        if not 0 <= index < len(self._items):
+            raise IndexError("index out of range")
+        return self._items[-1 - index]
+
+    def __iter__(self):
+        return reversed(self._items)
+
+    def __reversed__(self):
+        return iter(self._items)
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+    def __eq__(self, other):
+        if isinstance(other, (list, NewestFirst)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class NewestFirstIndex(Mapping):
+    """Read-only view of a keyword index whose lists are NewestFirst views."""
+
+    __slots__ = ("_lists",)
+
+    def __init__(self, lists):
+        self._lists = lists
+
+    def __getitem__(self, key):
+        return NewestFirst(self._lists[key])
+
+    def __len__(self):
+        return len(self._lists)
+
+    def __iter__(self):
+        return iter(self._lists)
+
+    def __contains__(self, key):
+        return key in self._lists
+
+
+def _grow(array, size):
+    """Returns <array> with room for at least <size> rows (doubling)."""
+    if size <= len(array):
+        return array
+    grown = np.zeros((max(size, 2 * len(array)),) + array.shape[1:], array.dtype)
+    grown[: len(array)] = array
+    return grown
 
 
 class ConceptNode:
+    """
+    A node of the memory stream. The node's times, poignancy, type and depth
+    live in the columnar arrays of its AssociativeMemory (row node_count - 1).
+    """
+
+    __slots__ = (
+        "_memory",
+        "_row",
+        "node_id",
+        "type_count",
+        "subject",
+        "predicate",
+        "object",
+        "description",
+        "embedding_key",
+        "keywords",
+        "filling",
+    )
+
     def __init__(
         self,
-        node_id,
-        node_count,
+        memory,
+        row,
         type_count,
-        node_type,
-        depth,
-        created,
-        expiration,
         s,
         p,
         o,
         description,
         embedding_key,
-        poignancy,
         keywords,
         filling,
     ):
-        self.node_id = node_id
-        self.node_count = node_count
+        self._memory = memory
+        self._row = row
+        self.node_id = f"node_{str(row + 1)}"
         self.type_count = type_count
-        self.type = node_type  # thought / event / chat
-        self.depth = depth
-
-        self.created = created
-        self.expiration = expiration
-        self.last_accessed = self.created
 
-        self.subject = s
-        self.predicate = p
-        self.object = o
+        self.subject = _intern(s)
+        self.predicate = _intern(p)
+        self.object = _intern(o)
 
-        self.description = description
-        self.embedding_key = embedding_key
-        self.poignancy = poignancy
-        self.keywords = keywords
+        self.description = _intern(description)
+        self.embedding_key = _intern(embedding_key)
+        self.keywords = frozenset(_intern(kw) for kw in keywords)
         self.filling = filling
 
+    @property
+    def node_count(self):
+        return self._row + 1
+
+    @property
+    def type(self):  # thought / event / chat
+        return NODE_TYPES[self._memory._type[self._row]]
+
+    @property
+    def depth(self):
+        return int(self._memory._depth[self._row])
+
+    @property
+    def created(self):
+        return _datetime(self._memory._created[self._row])
+
+    @property
+    def expiration(self):
+        return _datetime(self._memory._expiration[self._row])
+
+    @property
+    def last_accessed(self):
+        return _datetime(self._memory._last_accessed[self._row])
+
+    @last_accessed.setter
+    def last_accessed(self, curr_time):
+        self._memory._set_last_accessed(self._row, _micros(curr_time))
+
+    @property
+    def poignancy(self):
+        return int(self._memory._poignancy[self._row])
+
     def spo_summary(self):
         return (self.subject, self.predicate, self.object)
 
@@ -59,24 +281,82 @@ class AssociativeMemory:
     def __init__(self, f_saved):
         self.id_to_node = dict()
 
-        self.seq_event = []
-        self.seq_thought = []
-        self.seq_chat = []
+        # The sequences and keyword indexes are kept oldest first, so that a
+        # new node is appended; seq_* and kw_to_* expose them newest first.
+        self._seq_event = []
+        self._seq_thought = []
+        self._seq_chat = []
 
-        self.kw_to_event = dict()
-        self.kw_to_thought = dict()
-        self.kw_to_chat = dict()
+        self._kw_to_event = dict()
+        self._kw_to_thought = dict()
+        self._kw_to_chat = dict()
 
         self.kw_strength_event = dict()
         self.kw_strength_thought = dict()
 
-        self.embeddings = json.load(open(f"{f_saved}/embeddings.json"))
-
-        nodes_load = json.load(open(f"{f_saved}/nodes.json"))
-        for count in range(len(nodes_load.keys())):
-            node_id = f"node_{str(count + 1)}"
-            node_details = nodes_load[node_id]
-
+        # Columnar node fields, also used for vectorized retrieval. Row i
+        # belongs to the node with node_count i + 1. Times are int64
+        # microseconds (see _micros), <_type> indexes NODE_TYPES, and
+        # <_embedding_rows> holds the node embeddings normalized to unit
+        # length (float32). Only the first <_embedded_rows> rows are filled:
+        # the embeddings of loaded nodes are read from the embedding table
+        # when retrieval first needs them (see embedding_matrix).
+        self._nodes = []
+        self._embedding_rows = None
+        self._embedded_rows = 0
+        self._created = np.zeros(0, np.int64)
+        self._expiration = np.zeros(0, np.int64)
+        self._last_accessed = np.zeros(0, np.int64)
+        self._poignancy = np.zeros(0, np.int32)
+        self._type = np.zeros(0, np.int8)
+        self._depth = np.zeros(0, np.int32)
+        # Retrieval state, maintained incrementally for new_retrieve over the
+        # non-idle events and thoughts (the retrieval rows). <_recency_keys>
+        # is sorted by last access; ties are in seq_event + seq_thought
+        # order, hence the key (last_accessed, type, -row). <_recency_rows>
+        # holds the row of each key. Poignancy never changes, so its range
+        # is a running min/max. A bisect + delete + insert update of the
+        # recency lists is not atomic, so <_recency_lock> guards them (the
+        # nodes of one persona can be accessed from another persona's move).
+        self._retrievable = np.zeros(0, bool)
+        self._recency_keys = []
+        self._recency_rows = []
+        self._recency_order = None
+        self._recency_lock = threading.RLock()
+        self._importance_range = None
+        self._decay_powers = dict()
+        # <ann_index> shortlists nodes by relevance in approximate retrieval
+        # mode (see RETRIEVAL_MODE); None in exact mode.
+        self.ann_index = None
+        if RETRIEVAL_MODE == "approximate":
+            self.ann_index = IVFIndex(RETRIEVAL_ANN_PROBES)
+
+        self.embeddings = EmbeddingTable(f_saved)
+
+        # <_log_folder> is the folder whose node log holds the first
+        # <_saved_nodes> nodes; None if there is no log yet (a legacy
+        # nodes.json was loaded). New nodes are appended to segment
+        # <_log_segment> of the log, the first <_log_bytes> bytes of which
+        # are valid.
+        self._log_folder = None
+        self._saved_nodes = 0
+        self._log_segment = 0
+        self._log_bytes = 0
+        if os.path.exists(f"{f_saved}/{NODE_LOG_FILE}"):
+            records, self._log_segment, self._log_bytes = read_node_segments(
+                f_saved
+            )
+            self._log_folder = f_saved
+            self._saved_nodes = len(records)
+        else:
+            with open(f"{f_saved}/{LEGACY_NODES_FILE}") as f:
+                nodes_load = json.load(f)
+            records = [
+                nodes_load[f"node_{str(count + 1)}"]
+                for count in range(len(nodes_load.keys()))
+            ]
+
+        for node_details in records:
             node_type = node_details["type"]
 
             created = datetime.datetime.strptime(
@@ -93,10 +373,8 @@ class AssociativeMemory:
             o = node_details["object"]
 
             description = node_details["description"]
-            embedding_pair = (
-                node_details["embedding_key"],
-                self.embeddings[node_details["embedding_key"]],
-            )
+            # The vector stays in the embedding table until it is needed.
+            embedding_pair = (node_details["embedding_key"], None)
             poignancy = node_details["poignancy"]
             keywords = set(node_details["keywords"])
             filling = node_details["filling"]
@@ -148,35 +426,77 @@ class AssociativeMemory:
         if kw_strength_load["kw_strength_thought"]:
             self.kw_strength_thought = kw_strength_load["kw_strength_thought"]
 
-    def save(self, out_json):
-        r = dict()
-        for count in range(len(self.id_to_node.keys()), 0, -1):
-            node_id = f"node_{str(count)}"
-            node = self.id_to_node[node_id]
-
-            r[node_id] = dict()
-            r[node_id]["node_count"] = node.node_count
-            r[node_id]["type_count"] = node.type_count
-            r[node_id]["type"] = node.type
-            r[node_id]["depth"] = node.depth
-
-            r[node_id]["created"] = node.created.strftime("%Y-%m-%d %H:%M:%S")
-            r[node_id]["expiration"] = None
-            if node.expiration:
-                r[node_id]["expiration"] = node.expiration.strftime("%Y-%m-%d %H:%M:%S")
-
-            r[node_id]["subject"] = node.subject
-            r[node_id]["predicate"] = node.predicate
-            r[node_id]["object"] = node.object
-
-            r[node_id]["description"] = node.description
-            r[node_id]["embedding_key"] = node.embedding_key
-            r[node_id]["poignancy"] = node.poignancy
-            r[node_id]["keywords"] = list(node.keywords)
-            r[node_id]["filling"] = node.filling
-
-        with open(f"{out_json}/nodes.json", "w") as outfile:
-            json.dump(r, outfile)
+    @property
+    def seq_event(self):
+        return NewestFirst(self._seq_event)
+
+    @property
+    def seq_thought(self):
+        return NewestFirst(self._seq_thought)
+
+    @property
+    def seq_chat(self):
+        return NewestFirst(self._seq_chat)
+
+    @property
+    def kw_to_event(self):
+        return NewestFirstIndex(self._kw_to_event)
+
+    @property
+    def kw_to_thought(self):
+        return NewestFirstIndex(self._kw_to_thought)
+
+    @property
+    def kw_to_chat(self):
+        return NewestFirstIndex(self._kw_to_chat)
+
+    @staticmethod
+    def node_record(node):
+        """The saved form of a node (a line of the node log)."""
+        record = dict()
+        record["node_id"] = node.node_id
+        record["node_count"] = node.node_count
+        record["type_count"] = node.type_count
+        record["type"] = node.type
+        record["depth"] = node.depth
+
+        record["created"] = node.created.strftime("%Y-%m-%d %H:%M:%S")
+        record["expiration"] = None
+        if node.expiration:
+            record["expiration"] = node.expiration.strftime("%Y-%m-%d %H:%M:%S")
+
+        record["subject"] = node.subject
+        record["predicate"] = node.predicate
+        record["object"] = node.object
+
+        record["description"] = node.description
+        record["embedding_key"] = node.embedding_key
+        record["poignancy"] = node.poignancy
+        record["keywords"] = list(node.keywords)
+        record["filling"] = node.filling
+        return record
+
+    def save(self, out_json, compact=False):
+        """
+        Saves the memory to <out_json>. Only the nodes (and embeddings) added
+        since the last save are appended, unless the memory was loaded from
+        elsewhere or <compact> is set; then the files are rewritten in full.
+        Compaction also happens on its own once a quarter of the embedding
+        rows are superseded.
+        """
+        compact = compact or (
+            self.embeddings.dead_rows() > len(self.embeddings) // 4
+        )
+        if (
+            compact
+            or self._log_folder is None
+            or os.path.abspath(self._log_folder) != os.path.abspath(out_json)
+        ):
+            self._write_node_log(out_json)
+        else:
+            self._append_node_log(out_json)
+        self._log_folder = out_json
+        self._saved_nodes = len(self._nodes)
 
         r = dict()
         r["kw_strength_event"] = self.kw_strength_event
@@ -184,8 +504,40 @@ class AssociativeMemory:
         with open(f"{out_json}/kw_strength.json", "w") as outfile:
             json.dump(r, outfile)
 
-        with open(f"{out_json}/embeddings.json", "w") as outfile:
-            json.dump(self.embeddings, outfile)
+        self.embeddings.save(out_json, compact=compact)
+
+    def _append_node_log(self, out_json):
+        if self._saved_nodes == len(self._nodes):
+            return
+        path = segment_path(out_json, NODE_LOG_FILE, self._log_segment)
+        if is_shared_file(path):
+            # A segment shared with a forked simulation (see linkanything) is
+            # never written to; the new nodes start a segment of their own.
+            self._log_segment += 1
+            self._log_bytes = 0
+            path = segment_path(out_json, NODE_LOG_FILE, self._log_segment)
+        with open(path, "ab") as outfile:
+            # Cutting off what an interrupted save may have left behind.
+            outfile.truncate(self._log_bytes)
+            for node in self._nodes[self._saved_nodes :]:
+                line = json.dumps(self.node_record(node)).encode() + b"\n"
+                outfile.write(line)
+                self._log_bytes += len(line)
+
+    def _write_node_log(self, out_json):
+        tmp = f"{out_json}/{NODE_LOG_FILE}.tmp"
+        self._log_bytes = 0
+        with open(tmp, "wb") as outfile:
+            for node in self._nodes:
+                line = json.dumps(self.node_record(node)).encode() + b"\n"
+                outfile.write(line)
+                self._log_bytes += len(line)
+        os.replace(tmp, f"{out_json}/{NODE_LOG_FILE}")
+        for path in reversed(segment_paths(out_json, NODE_LOG_FILE)[1:]):
+            os.remove(path)
+        self._log_segment = 0
+        if os.path.exists(f"{out_json}/{LEGACY_NODES_FILE}"):
+            os.remove(f"{out_json}/{LEGACY_NODES_FILE}")
 
     def add_event(
         self,
@@ -202,7 +554,7 @@ class AssociativeMemory:
     ):
         # Setting up the node ID and counts.
         node_count = len(self.id_to_node.keys()) + 1
-        type_count = len(self.seq_event) + 1
+        type_count = len(self._seq_event) + 1
         node_type = "event"
         node_id = f"node_{str(node_count)}"
         depth = 0
@@ -216,11 +568,9 @@ class AssociativeMemory:
             )
 
         # Creating the <ConceptNode> object.
-        node = ConceptNode(
-            node_id,
-            node_count,
-            type_count,
+        node = self._new_node(
             node_type,
+            type_count,
             depth,
             created,
             expiration,
@@ -228,20 +578,20 @@ class AssociativeMemory:
             p,
             o,
             description,
-            embedding_pair[0],
+            embedding_pair,
             poignancy,
             keywords,
             filling,
         )
 
         # Creating various dictionary cache for fast access.
-        self.seq_event[:0] = [node]
+        self._seq_event.append(node)
         keywords = [i.lower() for i in keywords]
         for kw in keywords:
-            if kw in self.kw_to_event:
-                self.kw_to_event[kw][:0] = [node]
+            if kw in self._kw_to_event:
+                self._kw_to_event[kw].append(node)
             else:
-                self.kw_to_event[kw] = [node]
+                self._kw_to_event[kw] = [node]
         self.id_to_node[node_id] = node
 
         # Adding in the kw_strength
@@ -252,7 +602,8 @@ class AssociativeMemory:
                 else:
                     self.kw_strength_event[kw] = 1
 
-        self.embeddings[embedding_pair[0]] = embedding_pair[1]
+        if embedding_pair[1] is not None:
+            self.embeddings[embedding_pair[0]] = embedding_pair[1]
 
         return node
 
@@ -271,7 +622,7 @@ class AssociativeMemory:
     ):
         # Setting up the node ID and counts.
         node_count = len(self.id_to_node.keys()) + 1
-        type_count = len(self.seq_thought) + 1
+        type_count = len(self._seq_thought) + 1
         node_type = "thought"
         node_id = f"node_{str(node_count)}"
         depth = 1
@@ -282,11 +633,9 @@ class AssociativeMemory:
             pass
 
         # Creating the <ConceptNode> object.
-        node = ConceptNode(
-            node_id,
-            node_count,
-            type_count,
+        node = self._new_node(
             node_type,
+            type_count,
             depth,
             created,
             expiration,
@@ -294,20 +643,20 @@ class AssociativeMemory:
             p,
             o,
             description,
-            embedding_pair[0],
+            embedding_pair,
             poignancy,
             keywords,
             filling,
         )
 
         # Creating various dictionary cache for fast access.
-        self.seq_thought[:0] = [node]
+        self._seq_thought.append(node)
         keywords = [i.lower() for i in keywords]
         for kw in keywords:
-            if kw in self.kw_to_thought:
-                self.kw_to_thought[kw][:0] = [node]
+            if kw in self._kw_to_thought:
+                self._kw_to_thought[kw].append(node)
             else:
-                self.kw_to_thought[kw] = [node]
+                self._kw_to_thought[kw] = [node]
         self.id_to_node[node_id] = node
 
         # Adding in the kw_strength
@@ -318,7 +667,8 @@ class AssociativeMemory:
                 else:
                     self.kw_strength_thought[kw] = 1
 
-        self.embeddings[embedding_pair[0]] = embedding_pair[1]
+        if embedding_pair[1] is not None:
+            self.embeddings[embedding_pair[0]] = embedding_pair[1]
 
         return node
 
@@ -337,17 +687,15 @@ class AssociativeMemory:
     ):
         # Setting up the node ID and counts.
         node_count = len(self.id_to_node.keys()) + 1
-        type_count = len(self.seq_chat) + 1
+        type_count = len(self._seq_chat) + 1
         node_type = "chat"
         node_id = f"node_{str(node_count)}"
         depth = 0
 
         # Creating the <ConceptNode> object.
-        node = ConceptNode(
-            node_id,
-            node_count,
-            type_count,
+        node = self._new_node(
             node_type,
+            type_count,
             depth,
             created,
             expiration,
@@ -355,26 +703,165 @@ class AssociativeMemory:
             p,
             o,
             description,
-            embedding_pair[0],
+            embedding_pair,
             poignancy,
             keywords,
             filling,
         )
 
         # Creating various dictionary cache for fast access.
-        self.seq_chat[:0] = [node]
+        self._seq_chat.append(node)
         keywords = [i.lower() for i in keywords]
         for kw in keywords:
-            if kw in self.kw_to_chat:
-                self.kw_to_chat[kw][:0] = [node]
+            if kw in self._kw_to_chat:
+                self._kw_to_chat[kw].append(node)
             else:
-                self.kw_to_chat[kw] = [node]
+                self._kw_to_chat[kw] = [node]
         self.id_to_node[node_id] = node
 
-        self.embeddings[embedding_pair[0]] = embedding_pair[1]
+        if embedding_pair[1] is not None:
+            self.embeddings[embedding_pair[0]] = embedding_pair[1]
+
+        return node
+
+    def _new_node(
+        self,
+        node_type,
+        type_count,
+        depth,
+        created,
+        expiration,
+        s,
+        p,
+        o,
+        description,
+        embedding_pair,
+        poignancy,
+        keywords,
+        filling,
+    ):
+        """Appends a row to the columnar arrays and returns its node."""
+        row = len(self._nodes)
+        size = row + 1
+        self._created = _grow(self._created, size)
+        self._expiration = _grow(self._expiration, size)
+        self._last_accessed = _grow(self._last_accessed, size)
+        self._poignancy = _grow(self._poignancy, size)
+        self._type = _grow(self._type, size)
+        self._depth = _grow(self._depth, size)
+        self._retrievable = _grow(self._retrievable, size)
+
+        self._created[row] = _micros(created)
+        self._expiration[row] = _micros(expiration)
+        self._last_accessed[row] = self._created[row]
+        self._poignancy[row] = poignancy
+        self._type[row] = NODE_TYPES.index(node_type)
+        self._depth[row] = depth
 
+        node = ConceptNode(
+            self,
+            row,
+            type_count,
+            s,
+            p,
+            o,
+            description,
+            embedding_pair[0],
+            keywords,
+            filling,
+        )
+        self._nodes.append(node)
+        if embedding_pair[1] is not None and self._embedded_rows == row:
+            self._set_embedding_row(row, embedding_pair[1])
+        if node_type in ("event", "thought") and "idle" not in node.embedding_key:
+            self._retrievable[row] = True
+            self._insert_recency(row)
+            if self._importance_range is None:
+                self._importance_range = (poignancy, poignancy)
+            else:
+                low, high = self._importance_range
+                self._importance_range = (min(low, poignancy), max(high, poignancy))
         return node
 
+    def _set_embedding_row(self, row, embedding):
+        embedding = np.asarray(embedding, dtype=np.float32)
+        if self._embedding_rows is None:
+            self._embedding_rows = np.zeros((0, len(embedding)), np.float32)
+        self._embedding_rows = _grow(self._embedding_rows, row + 1)
+        norm = np.linalg.norm(embedding)
+        self._embedding_rows[row] = embedding / norm if norm else embedding
+        self._embedded_rows = row + 1
+        if self.ann_index is not None:
+            self.ann_index.add(self._embedding_rows, row)
+
+    def _recency_key(self, row):
+        return (int(self._last_accessed[row]), int(self._type[row]), -row)
+
+    def _insert_recency(self, row):
+        with self._recency_lock:
+            index = bisect.bisect(self._recency_keys, self._recency_key(row))
+            self._recency_keys.insert(index, self._recency_key(row))
+            self._recency_rows.insert(index, row)
+            self._recency_order = None
+
+    def _set_last_accessed(self, row, micros):
+        with self._recency_lock:
+            if not self._retrievable[row]:
+                self._last_accessed[row] = micros
+                return
+            index = bisect.bisect_left(self._recency_keys, self._recency_key(row))
+            del self._recency_keys[index]
+            del self._recency_rows[index]
+            self._last_accessed[row] = micros
+            self._insert_recency(row)
+
+    def recency_order(self):
+        """
+        The rows of the nodes that new_retrieve considers (events and thoughts
+        that are not idle), least recently accessed first. Nodes accessed at
+        the same time are in seq_event + seq_thought order.
+        """
+        with self._recency_lock:
+            if self._recency_order is None:
+                self._recency_order = np.array(self._recency_rows, dtype=int)
+            return self._recency_order
+
+    def importance_range(self):
+        """The (min, max) poignancy of the nodes in recency_order()."""
+        return self._importance_range
+
+    def recency_powers(self, recency_decay, n):
+        """recency_decay ** [1, ..., n], cached across retrievals."""
+        powers = self._decay_powers.get(recency_decay)
+        if powers is None or len(powers) < n:
+            # Grown by doubling, like the columnar arrays.
+            size = n if powers is None else max(n, 2 * len(powers))
+            powers = recency_decay ** np.arange(1, size + 1)
+            self._decay_powers[recency_decay] = powers
+        return powers[:n]
+
+    def embedding_matrix(self):
+        """The unit-length float32 node embeddings, one row per node."""
+        for row in range(self._embedded_rows, len(self._nodes)):
+            self._set_embedding_row(
+                row, self.embeddings[self._nodes[row].embedding_key]
+            )
+        if self._embedding_rows is None:
+            return np.zeros((0, 0), np.float32)
+        return self._embedding_rows[: len(self._nodes)]
+
+    def poignancy_array(self):
+        return self._poignancy[: len(self._nodes)]
+
+    def node_at(self, row):
+        return self._nodes[row]
+
+    def mark_accessed(self, nodes, curr_time):
+        """Sets last_accessed of the given nodes (keeping the arrays in sync)."""
+        micros = _micros(curr_time)
+        for node in nodes:
+            self._set_last_accessed(node.node_count - 1, micros)
+
     def get_summarized_latest_events(self, retention):
         return {e_node.spo_summary() for e_node in self.seq_event[:retention]}
 
@@ -404,8 +891,8 @@ class AssociativeMemory:
 
         ret = []
         for i in contents:
-            if i in self.kw_to_thought:
-                ret += self.kw_to_thought[i.lower()]
+            if i in self._kw_to_thought:
+                ret += self._kw_to_thought[i.lower()]
 
         ret = set(ret)
         return ret
@@ -415,14 +902,14 @@ class AssociativeMemory:
 
         ret = []
         for i in contents:
-            if i in self.kw_to_event:
-                ret += self.kw_to_event[i]
+            if i in self._kw_to_event:
+                ret += self._kw_to_event[i]
 
         ret = set(ret)
         return ret
 
     def get_last_chat(self, target_persona_name):
-        if target_persona_name.lower() in self.kw_to_chat:
-            return self.kw_to_chat[target_persona_name.lower()][0]
+        if target_persona_name.lower() in self._kw_to_chat:
+            return self._kw_to_chat[target_persona_name.lower()][-1]
         else:
             return False
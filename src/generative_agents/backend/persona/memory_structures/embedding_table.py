@@ -0,0 +1,221 @@
+"""
+File: embedding_table.py
+Description: On-disk store of a persona's memory embeddings. The vectors are
+kept as a raw float32 matrix (embeddings.f32) that is opened with np.memmap,
+next to a key index with one JSON-encoded key per row
+(embedding_keys.jsonl) and the vector dimension (embeddings_meta.json).
+
+Loading maps the matrix instead of parsing it, and saving only appends the
+rows added since the last save. Both files are split into segments
+(embeddings.1.f32 and embedding_keys.1.jsonl, ...; see segment_path): rows
+are never appended to a segment that is shared with a forked simulation, so
+a fork keeps sharing the rows saved before it was made. A legacy
+embeddings.json is read on load and replaced by the binary files on the next
+save.
+"""
+
+import bisect
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from generative_agents.backend.global_methods import (
+    is_shared_file,
+    segment_path,
+    segment_paths,
+)
+
+ROWS_FILE = "embeddings.f32"
+KEYS_FILE = "embedding_keys.jsonl"
+META_FILE = "embeddings_meta.json"
+LEGACY_FILE = "embeddings.json"
+
+
+class EmbeddingTable:
+    """
+    Mapping from embedding key (the embedded text) to its vector. Behaves like
+    the dictionary that embeddings.json used to be loaded into, but returns
+    float32 numpy rows.
+    """
+
+    def __init__(self, folder):
+        self.folder = Path(folder)
+        self.dim = None
+        # <_segments> maps the rows that are on disk, one array per segment,
+        # the first row of which is in <_starts>; <_pending> holds the rows
+        # added since. <_keys> is the key of every row (on disk, then
+        # pending) and <_index> the current row of each key. A key that is
+        # set again gets a new row; the last one wins.
+        self._segments = []
+        self._starts = []
+        self._saved_rows = 0
+        self._pending = []
+        self._keys = []
+        self._index = {}
+        # Rows are appended to segment <_segment>, the first <_keys_bytes>
+        # bytes of whose keys file are valid.
+        self._segment = 0
+        self._keys_bytes = 0
+        self._legacy = False
+
+        if (self.folder / ROWS_FILE).exists():
+            self._load_rows()
+        elif (self.folder / LEGACY_FILE).exists():
+            with open(self.folder / LEGACY_FILE) as f:
+                for key, vector in json.load(f).items():
+                    self[key] = vector
+            self._legacy = True
+
+    def _load_rows(self):
+        with open(self.folder / META_FILE) as f:
+            self.dim = json.load(f)["dim"] or None
+        self._keys = []
+        self._segments = []
+        self._starts = []
+        rows_paths = segment_paths(self.folder, ROWS_FILE)
+        for segment, rows_path in enumerate(rows_paths):
+            keys, self._keys_bytes = self._read_keys(segment, rows_path)
+            self._starts.append(len(self._keys))
+            self._segments.append(self._map_rows(rows_path, len(keys)))
+            self._keys += keys
+        self._segment = len(rows_paths) - 1
+        self._saved_rows = len(self._keys)
+        self._index = {key: row for row, key in enumerate(self._keys)}
+        self._pending = []
+
+    def _read_keys(self, segment, rows_path):
+        # An interrupted save may have left rows without keys, or a partial
+        # last key; only complete rows with complete keys count. Returns the
+        # keys and the length of the valid part of the keys file.
+        n_rows = 0
+        if self.dim:
+            n_rows = os.path.getsize(rows_path) // (4 * self.dim)
+        keys = []
+        keys_bytes = 0
+        keys_path = segment_path(self.folder, KEYS_FILE, segment)
+        if not os.path.exists(keys_path):
+            return keys, keys_bytes
+        with open(keys_path, "rb") as f:
+            for line in f:
+                if len(keys) == n_rows or not line.endswith(b"\n"):
+                    break
+                keys.append(json.loads(line))
+                keys_bytes += len(line)
+        return keys, keys_bytes
+
+    def _map_rows(self, rows_path, n_rows):
+        if n_rows:
+            return np.memmap(rows_path, np.float32, mode="r", shape=(n_rows, self.dim))
+        return np.zeros((0, self.dim or 0), np.float32)
+
+    def __getitem__(self, key):
+        row = self._index[key]
+        if row >= self._saved_rows:
+            return self._pending[row - self._saved_rows]
+        segment = bisect.bisect_right(self._starts, row) - 1
+        return self._segments[segment][row - self._starts[segment]]
+
+    def __setitem__(self, key, vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        if self.dim is None:
+            self.dim = len(vector)
+        if key in self._index and np.array_equal(self[key], vector):
+            return
+        self._index[key] = len(self._keys)
+        self._keys.append(key)
+        self._pending.append(vector)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def keys(self):
+        return self._index.keys()
+
+    def items(self):
+        return ((key, self[key]) for key in self._index)
+
+    def dead_rows(self):
+        """Number of rows superseded by a later row of the same key."""
+        return len(self._keys) - len(self._index)
+
+    def save(self, folder, compact=False):
+        """
+        Saves the table to <folder>. If the table was loaded from the binary
+        files in that folder, only the new rows are appended; otherwise
+        (legacy JSON, a different folder, or <compact>) the files are written
+        in full, without superseded rows.
+        """
+        folder = Path(folder)
+        appendable = (
+            not compact
+            and not self._legacy
+            and self._saved_rows > 0
+            and folder.resolve() == self.folder.resolve()
+        )
+        if appendable:
+            self._append()
+        else:
+            self._write(folder)
+        self.folder = folder
+        self._legacy = False
+        self._load_rows()
+
+    def _append(self):
+        if not self._pending:
+            return
+        rows_path = segment_path(self.folder, ROWS_FILE, self._segment)
+        keys_path = segment_path(self.folder, KEYS_FILE, self._segment)
+        segment_rows = self._saved_rows - self._starts[-1]
+        keys_bytes = self._keys_bytes
+        if is_shared_file(rows_path) or (
+            os.path.exists(keys_path) and is_shared_file(keys_path)
+        ):
+            # A segment shared with a forked simulation (see linkanything) is
+            # never written to; the new rows start a segment of their own.
+            rows_path = segment_path(self.folder, ROWS_FILE, self._segment + 1)
+            keys_path = segment_path(self.folder, KEYS_FILE, self._segment + 1)
+            segment_rows, keys_bytes = 0, 0
+        # Anything after the valid rows and keys is left over from an
+        # interrupted save and is cut off before appending. Rows are written
+        # first: a crash before the keys are written only leaves rows that
+        # are ignored on load.
+        with open(rows_path, "ab") as f:
+            f.truncate(segment_rows * 4 * self.dim)
+            for vector in self._pending:
+                f.write(vector.tobytes())
+        with open(keys_path, "ab") as f:
+            f.truncate(keys_bytes)
+            for key in self._keys[self._saved_rows :]:
+                f.write(json.dumps(key).encode() + b"\n")
+
+    def _write(self, folder):
+        folder.mkdir(parents=True, exist_ok=True)
+        # Writing only the current row of each key compacts the files.
+        keys = sorted(self._index, key=self._index.get)
+        rows_tmp = folder / (ROWS_FILE + ".tmp")
+        keys_tmp = folder / (KEYS_FILE + ".tmp")
+        with open(rows_tmp, "wb") as f:
+            for key in keys:
+                f.write(self[key].tobytes())
+        with open(keys_tmp, "wb") as f:
+            for key in keys:
+                f.write(json.dumps(key).encode() + b"\n")
+        with open(folder / META_FILE, "w") as f:
+            json.dump({"dim": self.dim or 0}, f)
+        os.replace(rows_tmp, folder / ROWS_FILE)
+        os.replace(keys_tmp, folder / KEYS_FILE)
+        # The rewritten files hold every row; later segments are removed
+        # last to first, so that an interrupted save leaves no gap.
+        for name in (ROWS_FILE, KEYS_FILE):
+            for path in reversed(segment_paths(folder, name)[1:]):
+                os.remove(path)
+        if (folder / LEGACY_FILE).exists():
+            (folder / LEGACY_FILE).unlink()
@@ -9,6 +9,9 @@ the term we used internally back in 2022, taking from our Social Simulacra
 paper.
 """
 
+import os
+import threading
+
 from generative_agents.backend.persona.memory_structures.spatial_memory import (
     MemoryTree,
 )
@@ -28,7 +31,7 @@ from generative_agents.backend.persona.cognitive_modules.converse import (
 
 
 class Persona:
-    def __init__(self, name, folder_mem_saved=False):
+    def __init__(self, name, folder_mem_saved=False, lazy=False):
         # PERSONA BASE STATE
         # <name> is the full name of the persona. This is a unique identifier for
         # the persona within Reverie.
@@ -37,15 +40,52 @@ class Persona:
         # PERSONA MEMORY
         # If there is already memory in folder_mem_saved, we load that. Otherwise,
         # we create new memory instances.
-        # <s_mem> is the persona's spatial memory.
-        f_s_mem_saved = f"{folder_mem_saved}/bootstrap_memory/spatial_memory.json"
-        self.s_mem = MemoryTree(f_s_mem_saved)
-        # <s_mem> is the persona's associative memory.
-        f_a_mem_saved = f"{folder_mem_saved}/bootstrap_memory/associative_memory"
-        self.a_mem = AssociativeMemory(f_a_mem_saved)
+        # <s_mem> is the persona's spatial memory and <a_mem> the persona's
+        # associative memory. With <lazy>, they are only loaded when they are
+        # first accessed (see the properties below).
+        self.folder_mem_saved = folder_mem_saved
+        self._s_mem = None
+        self._a_mem = None
+        self._memory_lock = threading.Lock()
+        # <cognition_lock> is held by move() for the whole cognitive sequence.
+        # Another persona reacting to this one (e.g., starting a chat with it)
+        # takes it too, since the reaction rewrites this persona's memory.
+        self.cognition_lock = threading.Lock()
+        # <deferred_focus> is an event this persona could not react to at the
+        # last step because the other persona was moving at the same time
+        # (see plan._reaction_lock). It is reconsidered at the next step.
+        self.deferred_focus = None
         # <scratch> is the persona's scratch (short term memory) space.
         scratch_saved = f"{folder_mem_saved}/bootstrap_memory/scratch.json"
         self.scratch = Scratch(scratch_saved)
+        if not lazy:
+            self.load_memory()
+
+    def load_memory(self):
+        """Loads the spatial and associative memory, unless already loaded."""
+        with self._memory_lock:
+            if self._s_mem is None:
+                f_s_mem_saved = (
+                    f"{self.folder_mem_saved}/bootstrap_memory/spatial_memory.json"
+                )
+                self._s_mem = MemoryTree(f_s_mem_saved)
+            if self._a_mem is None:
+                f_a_mem_saved = (
+                    f"{self.folder_mem_saved}/bootstrap_memory/associative_memory"
+                )
+                self._a_mem = AssociativeMemory(f_a_mem_saved)
+
+    @property
+    def s_mem(self):
+        if self._s_mem is None:
+            self.load_memory()
+        return self._s_mem
+
+    @property
+    def a_mem(self):
+        if self._a_mem is None:
+            self.load_memory()
+        return self._a_mem
 
     def save(self, save_folder):
         """
@@ -56,6 +96,15 @@ class Persona:
         OUTPUT:
           None
         """
+        # A memory that was never loaded is unchanged since it was read, so
+        # there is nothing to save when saving back to where it came from.
+        saved_in_place = os.path.abspath(save_folder) == os.path.abspath(
+            f"{self.folder_mem_saved}/bootstrap_memory"
+        )
+        if saved_in_place and self._s_mem is None and self._a_mem is None:
+            self.scratch.save(f"{save_folder}/scratch.json")
+            return
+
         # Spatial memory contains a tree in a json format.
         # e.g., {"double studio":
         #         {"double studio":
@@ -143,7 +192,7 @@ class Persona:
         """
         return plan(self, maze, personas, new_day, retrieved)
 
-    def execute(self, maze, personas, plan):
+    def execute(self, maze, personas, plan, persona_tiles=None):
         """
         This function takes the agent's current plan and outputs a concrete
         execution (what object to use, and what tile to travel to).
@@ -154,6 +203,7 @@ class Persona:
                     Persona instance as values.
           plan: The target action address of the persona
                 (persona.scratch.act_address).
+          persona_tiles: The tiles of all personas at the start of the step.
         OUTPUT:
           execution: A triple set that contains the following components:
             <next_tile> is a x,y coordinate. e.g., (58, 9)
@@ -162,7 +212,7 @@ class Persona:
             writing her next novel (editing her novel)
             @ double studio:double studio:common room:sofa
         """
-        return execute(self, maze, personas, plan)
+        return execute(self, maze, personas, plan, persona_tiles)
 
     def reflect(self):
         """
@@ -175,7 +225,7 @@ class Persona:
         """
         reflect(self)
 
-    def move(self, maze, personas, curr_tile, curr_time):
+    def move(self, maze, personas, curr_tile, curr_time, persona_tiles=None):
         """
         This is the main cognitive function where our main sequence is called.
 
@@ -186,6 +236,10 @@ class Persona:
           curr_tile: A tuple that designates the persona's current tile location
                      in (row, col) form. e.g., (58, 39)
           curr_time: datetime instance that indicates the game's current time.
+          persona_tiles: A dictionary of the tiles of all personas at the start
+                         of the step, in (row, col) form. Other personas' tiles
+                         are read from it rather than from their scratch, which
+                         they update when they move. Defaults to the scratch.
         OUTPUT:
           execution: A triple set that contains the following components:
             <next_tile> is a x,y coordinate. e.g., (58, 9)
@@ -194,35 +248,37 @@ class Persona:
             writing her next novel (editing her novel)
             @ double studio:double studio:common room:sofa
         """
-        # Updating persona's scratch memory with <curr_tile>.
-        self.scratch.curr_tile = curr_tile
-
-        # We figure out whether the persona started a new day, and if it is a new
-        # day, whether it is the very first day of the simulation. This is
-        # important because we set up the persona's long term plan at the start of
-        # a new day.
-        new_day = False
-        if not self.scratch.curr_time:
-            new_day = "First day"
-        elif self.scratch.curr_time.strftime("%A %B %d") != curr_time.strftime(
-            "%A %B %d"
-        ):
-            new_day = "New day"
-        self.scratch.curr_time = curr_time
-
-        # Main cognitive sequence begins here.
-        perceived = self.perceive(maze)
-        retrieved = self.retrieve(perceived)
-        plan = self.plan(maze, personas, new_day, retrieved)
-        self.reflect()
-
-        # <execution> is a triple set that contains the following components:
-        # <next_tile> is a x,y coordinate. e.g., (58, 9)
-        # <pronunciatio> is an emoji. e.g., "\ud83d\udca4"
-        # <description> is a string description of the movement. e.g.,
-        #   writing her next novel (editing her novel)
-        #   @ double studio:double studio:common room:sofa
-        return self.execute(maze, personas, plan)
+        with self.cognition_lock:
+            # Updating persona's scratch memory with <curr_tile>.
+            self.scratch.curr_tile = curr_tile
+
+            # We figure out whether the persona started a new day, and if it is a
+            # new day, whether it is the very first day of the simulation. This is
+            # important because we set up the persona's long term plan at the
+            # start of a new day.
+            new_day = False
+            if not self.scratch.curr_time:
+                new_day = "First day"
+            elif self.scratch.curr_time.strftime("%A %B %d") != curr_time.strftime(
+                "%A %B %d"
+            ):
+                new_day = "New day"
+            self.scratch.curr_time = curr_time
+
+            # Main cognitive sequence begins here.
+            perceived = self.perceive(maze)
+            retrieved = self.retrieve(perceived)
+            plan = self.plan(maze, personas, new_day, retrieved)
+            self.reflect()
+
+            # <execution> is a triple set that contains the following
+            # components:
+            # <next_tile> is a x,y coordinate. e.g., (58, 9)
+            # <pronunciatio> is an emoji. e.g., "\ud83d\udca4"
+            # <description> is a string description of the movement. e.g.,
+            #   writing her next novel (editing her novel)
+            #   @ double studio:double studio:common room:sofa
+            return self.execute(maze, personas, plan, persona_tiles)
 
     def open_convo_session(self, convo_mode):
         open_convo_session(self, convo_mode)
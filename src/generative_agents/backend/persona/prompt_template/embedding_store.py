@@ -0,0 +1,170 @@
+"""
+File: embedding_store.py
+Description: Process-wide embedding store shared by all personas and all
+simulations. Embeddings are keyed on (model, normalized text) and kept in a
+SQLite file with a bounded in-memory layer in front of it, so embedding a
+given string costs one API call per model, ever.
+"""
+
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from collections.abc import Iterable
+from pathlib import Path
+
+__all__ = [
+    "EmbeddingStore",
+    "normalize_embedding_text",
+]
+
+# SQLite's default limit on the number of parameters of one statement is 999.
+_SELECT_CHUNK = 900
+
+
+def normalize_embedding_text(text: str) -> str:
+    """
+    The text that is actually embedded (and used as the store key): the
+    same normalization get_embedding has always applied before a request.
+    """
+    return text.replace("\n", " ").strip() or "this is blank"
+
+
+class EmbeddingStore:
+    def __init__(self, path: str | Path, max_memory_bytes: int = 256 * 1024 * 1024):
+        self.path = Path(path)
+        # <memory> holds the most recently read or written embeddings, least
+        # recently used first, as packed float64 arrays (a quarter of the size
+        # of a list of floats, and still exactly the API's values). Above
+        # <max_memory_bytes>, the least recently used ones are dropped; they
+        # are read from the file again when needed.
+        self.memory: OrderedDict[tuple[str, str], array] = OrderedDict()
+        self.max_memory_bytes = max_memory_bytes
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # Opened on first use so that importing gpt_structure does not touch
+        # the disk.
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " model TEXT NOT NULL,"
+                " text TEXT NOT NULL,"
+                " vector BLOB NOT NULL,"
+                " PRIMARY KEY (model, text))"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def _remember(self, key: tuple[str, str], vector: array) -> None:
+        old = self.memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= old.itemsize * len(old)
+        self.memory[key] = vector
+        self._memory_bytes += vector.itemsize * len(vector)
+        while self._memory_bytes > self.max_memory_bytes and len(self.memory) > 1:
+            _, dropped = self.memory.popitem(last=False)
+            self._memory_bytes -= dropped.itemsize * len(dropped)
+
+    def cached(self, model: str, texts: Iterable[str]) -> dict[str, list[float]]:
+        """
+        The embeddings of the texts that are in memory. Does no I/O, so it is
+        safe to call on the event loop.
+
+        INPUT:
+          model: The embedding model.
+          texts: Normalized texts (see normalize_embedding_text).
+        OUTPUT:
+          {text: embedding} for the texts found in memory.
+        """
+        found = {}
+        with self._lock:
+            for text in texts:
+                vector = self.memory.get((model, text))
+                if vector is not None:
+                    self.memory.move_to_end((model, text))
+                    found[text] = vector.tolist()
+        return found
+
+    def get_many(self, model: str, texts: Iterable[str]) -> dict[str, list[float]]:
+        """
+        Look up the embeddings of already normalized texts, reading the ones
+        that are not in memory from the file with one query per chunk.
+
+        INPUT:
+          model: The embedding model.
+          texts: Normalized texts (see normalize_embedding_text).
+        OUTPUT:
+          {text: embedding} for the texts that were embedded before.
+        """
+        texts = list(dict.fromkeys(texts))
+        found = self.cached(model, texts)
+        missing = [text for text in texts if text not in found]
+        with self._lock:
+            conn = self._connect()
+            for i in range(0, len(missing), _SELECT_CHUNK):
+                chunk = missing[i : i + _SELECT_CHUNK]
+                rows = conn.execute(
+                    "SELECT text, vector FROM embeddings WHERE model = ?"
+                    f" AND text IN ({', '.join('?' * len(chunk))})",
+                    (model, *chunk),
+                )
+                for text, blob in rows:
+                    # Stored as float64 so cached vectors equal the API's
+                    # exactly.
+                    vector = array("d", blob)
+                    self._remember((model, text), vector)
+                    found[text] = vector.tolist()
+        return found
+
+    def get(self, model: str, text: str) -> list[float] | None:
+        """
+        Look up the embedding of an already normalized text.
+
+        INPUT:
+          model: The embedding model.
+          text: The normalized text (see normalize_embedding_text).
+        OUTPUT:
+          The embedding, or None if this (model, text) was never embedded.
+        """
+        return self.get_many(model, [text]).get(text)
+
+    def put_many(
+        self, model: str, embeddings: Iterable[tuple[str, list[float]]]
+    ) -> None:
+        """
+        Store the embeddings of already normalized texts, in one transaction.
+
+        INPUT:
+          model: The embedding model.
+          embeddings: (text, embedding) pairs.
+        OUTPUT:
+          None
+        """
+        vectors = {text: array("d", embedding) for text, embedding in embeddings}
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)",
+                    (
+                        (model, text, vector.tobytes())
+                        for text, vector in vectors.items()
+                    ),
+                )
+            for text, vector in vectors.items():
+                self._remember((model, text), vector)
+
+    def put(self, model: str, text: str, embedding: list[float]) -> None:
+        """Store the embedding of an already normalized text."""
+        self.put_many(model, [(text, embedding)])
+
+    def __len__(self) -> int:
+        with self._lock:
+            return (
+                self._connect().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            )
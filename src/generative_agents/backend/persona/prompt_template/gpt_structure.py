@@ -3,33 +3,80 @@ Author: Joon Sung Park (joonspk@stanford.edu)
 
 File: gpt_structure.py
 Description: Wrapper functions for calling OpenAI APIs.
+
+Every request goes through the shared LLMTransport (see llm_transport.py). The
+*_async variants are coroutines for the transport loop; run several of them at
+once with gather_requests(). The synchronous functions are thin blocking
+wrappers around them.
+
+When LLM_CACHE_MODE is not "off", the safe_generate functions first look the
+rendered prompt up in the persistent response cache (see llm_cache.py) and
+store every response that passes validation; ChatGPT_single_request caches
+every response that is not an error. In replay mode nothing reaches the API:
+a prompt or embedding that is not cached raises CacheMissError.
+
+Embeddings go through the shared embedding store (see embedding_store.py), so
+each (model, text) pair is only ever requested once. Use get_embeddings() to
+embed several texts in as few requests as possible.
 """
 
+import asyncio
 import json
-import time
 from collections.abc import Callable
 from pathlib import Path
 
-from openai import OpenAI
-
 from generative_agents.backend.config import (
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_BATCH_TOKENS,
+    EMBEDDING_STORE_MEMORY_MB,
+    EMBEDDING_STORE_PATH,
+    LLM_CACHE_MAX_MB,
+    LLM_CACHE_MODE,
+    LLM_CACHE_PATH,
+    LLM_MAX_IN_FLIGHT,
+    LLM_MAX_RETRIES,
+    LLM_MODEL_CONCURRENCY,
+    LLM_MODEL_RPM,
+    LLM_MODEL_TPM,
     MODEL_PLAN,
     MODEL_REFLECT,
     MODEL_RETRIEVE_EMBEDDING,
 )
-from generative_agents.backend.utils import openai_api_key
+from generative_agents.backend.persona.prompt_template.embedding_store import (
+    EmbeddingStore,
+    normalize_embedding_text,
+)
+from generative_agents.backend.persona.prompt_template.llm_cache import (
+    CACHE_MODES,
+    CacheMissError,
+    ResponseCache,
+)
+from generative_agents.backend.persona.prompt_template.llm_transport import (
+    LLMTransport,
+)
+from generative_agents.backend.utils import fs_cache, openai_api_key
 
 __all__ = [
-    "temp_sleep",
+    "transport",
+    "response_cache",
+    "embedding_store",
+    "gather_requests",
+    "ChatGPT_single_request_async",
     "ChatGPT_single_request",
+    "GPT4_request_async",
     "GPT4_request",
+    "ChatGPT_request_async",
     "ChatGPT_request",
     "GPT4_safe_generate_response",
     "ChatGPT_safe_generate_response",
     "ChatGPT_safe_generate_response_OLD",
+    "GPT_request_async",
     "GPT_request",
     "generate_prompt",
     "safe_generate_response",
+    "get_embeddings_async",
+    "get_embeddings",
+    "get_embedding_async",
     "get_embedding",
 ]
 
@@ -37,20 +84,110 @@ __all__ = [
 # prompt_lib_file paths are relative to the backend directory (e.g., "persona/prompt_template/v2/...")
 _BACKEND_DIR = Path(__file__).resolve().parent.parent.parent
 
-client = OpenAI(api_key=openai_api_key)
+transport = LLMTransport(
+    openai_api_key,
+    LLM_MAX_IN_FLIGHT,
+    LLM_MODEL_CONCURRENCY,
+    LLM_MODEL_RPM,
+    LLM_MODEL_TPM,
+    LLM_MAX_RETRIES,
+)
 
+if LLM_CACHE_MODE not in CACHE_MODES:
+    raise ValueError(
+        f"Unknown LLM_CACHE_MODE: {LLM_CACHE_MODE}. Available: {', '.join(CACHE_MODES)}"
+    )
+response_cache = (
+    None
+    if LLM_CACHE_MODE == "off"
+    else ResponseCache(
+        LLM_CACHE_PATH or fs_cache / "llm_responses.sqlite3",
+        LLM_CACHE_MAX_MB * 1024 * 1024,
+        LLM_CACHE_MODE,
+    )
+)
 
-def temp_sleep(seconds=0.1):
-    time.sleep(seconds)
+embedding_store = EmbeddingStore(
+    EMBEDDING_STORE_PATH or fs_cache / "embeddings.sqlite3",
+    EMBEDDING_STORE_MEMORY_MB * 1024 * 1024,
+)
+# Embedding requests currently on the wire, so that concurrent requests for
+# the same (model, text) share one API call. Only touched on the transport
+# loop.
+_embedding_requests: dict[tuple[str, str], asyncio.Future] = {}
 
+# Error strings returned by the request functions instead of raising. They
+# are never written to the response cache.
+_ERROR_RESPONSES = ("ChatGPT ERROR", "TOKEN LIMIT EXCEEDED")
 
-def ChatGPT_single_request(prompt):
-    temp_sleep()
 
-    completion = client.chat.completions.create(
-        model=MODEL_PLAN, messages=[{"role": "user", "content": prompt}]
-    )
-    return completion.choices[0].message.content
+def gather_requests(*coros):
+    """
+    Runs several of the *_async requests below concurrently and returns their
+    results in order. e.g.,
+      plan_note, thought_note = gather_requests(
+          ChatGPT_single_request_async(plan_prompt),
+          ChatGPT_single_request_async(thought_prompt))
+    """
+    return transport.gather(*coros)
+
+
+def _attempts(repeat):
+    """
+    The attempts of a safe_generate loop. In replay mode there is only one:
+    the cache holds one response per prompt, so retrying after it failed
+    validation would read the same response again.
+    """
+    if response_cache is not None and response_cache.mode == "replay":
+        return range(min(repeat, 1))
+    return range(repeat)
+
+
+def _cached_request(model, prompt, params, attempt, request):
+    """
+    Returns the response for one attempt of a safe_generate loop, and whether
+    it came from the response cache. The first attempt is served from the
+    cache when possible; later attempts (the cached answer failed validation)
+    go to the API. In replay mode, a miss raises CacheMissError.
+    """
+    if response_cache is not None and attempt == 0:
+        cached = response_cache.get(model, prompt, params)
+        if cached is not None:
+            return cached, True
+    return request(), False
+
+
+def _remember_response(model, prompt, params, response):
+    """Stores a response that passed validation in the response cache."""
+    if response_cache is not None and response not in _ERROR_RESPONSES:
+        response_cache.put(model, prompt, params, response)
+
+
+def _refuse_in_replay(model, request):
+    """
+    Raises CacheMissError in replay mode, where no request may reach the API.
+    The request functions call it before sending <request>; the cached paths
+    only get there after a miss.
+    """
+    if response_cache is not None and response_cache.mode == "replay":
+        raise CacheMissError(f"No cached {model} response for {request[:80]!r}")
+
+
+async def ChatGPT_single_request_async(prompt):
+    # The response is used as is, so it is served from and stored in the
+    # response cache directly. The cache's SQLite I/O runs off the transport
+    # loop.
+    if response_cache is not None:
+        cached = await asyncio.to_thread(response_cache.get, MODEL_PLAN, prompt, {})
+        if cached is not None:
+            return cached
+    response = await transport.chat_completion(MODEL_PLAN, prompt)
+    await asyncio.to_thread(_remember_response, MODEL_PLAN, prompt, {}, response)
+    return response
+
+
+def ChatGPT_single_request(prompt):
+    return transport.run(ChatGPT_single_request_async(prompt))
 
 
 # ============================================================================
@@ -58,6 +195,16 @@ def ChatGPT_single_request(prompt):
 # ============================================================================
 
 
+async def GPT4_request_async(prompt):
+    _refuse_in_replay(MODEL_REFLECT, prompt)
+    try:
+        return await transport.chat_completion(MODEL_REFLECT, prompt)
+
+    except Exception:
+        print("ChatGPT ERROR")
+        return "ChatGPT ERROR"
+
+
 def GPT4_request(prompt):
     """
     Given a prompt and a dictionary of GPT parameters, make a request to OpenAI
@@ -70,13 +217,13 @@ def GPT4_request(prompt):
     RETURNS:
       a str of GPT-3's response.
     """
-    temp_sleep()
+    return transport.run(GPT4_request_async(prompt))
 
+
+async def ChatGPT_request_async(prompt):
+    _refuse_in_replay(MODEL_PLAN, prompt)
     try:
-        completion = client.chat.completions.create(
-            model=MODEL_REFLECT, messages=[{"role": "user", "content": prompt}]
-        )
-        return completion.choices[0].message.content
+        return await transport.chat_completion(MODEL_PLAN, prompt)
 
     except Exception:
         print("ChatGPT ERROR")
@@ -95,16 +242,7 @@ def ChatGPT_request(prompt):
     RETURNS:
       a str of GPT-3's response.
     """
-    # temp_sleep()
-    try:
-        completion = client.chat.completions.create(
-            model=MODEL_PLAN, messages=[{"role": "user", "content": prompt}]
-        )
-        return completion.choices[0].message.content
-
-    except Exception:
-        print("ChatGPT ERROR")
-        return "ChatGPT ERROR"
+    return transport.run(ChatGPT_request_async(prompt))
 
 
 def GPT4_safe_generate_response(
@@ -128,9 +266,12 @@ def GPT4_safe_generate_response(
         print("CHAT GPT PROMPT")
         print(prompt)
 
-    for i in range(repeat):
+    for i in _attempts(repeat):
         try:
-            curr_gpt_response = GPT4_request(prompt).strip()
+            raw_response, from_cache = _cached_request(
+                MODEL_REFLECT, prompt, {}, i, lambda: GPT4_request(prompt)
+            )
+            curr_gpt_response = raw_response.strip()
             end_index = curr_gpt_response.rfind("}") + 1
             curr_gpt_response = curr_gpt_response[:end_index]
             curr_gpt_response = json.loads(curr_gpt_response)["output"]
@@ -138,6 +279,8 @@ def GPT4_safe_generate_response(
             if func_validate is not None and func_validate(
                 curr_gpt_response, prompt=prompt
             ):
+                if not from_cache:
+                    _remember_response(MODEL_REFLECT, prompt, {}, raw_response)
                 if func_clean_up is not None:
                     return func_clean_up(curr_gpt_response, prompt=prompt)
                 return curr_gpt_response
@@ -147,6 +290,8 @@ def GPT4_safe_generate_response(
                 print(curr_gpt_response)
                 print("~~~~")
 
+        except CacheMissError:
+            raise
         except Exception:
             pass
 
@@ -175,9 +320,12 @@ def ChatGPT_safe_generate_response(
         print("CHAT GPT PROMPT")
         print(prompt)
 
-    for i in range(repeat):
+    for i in _attempts(repeat):
         try:
-            curr_gpt_response = ChatGPT_request(prompt).strip()
+            raw_response, from_cache = _cached_request(
+                MODEL_PLAN, prompt, {}, i, lambda: ChatGPT_request(prompt)
+            )
+            curr_gpt_response = raw_response.strip()
             end_index = curr_gpt_response.rfind("}") + 1
             curr_gpt_response = curr_gpt_response[:end_index]
             curr_gpt_response = json.loads(curr_gpt_response)["output"]
@@ -185,6 +333,8 @@ def ChatGPT_safe_generate_response(
             if func_validate is not None and func_validate(
                 curr_gpt_response, prompt=prompt
             ):
+                if not from_cache:
+                    _remember_response(MODEL_PLAN, prompt, {}, raw_response)
                 if func_clean_up is not None:
                     return func_clean_up(curr_gpt_response, prompt=prompt)
                 return curr_gpt_response
@@ -194,6 +344,8 @@ def ChatGPT_safe_generate_response(
                 print(curr_gpt_response)
                 print("~~~~")
 
+        except CacheMissError:
+            raise
         except Exception:
             pass
 
@@ -226,6 +378,8 @@ def ChatGPT_safe_generate_response_OLD(
                 print(curr_gpt_response)
                 print("~~~~")
 
+        except CacheMissError:
+            raise
         except Exception:
             pass
     print("FAIL SAFE TRIGGERED")
@@ -237,6 +391,22 @@ def ChatGPT_safe_generate_response_OLD(
 # ============================================================================
 
 
+async def GPT_request_async(prompt, gpt_parameter):
+    _refuse_in_replay(MODEL_PLAN, prompt)
+    try:
+        # Use chat completions API with configured model (ignores legacy 'engine' param)
+        # GPT-5 models: only support max_completion_tokens (not max_tokens),
+        # temperature=1 only, no stop/frequency_penalty/presence_penalty/top_p
+        return await transport.chat_completion(
+            MODEL_PLAN,
+            prompt,
+            max_completion_tokens=gpt_parameter.get("max_tokens", 150),
+        )
+    except Exception as e:
+        print(f"GPT_request ERROR: {e}")
+        return "TOKEN LIMIT EXCEEDED"
+
+
 def GPT_request(prompt, gpt_parameter):
     """
     Given a prompt and a dictionary of GPT parameters, make a request to OpenAI
@@ -249,20 +419,7 @@ def GPT_request(prompt, gpt_parameter):
     RETURNS:
       a str of GPT-3's response.
     """
-    temp_sleep()
-    try:
-        # Use chat completions API with configured model (ignores legacy 'engine' param)
-        # GPT-5 models: only support max_completion_tokens (not max_tokens),
-        # temperature=1 only, no stop/frequency_penalty/presence_penalty/top_p
-        response = client.chat.completions.create(
-            model=MODEL_PLAN,
-            messages=[{"role": "user", "content": prompt}],
-            max_completion_tokens=gpt_parameter.get("max_tokens", 150),
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        print(f"GPT_request ERROR: {e}")
-        return "TOKEN LIMIT EXCEEDED"
+    return transport.run(GPT_request_async(prompt, gpt_parameter))
 
 
 def generate_prompt(curr_input, prompt_lib_file):
@@ -306,11 +463,21 @@ def safe_generate_response(
     if verbose:
         print(prompt)
 
-    for i in range(repeat):
-        curr_gpt_response = GPT_request(prompt, gpt_parameter)
+    for i in _attempts(repeat):
+        curr_gpt_response, from_cache = _cached_request(
+            MODEL_PLAN,
+            prompt,
+            gpt_parameter,
+            i,
+            lambda: GPT_request(prompt, gpt_parameter),
+        )
         if func_validate is not None and func_validate(
             curr_gpt_response, prompt=prompt
         ):
+            if not from_cache:
+                _remember_response(
+                    MODEL_PLAN, prompt, gpt_parameter, curr_gpt_response
+                )
             if func_clean_up is not None:
                 return func_clean_up(curr_gpt_response, prompt=prompt)
             return curr_gpt_response
@@ -321,11 +488,113 @@ def safe_generate_response(
     return fail_safe_response
 
 
-def get_embedding(text, model=None):
+def _embedding_batches(texts):
+    """
+    Splits texts into requests that respect EMBEDDING_BATCH_SIZE inputs and
+    EMBEDDING_BATCH_TOKENS tokens. Tokens are estimated conservatively at one
+    per three characters.
+    """
+    batch, batch_tokens = [], 0
+    for text in texts:
+        tokens = len(text) // 3 + 1
+        if batch and (
+            len(batch) >= EMBEDDING_BATCH_SIZE
+            or batch_tokens + tokens > EMBEDDING_BATCH_TOKENS
+        ):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(text)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+
+async def _fetch_embeddings(model, texts):
+    try:
+        # The embedding store is the cache of embeddings.
+        _refuse_in_replay(model, texts[0])
+        embeddings = await transport.create_embeddings(model, texts)
+    except Exception as e:
+        for text in texts:
+            _embedding_requests.pop((model, text)).set_exception(e)
+        raise
+    for text, embedding in zip(texts, embeddings):
+        _embedding_requests.pop((model, text)).set_result(embedding)
+    # The embeddings are already delivered; failing to store them only costs
+    # a request the next time they are needed. The store's SQLite I/O runs
+    # off the transport loop.
+    try:
+        await asyncio.to_thread(
+            embedding_store.put_many, model, list(zip(texts, embeddings))
+        )
+    except Exception as e:
+        print(f"Embedding store ERROR: {e}")
+
+
+async def _resolve_embeddings(model, texts):
+    """
+    Resolves the futures of <texts> in _embedding_requests: from the
+    embedding store where it has them, and with as few requests as possible
+    for the rest.
+    """
+    try:
+        stored = await asyncio.to_thread(embedding_store.get_many, model, texts)
+    except Exception as e:
+        print(f"Embedding store ERROR: {e}")
+        stored = {}
+    for text, embedding in stored.items():
+        _embedding_requests.pop((model, text)).set_result(embedding)
+    missing = [text for text in texts if text not in stored]
+    await asyncio.gather(
+        *(_fetch_embeddings(model, batch) for batch in _embedding_batches(missing))
+    )
+
+
+async def get_embeddings_async(texts, model=None):
     if model is None:
         model = MODEL_RETRIEVE_EMBEDDING
-    text = text.replace("\n", " ").strip() or "this is blank"
-    return client.embeddings.create(input=[text], model=model).data[0].embedding
+    texts = [normalize_embedding_text(text) for text in texts]
+    unique_texts = list(dict.fromkeys(texts))
+
+    # Embeddings in the store's memory are served right away. Every other
+    # text gets a future in _embedding_requests before anything is awaited,
+    # so that concurrent callers wait for the same lookup and request rather
+    # than each sending the text to the API.
+    embeddings = embedding_store.cached(model, unique_texts)
+    loop = asyncio.get_running_loop()
+    claimed = []
+    for text in unique_texts:
+        if text not in embeddings and (model, text) not in _embedding_requests:
+            _embedding_requests[(model, text)] = loop.create_future()
+            claimed.append(text)
+    pending = {
+        text: _embedding_requests[(model, text)]
+        for text in unique_texts
+        if text not in embeddings
+    }
+    if claimed:
+        await _resolve_embeddings(model, claimed)
+
+    for text, future in pending.items():
+        embeddings[text] = await future
+    return [embeddings[text] for text in texts]
+
+
+def get_embeddings(texts, model=None):
+    """
+    Embeds a list of texts with as few requests as possible and returns the
+    embeddings in the order of <texts>. Texts that are already in the
+    embedding store are not requested again.
+    """
+    return transport.run(get_embeddings_async(texts, model))
+
+
+async def get_embedding_async(text, model=None):
+    return (await get_embeddings_async([text], model))[0]
+
+
+def get_embedding(text, model=None):
+    return transport.run(get_embedding_async(text, model))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,184 @@
+"""
+File: llm_cache.py
+Description: Persistent, content-addressed cache of LLM responses. Responses
+are keyed on (model, rendered prompt, request parameters) and stored in a
+SQLite file, so forks of the same base simulation (and re-runs of the same
+benchmark) can reuse responses to identical prompts.
+
+The cache has three modes:
+  "readwrite" -- serve hits from the cache and store new responses.
+  "replay"    -- read-only; a miss raises CacheMissError instead of going to
+                 the API, which keeps re-runs fully offline.
+  "off"       -- no cache at all (the caller simply does not create one).
+"""
+
+import atexit
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+__all__ = [
+    "CACHE_MODES",
+    "CacheMissError",
+    "ResponseCache",
+]
+
+CACHE_MODES = ("off", "readwrite", "replay")
+
+# Number of hits whose last_used update is deferred before they are written.
+_TOUCH_BATCH = 256
+
+
+class CacheMissError(RuntimeError):
+    """Raised in replay mode when a prompt has no cached response."""
+
+
+class ResponseCache:
+    def __init__(self, path: str | Path, max_bytes: int, mode: str = "readwrite"):
+        if mode not in ("readwrite", "replay"):
+            raise ValueError(
+                f"Unknown cache mode: {mode}. Available: readwrite, replay"
+            )
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.mode = mode
+
+        # <hits> and <misses> count lookups made by this process.
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        # <_touched> holds the last_used times of hits that are not written
+        # yet: they are written in one batch with the next put, every
+        # _TOUCH_BATCH hits, and at exit, rather than committed on every hit.
+        self._touched: dict[str, int] = {}
+        if mode == "replay":
+            self._conn = sqlite3.connect(
+                f"file:{self.path}?mode=ro", uri=True, check_same_thread=False
+            )
+        else:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " model TEXT NOT NULL,"
+                " response TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " last_used INTEGER NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_last_used"
+                " ON responses (last_used)"
+            )
+            self._conn.commit()
+            atexit.register(self.flush)
+
+    @staticmethod
+    def make_key(model: str, prompt: str, params: dict[str, Any]) -> str:
+        """Content address of a request: a hash of model, prompt and params."""
+        payload = json.dumps([model, prompt, params], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, model: str, prompt: str, params: dict[str, Any]) -> str | None:
+        """
+        Look up the cached response of a request.
+
+        INPUT:
+          model, prompt, params: The request.
+        OUTPUT:
+          The cached raw response, or None on a miss (readwrite mode).
+          Raises CacheMissError on a miss in replay mode.
+        """
+        key = self.make_key(model, prompt, params)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                if self.mode == "replay":
+                    raise CacheMissError(
+                        f"No cached {model} response for prompt {prompt[:80]!r}"
+                    )
+                return None
+            self.hits += 1
+            if self.mode == "readwrite":
+                self._touched[key] = time.time_ns()
+                if len(self._touched) >= _TOUCH_BATCH:
+                    self._write_touched()
+                    self._conn.commit()
+            return row[0]
+
+    def put(
+        self, model: str, prompt: str, params: dict[str, Any], response: str
+    ) -> None:
+        """Store a response, evicting least recently used ones above max_bytes."""
+        if self.mode == "replay":
+            return
+        key = self.make_key(model, prompt, params)
+        size = len(response.encode("utf-8")) + len(prompt.encode("utf-8"))
+        with self._lock, self._conn:
+            # Several processes may share the cache file. Taking the write
+            # lock up front keeps the size that eviction reads exact until
+            # the commit.
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._write_touched()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, size, time.time_ns()),
+            )
+            self._evict()
+
+    def flush(self) -> None:
+        """Write the deferred last_used times of hits."""
+        with self._lock:
+            if self._touched:
+                self._write_touched()
+                self._conn.commit()
+
+    def _write_touched(self) -> None:
+        self._conn.executemany(
+            "UPDATE responses SET last_used = ? WHERE key = ?",
+            [(last_used, key) for key, last_used in self._touched.items()],
+        )
+        self._touched.clear()
+
+    def _size(self) -> int:
+        return self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+
+    def _evict(self) -> None:
+        """Drop least recently used entries until the cache fits max_bytes."""
+        total = self._size()
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM responses ORDER BY last_used"
+        ):
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+    def stats(self) -> dict[str, Any]:
+        """Counters for the CLI: hits, misses, entries and size on disk."""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[
+                0
+            ]
+            size = self._size()
+        return {
+            "mode": self.mode,
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": entries,
+            "size_bytes": size,
+        }
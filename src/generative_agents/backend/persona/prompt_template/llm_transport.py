@@ -0,0 +1,194 @@
+"""
+File: llm_transport.py
+Description: Asynchronous transport for the OpenAI API. One AsyncOpenAI client
+(and therefore one shared connection pool) lives on a dedicated event loop
+thread. Every request waits for a slot of its model and a slot of the global
+in-flight limit before it is sent, so synchronous callers on any thread and
+concurrent callers share the same bounds.
+
+Requests are also paced by a per-model rate limiter (see rate_limiter.py) and
+transient failures (rate limits, connection errors, server errors) are retried
+with exponential backoff and jitter.
+"""
+
+import asyncio
+import threading
+from collections.abc import Coroutine
+from concurrent.futures import Future
+from typing import Any, TypeVar
+
+from openai import (
+    APIConnectionError,
+    AsyncOpenAI,
+    InternalServerError,
+    RateLimitError,
+)
+
+from generative_agents.backend.persona.prompt_template.rate_limiter import (
+    ModelRateLimiter,
+    backoff_delay,
+    estimate_tokens,
+    retry_after_seconds,
+)
+
+T = TypeVar("T")
+
+# Errors worth retrying; anything else is returned to the caller at once.
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, InternalServerError)
+
+
+class LLMTransport:
+    def __init__(
+        self,
+        api_key: str | None,
+        max_in_flight: int = 16,
+        model_limits: dict[str, int] | None = None,
+        model_rpm: dict[str, int] | None = None,
+        model_tpm: dict[str, int] | None = None,
+        max_retries: int = 6,
+    ):
+        # <client> is shared by every request, which lets them reuse pooled
+        # HTTP connections. Retries are done here (with our own backoff and
+        # rate limiter), not by the client.
+        self.client = AsyncOpenAI(api_key=api_key, max_retries=0)
+        # <max_in_flight> bounds all requests; <model_limits> optionally bounds
+        # the requests of a single model further.
+        self.max_in_flight = max_in_flight
+        self.model_limits = dict(model_limits or {})
+        # <model_rpm> and <model_tpm> are the initial per-model rate budgets;
+        # the x-ratelimit-* response headers replace them once seen.
+        self.model_rpm = dict(model_rpm or {})
+        self.model_tpm = dict(model_tpm or {})
+        self.max_retries = max_retries
+        self._limiters: dict[str, ModelRateLimiter] = {}
+
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread: threading.Thread | None = None
+        self._loop_lock = threading.Lock()
+        self._in_flight: asyncio.Semaphore | None = None
+        self._model_slots: dict[str, asyncio.Semaphore] = {}
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        """Start the transport's event loop thread on first use."""
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._loop_thread = threading.Thread(
+                    target=self._loop.run_forever, name="llm-transport", daemon=True
+                )
+                self._loop_thread.start()
+            return self._loop
+
+    def _slots(self, model: str) -> tuple[asyncio.Semaphore, asyncio.Semaphore]:
+        """Return the (model, global) semaphores. Runs on the loop thread."""
+        if self._in_flight is None:
+            self._in_flight = asyncio.Semaphore(self.max_in_flight)
+        if model not in self._model_slots:
+            limit = min(self.model_limits.get(model, self.max_in_flight), self.max_in_flight)
+            self._model_slots[model] = asyncio.Semaphore(limit)
+        return self._model_slots[model], self._in_flight
+
+    def limiter(self, model: str) -> ModelRateLimiter:
+        """Return the rate limiter of a model. Runs on the loop thread."""
+        if model not in self._limiters:
+            self._limiters[model] = ModelRateLimiter(
+                self.model_rpm.get(model), self.model_tpm.get(model)
+            )
+        return self._limiters[model]
+
+    async def _request(self, model: str, tokens: int, create, **kwargs: Any) -> Any:
+        """
+        Send one request through the rate limiter and the concurrency slots,
+        retrying transient failures.
+
+        INPUT:
+          model: The model, which selects the rate limiter and slots.
+          tokens: Estimated tokens of the request, for the TPM budget.
+          create: A with_raw_response create method of the client.
+          kwargs: Arguments for <create>.
+        OUTPUT:
+          The parsed response.
+        """
+        limiter = self.limiter(model)
+        for attempt in range(self.max_retries + 1):
+            await limiter.acquire(tokens)
+            model_slots, in_flight = self._slots(model)
+            try:
+                async with model_slots, in_flight:
+                    raw = await create(model=model, **kwargs)
+            except RETRYABLE_ERRORS as e:
+                headers = getattr(getattr(e, "response", None), "headers", None)
+                limiter.update(headers)
+                if attempt == self.max_retries or (
+                    getattr(e, "code", None) == "insufficient_quota"
+                ):
+                    raise
+                await asyncio.sleep(
+                    backoff_delay(attempt, retry_after=retry_after_seconds(headers))
+                )
+                continue
+            limiter.update(raw.headers)
+            response = raw.parse()
+            # Settle the token estimate against the actual usage.
+            usage = getattr(response, "usage", None)
+            total_tokens = getattr(usage, "total_tokens", None)
+            if isinstance(total_tokens, int):
+                limiter.tokens.consume(total_tokens - tokens)
+            return response
+
+    def submit(self, coro: Coroutine[Any, Any, T]) -> Future[T]:
+        """Schedule a coroutine on the transport loop from any thread."""
+        return asyncio.run_coroutine_threadsafe(coro, self._get_loop())
+
+    def run(self, coro: Coroutine[Any, Any, T]) -> T:
+        """Run a coroutine on the transport loop and block for its result."""
+        if threading.current_thread() is self._loop_thread:
+            coro.close()
+            raise RuntimeError("LLMTransport.run() cannot block its own event loop")
+        return self.submit(coro).result()
+
+    def gather(self, *coros: Coroutine[Any, Any, Any]) -> list[Any]:
+        """Run several coroutines concurrently and return their results in order."""
+
+        async def _gather():
+            return await asyncio.gather(*coros)
+
+        return self.run(_gather())
+
+    async def chat_completion(self, model: str, prompt: str, **params: Any) -> str:
+        """
+        Send a single-message chat completion request.
+
+        INPUT:
+          model: The chat model to use.
+          prompt: The user message.
+          params: Additional parameters for chat.completions.create (e.g.,
+                  max_completion_tokens).
+        OUTPUT:
+          The content of the first choice.
+        """
+        tokens = estimate_tokens(prompt) + params.get("max_completion_tokens", 0)
+        completion = await self._request(
+            model,
+            tokens,
+            self.client.chat.completions.with_raw_response.create,
+            messages=[{"role": "user", "content": prompt}],
+            **params,
+        )
+        return completion.choices[0].message.content
+
+    async def create_embeddings(self, model: str, texts: list[str]) -> list[list[float]]:
+        """
+        Embed a list of texts with one request.
+
+        INPUT:
+          model: The embedding model to use.
+          texts: The (already cleaned) input strings.
+        OUTPUT:
+          A list of embedding vectors in the order of <texts>.
+        """
+        tokens = sum(estimate_tokens(text) for text in texts)
+        response = await self._request(
+            model, tokens, self.client.embeddings.with_raw_response.create, input=texts
+        )
+        return [item.embedding for item in response.data]
@@ -0,0 +1,137 @@
+"""
+File: rate_limiter.py
+Description: Per-model rate limiting for the LLM transport. Each model has a
+requests-per-minute and a tokens-per-minute token bucket. The budgets start
+from the configuration and follow the x-ratelimit-* headers of the API
+responses once they are seen. Retries back off exponentially with jitter.
+
+Everything here runs on the transport's event loop thread, so no locking is
+needed.
+"""
+
+import asyncio
+import random
+import time
+from collections.abc import Mapping
+
+__all__ = [
+    "TokenBucket",
+    "ModelRateLimiter",
+    "backoff_delay",
+    "estimate_tokens",
+    "retry_after_seconds",
+]
+
+
+def estimate_tokens(text: str) -> int:
+    """A rough token count of a text (about four characters per token)."""
+    return len(text) // 4 + 1
+
+
+def backoff_delay(
+    attempt: int,
+    base: float = 0.5,
+    maximum: float = 30.0,
+    retry_after: float | None = None,
+) -> float:
+    """
+    Seconds to wait before retry number <attempt> (starting at 0): exponential
+    backoff with full jitter, but never less than the server's retry-after.
+    """
+    delay = random.uniform(0, min(maximum, base * 2**attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+class TokenBucket:
+    """A bucket refilled continuously at <per_minute> units per minute."""
+
+    def __init__(self, per_minute: int | None = None):
+        # <per_minute> of None means unlimited.
+        self.per_minute = per_minute
+        self.level = float(per_minute or 0)
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        if self.per_minute:
+            self.level = min(
+                self.per_minute,
+                self.level + (now - self.updated) * self.per_minute / 60,
+            )
+        self.updated = now
+
+    def set_limit(self, per_minute: int) -> None:
+        """Change the budget, e.g. to the limit reported by the API."""
+        self._refill()
+        if self.per_minute is None:
+            self.level = float(per_minute)
+        self.per_minute = per_minute
+        self.level = min(self.level, per_minute)
+
+    def set_remaining(self, remaining: float) -> None:
+        """Never assume more budget than the API says is left."""
+        self._refill()
+        self.level = min(self.level, remaining)
+
+    def consume(self, amount: float) -> None:
+        """Take <amount> without waiting; the level may go negative."""
+        if self.per_minute:
+            self._refill()
+            self.level -= amount
+
+    async def acquire(self, amount: float) -> None:
+        """Wait until <amount> units are available and take them."""
+        if not self.per_minute:
+            return
+        # A single request larger than the whole budget still has to go out.
+        amount = min(amount, self.per_minute)
+        while True:
+            self._refill()
+            if self.level >= amount:
+                self.level -= amount
+                return
+            await asyncio.sleep((amount - self.level) * 60 / self.per_minute)
+
+
+class ModelRateLimiter:
+    """The requests and tokens budgets of one model."""
+
+    def __init__(self, rpm: int | None = None, tpm: int | None = None):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+
+    async def acquire(self, tokens: int) -> None:
+        """Wait for one request and <tokens> tokens of budget."""
+        await self.requests.acquire(1)
+        await self.tokens.acquire(tokens)
+
+    def update(self, headers: Mapping[str, str] | None) -> None:
+        """Adopt the budgets reported in the x-ratelimit-* response headers."""
+        if not headers:
+            return
+        for kind, bucket in (("requests", self.requests), ("tokens", self.tokens)):
+            limit = _header_number(headers, f"x-ratelimit-limit-{kind}")
+            if limit:
+                bucket.set_limit(int(limit))
+            remaining = _header_number(headers, f"x-ratelimit-remaining-{kind}")
+            if remaining is not None:
+                bucket.set_remaining(remaining)
+
+
+def _header_number(headers: Mapping[str, str], name: str) -> float | None:
+    try:
+        return float(headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def retry_after_seconds(headers: Mapping[str, str] | None) -> float | None:
+    """The server's requested wait from retry-after-ms / retry-after headers."""
+    if not headers:
+        return None
+    retry_after_ms = _header_number(headers, "retry-after-ms")
+    if retry_after_ms is not None:
+        return retry_after_ms / 1000
+    return _header_number(headers, "retry-after")
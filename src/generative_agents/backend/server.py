@@ -27,21 +27,66 @@ import math
 import os
 import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 
+from generative_agents.backend.config import (
+    FORK_MODE,
+    PATH_CACHE_PERSIST,
+    PERSONA_LOAD_WORKERS,
+    PERSONA_LOADING,
+    PERSONA_WORKERS,
+)
 from generative_agents.backend.global_methods import (
     check_if_file_exists,
     copyanything,
+    linkanything,
+    segment_base_name,
 )
 from generative_agents.backend.maze import Maze
+from generative_agents.backend.persona.memory_structures import (
+    associative_memory,
+    embedding_table,
+)
 from generative_agents.backend.persona.persona import Persona
 from generative_agents.backend.utils import fs_storage, fs_temp_storage
+from generative_agents.steplog import is_segment_file, open_step_log
 
 
 ##############################################################################
 #                                  REVERIE                                   #
 ##############################################################################
 
+# Memory files whose segments (see segment_path) are only ever appended to
+# while not shared, replaced or deleted, so forks may share them.
+SHARED_MEMORY_FILES = {
+    associative_memory.NODE_LOG_FILE,
+    associative_memory.LEGACY_NODES_FILE,
+    embedding_table.ROWS_FILE,
+    embedding_table.KEYS_FILE,
+    embedding_table.LEGACY_FILE,
+}
+
+
+def is_fork_history(relative_path, step):
+    """
+    Whether a file of a simulation at step <step> can be hardlinked into a
+    fork: the step log segments, the legacy environment and movement files
+    of past steps (a fork only writes the files of its current and later
+    steps) and the shared memory files. Everything else is rewritten in
+    place and is copied.
+    """
+    parts = os.path.normpath(relative_path).split(os.sep)
+    if parts[0] in ("environment", "movement") and len(parts) == 2:
+        # Step log segments are never appended to once shared (see StepLog),
+        # so they are hardlinked. The index (steps.idx) is appended to on
+        # every step, so it is copied like everything else.
+        if is_segment_file(parts[1]):
+            return True
+        stem = os.path.splitext(parts[1])[0]
+        return stem.isdigit() and int(stem) < step
+    return segment_base_name(parts[-1]) in SHARED_MEMORY_FILES
+
 
 class ReverieServer:
     def __init__(self, fork_sim_code, sim_code):
@@ -54,16 +99,31 @@ class ReverieServer:
 
         # <sim_code> indicates our current simulation. The first step here is to
         # copy everything that's in <fork_sim_code>, but edit its
-        # reverie/meta/json's fork variable.
+        # reverie/meta/json's fork variable. In "link" FORK_MODE, the files
+        # that never change (past steps, shared memory files) are hardlinked
+        # rather than copied.
         self.sim_code = sim_code
         self.sim_folder = f"{fs_storage}/{self.sim_code}"
-        copyanything(fork_folder, self.sim_folder)
+        with open(f"{fork_folder}/reverie/meta.json") as json_file:
+            fork_step = json.load(json_file)["step"]
+        if FORK_MODE == "link":
+            linkanything(
+                fork_folder,
+                self.sim_folder,
+                lambda relative_path: is_fork_history(relative_path, fork_step),
+            )
+        else:
+            copyanything(fork_folder, self.sim_folder)
 
         with open(f"{self.sim_folder}/reverie/meta.json") as json_file:
             reverie_meta = json.load(json_file)
 
+        # <parent_chain> lists the simulations this one descends from, the
+        # one it was forked from first.
+        self.parent_chain = [fork_sim_code] + reverie_meta.get("parent_chain", [])
         with open(f"{self.sim_folder}/reverie/meta.json", "w") as outfile:
             reverie_meta["fork_sim_code"] = fork_sim_code
+            reverie_meta["parent_chain"] = self.parent_chain
             outfile.write(json.dumps(reverie_meta, indent=2))
 
         # LOADING REVERIE'S GLOBAL VARIABLES
@@ -90,6 +150,10 @@ class ReverieServer:
         # (e.g., "double_studio") to instantiate Maze.
         # e.g., Maze("double_studio")
         self.maze = Maze(reverie_meta["maze_name"])
+        # The routes the personas walked in the forked simulation are likely
+        # to be walked again.
+        if PATH_CACHE_PERSIST == "on":
+            self.maze.load_path_cache(f"{self.sim_folder}/reverie/path_cache.json")
 
         # <step> denotes the number of steps that our game has taken. A step here
         # literally translates to the number of moves our personas made with respect
@@ -109,14 +173,28 @@ class ReverieServer:
         # e.g., ["Isabella Rodriguez"] = (58, 39)
         self.personas_tile = {}
 
-        # Loading in all personas.
-        init_env_file = f"{self.sim_folder}/environment/{str(self.step)}.json"
-        init_env = json.load(open(init_env_file))
-        for persona_name in reverie_meta["persona_names"]:
-            persona_folder = f"{self.sim_folder}/personas/{persona_name}"
+        # Loading in all personas. Their files are read concurrently; in lazy
+        # mode (PERSONA_LOADING), only the scratch is read here.
+        # <environment_log> and <movement_log> hold the per-step environment
+        # (written by the frontend) and movements (written by us).
+        self.environment_log = open_step_log(f"{self.sim_folder}/environment")
+        self.movement_log = open_step_log(f"{self.sim_folder}/movement")
+        init_env = self.environment_log.read(self.step)
+        persona_names = reverie_meta["persona_names"]
+        with ThreadPoolExecutor(max_workers=PERSONA_LOAD_WORKERS) as pool:
+            loaded_personas = list(
+                pool.map(
+                    lambda persona_name: Persona(
+                        persona_name,
+                        f"{self.sim_folder}/personas/{persona_name}",
+                        lazy=PERSONA_LOADING == "lazy",
+                    ),
+                    persona_names,
+                )
+            )
+        for persona_name, curr_persona in zip(persona_names, loaded_personas):
             p_x = init_env[persona_name]["x"]
             p_y = init_env[persona_name]["y"]
-            curr_persona = Persona(persona_name, persona_folder)
 
             self.personas[persona_name] = curr_persona
             self.personas_tile[persona_name] = (p_x, p_y)
@@ -125,9 +203,16 @@ class ReverieServer:
             )
 
         # REVERIE SETTINGS PARAMETERS:
-        # <server_sleep> denotes the amount of time that our while loop rests each
-        # cycle; this is to not kill our machine.
+        # <server_sleep> denotes the amount of time that the path tester's while
+        # loop rests each cycle; this is to not kill our machine.
         self.server_sleep = 0.1
+        # <step_wait> is the longest we wait for the frontend's environment of
+        # a step at a time. We are woken up as soon as it is written, so this
+        # only bounds how long a wait lasts before the loop checks again.
+        self.step_wait = 1.0
+        # <persona_workers> is the maximum number of personas whose cognitive
+        # sequence runs concurrently within a step. 1 means sequential.
+        self.persona_workers = PERSONA_WORKERS
 
         # SIGNALING THE FRONTEND SERVER:
         # curr_sim_code.json contains the current simulation code, and
@@ -158,6 +243,7 @@ class ReverieServer:
         # Save Reverie meta-information.
         reverie_meta = {
             "fork_sim_code": self.fork_sim_code,
+            "parent_chain": self.parent_chain,
             "start_date": self.start_time.strftime("%B %d, %Y"),
             "curr_time": self.curr_time.strftime("%B %d, %Y, %H:%M:%S"),
             "sec_per_step": self.sec_per_step,
@@ -168,6 +254,8 @@ class ReverieServer:
         reverie_meta_f = f"{self.sim_folder}/reverie/meta.json"
         with open(reverie_meta_f, "w") as outfile:
             outfile.write(json.dumps(reverie_meta, indent=2))
+        if PATH_CACHE_PERSIST == "on":
+            self.maze.save_path_cache(f"{self.sim_folder}/reverie/path_cache.json")
 
         # Save the personas.
         for persona_name, persona in self.personas.items():
@@ -270,16 +358,23 @@ class ReverieServer:
 
             time.sleep(self.server_sleep * 10)
 
-    def start_server(self, int_counter):
+    def start_server(self, int_counter, headless=False):
         """
         The main backend server of Reverie.
         This function retrieves the environment file from the frontend to
         understand the state of the world, calls on each persona to make
         decisions based on the world state, and saves their moves at certain step
         intervals.
+
+        In headless mode, no frontend is involved: each persona is taken to be
+        on the tile it moved to in the previous step, so the loop neither waits
+        for nor reads the environment log. Only the environment of the step
+        the run stops at is written, so that the simulation can be resumed
+        (with or without the frontend) or forked afterwards.
         INPUT
           int_counter: Integer value for the number of steps left for us to take
                        in this iteration.
+          headless: Whether to run without the frontend.
         OUTPUT
           None
         """
@@ -294,116 +389,195 @@ class ReverieServer:
         # <game_obj_cleanup> is used for that.
         game_obj_cleanup = {}
 
+        # <next_env> is the environment of the next step in headless mode. The
+        # first step starts from the environment the frontend last reported,
+        # if there is one for this step.
+        next_env = None
+        if headless:
+            next_env = self.environment_log.read(self.step)
+            if next_env is None:
+                next_env = self._environment(self.personas_tile)
+
         # The main while loop of Reverie.
         while int_counter != 0:
-            curr_env_file = f"{self.sim_folder}/environment/{self.step}.json"
-            if check_if_file_exists(curr_env_file):
-                # If we have an environment file, it means we have a new perception
-                # input to our personas. So we first retrieve it.
-                with contextlib.suppress(Exception):
-                    # Try and save block for robustness of the while loop.
-                    with open(curr_env_file) as json_file:
-                        new_env = json.load(json_file)
-                        env_retrieved = True
-                if env_retrieved:
-                    # This is where we go through <game_obj_cleanup> to clean up all
-                    # object actions that were used in this cycle.
-                    for key, val in game_obj_cleanup.items():
-                        # We turn all object actions to their blank form (with None).
-                        self.maze.turn_event_from_tile_idle(key, val)
-                    # Then we initialize game_obj_cleanup for this cycle.
-                    game_obj_cleanup = {}
-
-                    # We first move our personas in the backend environment to match
-                    # the frontend environment.
-                    for persona_name, persona in self.personas.items():
-                        # <curr_tile> is the tile that the persona was at previously.
-                        curr_tile = self.personas_tile[persona_name]
-                        # <new_tile> is the tile that the persona will move to right now,
-                        # during this cycle.
-                        new_tile = (
-                            new_env[persona_name]["x"],
-                            new_env[persona_name]["y"],
-                        )
+            # If the environment log has a record for this step, it means we
+            # have a new perception input to our personas. So we first
+            # retrieve it, waiting for the frontend to write it if need be.
+            new_env = next_env
+            if not headless:
+                try:
+                    new_env = self.environment_log.wait(
+                        self.step, timeout=self.step_wait
+                    )
+                except Exception:
+                    # The loop keeps going for robustness, but backs off first
+                    # so that a persistent error does not make it spin.
+                    traceback.print_exc()
+                    time.sleep(self.step_wait)
+                    continue
+            if new_env is not None:
+                # This is where we go through <game_obj_cleanup> to clean up all
+                # object actions that were used in this cycle.
+                for key, val in game_obj_cleanup.items():
+                    # We turn all object actions to their blank form (with None).
+                    self.maze.turn_event_from_tile_idle(key, val)
+                # Then we initialize game_obj_cleanup for this cycle.
+                game_obj_cleanup = {}
+
+                # We first move our personas in the backend environment to match
+                # the frontend environment.
+                for persona_name, persona in self.personas.items():
+                    # <curr_tile> is the tile that the persona was at previously.
+                    curr_tile = self.personas_tile[persona_name]
+                    # <new_tile> is the tile that the persona will move to right now,
+                    # during this cycle.
+                    new_tile = (
+                        new_env[persona_name]["x"],
+                        new_env[persona_name]["y"],
+                    )
 
-                        # We actually move the persona on the backend tile map here.
-                        self.personas_tile[persona_name] = new_tile
-                        self.maze.remove_subject_events_from_tile(
-                            persona.name, curr_tile
-                        )
+                    # We actually move the persona on the backend tile map here.
+                    self.personas_tile[persona_name] = new_tile
+                    self.maze.remove_subject_events_from_tile(
+                        persona.name, curr_tile
+                    )
+                    self.maze.add_event_from_tile(
+                        persona.scratch.get_curr_event_and_desc(), new_tile
+                    )
+
+                    # Now, the persona will travel to get to their destination. *Once*
+                    # the persona gets there, we activate the object action.
+                    if not persona.scratch.planned_path:
+                        # We add that new object action event to the backend tile map.
+                        # At its creation, it is stored in the persona's backend.
+                        game_obj_cleanup[
+                            persona.scratch.get_curr_obj_event_and_desc()
+                        ] = new_tile
                         self.maze.add_event_from_tile(
-                            persona.scratch.get_curr_event_and_desc(), new_tile
+                            persona.scratch.get_curr_obj_event_and_desc(), new_tile
                         )
-
-                        # Now, the persona will travel to get to their destination. *Once*
-                        # the persona gets there, we activate the object action.
-                        if not persona.scratch.planned_path:
-                            # We add that new object action event to the backend tile map.
-                            # At its creation, it is stored in the persona's backend.
-                            game_obj_cleanup[
-                                persona.scratch.get_curr_obj_event_and_desc()
-                            ] = new_tile
-                            self.maze.add_event_from_tile(
-                                persona.scratch.get_curr_obj_event_and_desc(), new_tile
-                            )
-                            # We also need to remove the temporary blank action for the
-                            # object that is currently taking the action.
-                            blank = (
-                                persona.scratch.get_curr_obj_event_and_desc()[0],
-                                None,
-                                None,
-                                None,
-                            )
-                            self.maze.remove_event_from_tile(blank, new_tile)
-
-                    # Then we need to actually have each of the personas perceive and
-                    # move. The movement for each of the personas comes in the form of
-                    # x y coordinates where the persona will move towards. e.g., (50, 34)
-                    # This is where the core brains of the personas are invoked.
-                    movements = {"persona": {}, "meta": {}}
-                    for persona_name, persona in self.personas.items():
-                        # <next_tile> is an x,y coordinate. e.g., (58, 9)
-                        # <pronunciation> is an emoji. e.g., "\ud83d\udca4"
-                        # <description> is a string description of the movement. e.g.,
-                        #   writing her next novel (editing her novel)
-                        #   @ double studio:double studio:common room:sofa
-                        next_tile, pronunciation, description = persona.move(
-                            self.maze,
-                            self.personas,
-                            self.personas_tile[persona_name],
-                            self.curr_time,
+                        # We also need to remove the temporary blank action for the
+                        # object that is currently taking the action.
+                        blank = (
+                            persona.scratch.get_curr_obj_event_and_desc()[0],
+                            None,
+                            None,
+                            None,
                         )
-                        movements["persona"][persona_name] = {
-                            "movement": next_tile,
-                            "pronunciation": pronunciation,
-                            "description": description,
-                            "chat": persona.scratch.chat,
+                        self.maze.remove_event_from_tile(blank, new_tile)
+
+                # Then we need to actually have each of the personas perceive and
+                # move. The movement for each of the personas comes in the form of
+                # x y coordinates where the persona will move towards. e.g., (50, 34)
+                # This is where the core brains of the personas are invoked.
+                movements = self._move_personas()
+                # Include the meta-information about the current stage in the
+                # movements' dictionary.
+                movements["meta"]["curr_time"] = self.curr_time.strftime(
+                    "%B %d, %Y, %H:%M:%S"
+                )
+
+                # We then write the personas' movements to the movement log, which
+                # the frontend server reads.
+                # Example JSON output:
+                # {"persona": {"Maria Lopez": {"movement": [58, 9]}},
+                #  "persona": {"Klaus Mueller": {"movement": [38, 12]}},
+                #  "meta": {curr_time: <datetime>}}
+                self.movement_log.append(self.step, movements)
+                if headless:
+                    next_env = self._environment(
+                        {
+                            persona_name: persona_move["movement"]
+                            for persona_name, persona_move in movements[
+                                "persona"
+                            ].items()
                         }
-                    # Include the meta-information about the current stage in the
-                    # movements' dictionary.
-                    movements["meta"]["curr_time"] = self.curr_time.strftime(
-                        "%B %d, %Y, %H:%M:%S"
                     )
 
-                    # We then write the personas' movements to a file that will be sent
-                    # to the frontend server.
-                    # Example JSON output:
-                    # {"persona": {"Maria Lopez": {"movement": [58, 9]}},
-                    #  "persona": {"Klaus Mueller": {"movement": [38, 12]}},
-                    #  "meta": {curr_time: <datetime>}}
-                    curr_move_file = f"{self.sim_folder}/movement/{self.step}.json"
-                    with open(curr_move_file, "w") as outfile:
-                        outfile.write(json.dumps(movements, indent=2))
-
-                    # After this cycle, the world takes one step forward, and the
-                    # current time moves by <sec_per_step> amount.
-                    self.step += 1
-                    self.curr_time += datetime.timedelta(seconds=self.sec_per_step)
-
-                    int_counter -= 1
-
-            # Sleep so we don't burn our machines.
-            time.sleep(self.server_sleep)
+                # After this cycle, the world takes one step forward, and the
+                # current time moves by <sec_per_step> amount.
+                self.step += 1
+                self.curr_time += datetime.timedelta(seconds=self.sec_per_step)
+
+                int_counter -= 1
+
+        if headless:
+            self.environment_log.append(self.step, next_env)
+
+    def _environment(self, tiles):
+        """
+        Builds an environment record in the form the frontend sends it.
+
+        INPUT
+          tiles: {<persona_name>: (x, y)}
+        OUTPUT
+          {<persona_name>: {"maze": <maze_name>, "x": x, "y": y}}
+        """
+        return {
+            persona_name: {"maze": self.maze.maze_name, "x": x, "y": y}
+            for persona_name, (x, y) in tiles.items()
+        }
+
+    def _move_personas(self):
+        """
+        Calls on each persona to perceive and move for the current step, and
+        collects their movements in the form that is sent to the frontend.
+
+        With <persona_workers> above 1, the personas' cognitive sequences run
+        concurrently on a thread pool -- each of them is dominated by blocking
+        LLM round-trips, so the threads overlap that latency. The maze is only
+        read during the moves (all tile-event mutations happen beforehand in
+        start_server), the personas' tiles are read from a snapshot taken at
+        the start of the step, a persona only reacts to another one while
+        holding the cognition locks of both (see plan._reaction_lock), and the
+        results are merged in <self.personas> order, so the movements
+        dictionary does not depend on which persona finishes first.
+
+        INPUT
+          None
+        OUTPUT
+          movements: {"persona": {<persona_name>: {"movement": ...,
+                                                   "pronunciation": ...,
+                                                   "description": ...,
+                                                   "chat": ...}},
+                      "meta": {}}
+        """
+
+        persona_tiles = dict(self.personas_tile)
+
+        def move(persona_name):
+            persona = self.personas[persona_name]
+            # <next_tile> is an x,y coordinate. e.g., (58, 9)
+            # <pronunciation> is an emoji. e.g., "\ud83d\udca4"
+            # <description> is a string description of the movement. e.g.,
+            #   writing her next novel (editing her novel)
+            #   @ double studio:double studio:common room:sofa
+            next_tile, pronunciation, description = persona.move(
+                self.maze,
+                self.personas,
+                persona_tiles[persona_name],
+                self.curr_time,
+                persona_tiles,
+            )
+            return {
+                "movement": next_tile,
+                "pronunciation": pronunciation,
+                "description": description,
+                "chat": persona.scratch.chat,
+            }
+
+        persona_names = list(self.personas.keys())
+        workers = min(self.persona_workers, len(persona_names))
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                persona_moves = list(pool.map(move, persona_names))
+        else:
+            persona_moves = [move(persona_name) for persona_name in persona_names]
+
+        movements = {"persona": {}, "meta": {}}
+        for persona_name, persona_move in zip(persona_names, persona_moves):
+            movements["persona"][persona_name] = persona_move
+        return movements
 
     def open_server(self):
         """
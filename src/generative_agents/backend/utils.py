@@ -15,6 +15,7 @@ __all__ = [
     "env_visuals",
     "fs_storage",
     "fs_temp_storage",
+    "fs_cache",
     "collision_block_id",
     "debug",
 ]
@@ -52,6 +53,7 @@ env_visuals = maze_assets_loc / "the_ville" / "visuals"
 
 fs_storage = ENVIRONMENT_DIR / "storage"
 fs_temp_storage = ENVIRONMENT_DIR / "temp_storage"
+fs_cache = ENVIRONMENT_DIR / "cache"
 
 collision_block_id = "32125"
 
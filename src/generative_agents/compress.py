@@ -13,13 +13,14 @@ from generative_agents.backend.global_methods import (
     find_filenames,
 )
 from generative_agents.backend.utils import fs_storage, ENVIRONMENT_DIR
+from generative_agents.steplog import StepLog
 
 
 def compress(sim_code: str) -> None:
     sim_storage = fs_storage / sim_code
     compressed_storage = ENVIRONMENT_DIR / "compressed_storage" / sim_code
     persona_folder = sim_storage / "personas"
-    move_folder = sim_storage / "movement"
+    movement_log = StepLog(sim_storage / "movement")
     meta_file = sim_storage / "reverie" / "meta.json"
 
     persona_names = []
@@ -28,44 +29,40 @@ def compress(sim_code: str) -> None:
         if x[0] != ".":
             persona_names += [x]
 
-    max_move_count = max(
-        int(i.split("/")[-1].split(".")[0])
-        for i in find_filenames(str(move_folder), "json")
-    )
+    max_move_count = movement_log.last_step()
 
     persona_last_move = {}
     master_move = {}
     for i in range(max_move_count + 1):
         master_move[i] = {}
-        with open(move_folder / f"{i}.json") as json_file:
-            i_move_dict = json.load(json_file)["persona"]
-            for p in persona_names:
-                move = False
-                if i == 0:
-                    move = True
-                elif (
-                    i_move_dict[p]["movement"] != persona_last_move[p]["movement"]
-                    or i_move_dict[p]["pronunciatio"]
-                    != persona_last_move[p]["pronunciatio"]
-                    or i_move_dict[p]["description"]
-                    != persona_last_move[p]["description"]
-                    or i_move_dict[p]["chat"] != persona_last_move[p]["chat"]
-                ):
-                    move = True
+        i_move_dict = movement_log.read(i)["persona"]
+        for p in persona_names:
+            move = False
+            if i == 0:
+                move = True
+            elif (
+                i_move_dict[p]["movement"] != persona_last_move[p]["movement"]
+                or i_move_dict[p]["pronunciatio"]
+                != persona_last_move[p]["pronunciatio"]
+                or i_move_dict[p]["description"]
+                != persona_last_move[p]["description"]
+                or i_move_dict[p]["chat"] != persona_last_move[p]["chat"]
+            ):
+                move = True
 
-                if move:
-                    persona_last_move[p] = {
-                        "movement": i_move_dict[p]["movement"],
-                        "pronunciatio": i_move_dict[p]["pronunciatio"],
-                        "description": i_move_dict[p]["description"],
-                        "chat": i_move_dict[p]["chat"],
-                    }
-                    master_move[i][p] = {
-                        "movement": i_move_dict[p]["movement"],
-                        "pronunciatio": i_move_dict[p]["pronunciatio"],
-                        "description": i_move_dict[p]["description"],
-                        "chat": i_move_dict[p]["chat"],
-                    }
+            if move:
+                persona_last_move[p] = {
+                    "movement": i_move_dict[p]["movement"],
+                    "pronunciatio": i_move_dict[p]["pronunciatio"],
+                    "description": i_move_dict[p]["description"],
+                    "chat": i_move_dict[p]["chat"],
+                }
+                master_move[i][p] = {
+                    "movement": i_move_dict[p]["movement"],
+                    "pronunciatio": i_move_dict[p]["pronunciatio"],
+                    "description": i_move_dict[p]["description"],
+                    "chat": i_move_dict[p]["chat"],
+                }
 
     create_folder_if_not_there(str(compressed_storage))
     with open(compressed_storage / "master_movement.json", "w") as outfile:
@@ -0,0 +1,295 @@
+"""
+File: steplog.py
+Description: Segmented, append-only log of per-step records. Each of the two
+per-step streams of a simulation (environment/, written by the frontend, and
+movement/, written by the backend) is stored as one record per step in
+segment files (steps-000000.jsonl, ...), plus a binary index (steps.idx) of
+fixed-size entries (step, segment, offset, length) for random access by step
+number. This replaces the thousands of tiny {step}.json files older
+simulations have; those are still read as a fallback.
+
+The writer and the readers can be different processes: a record is written
+to its segment before its index entry, and readers pick up new index entries
+as they appear. A step that is written again gets a new record; the last one
+wins. A reader that waits for a step (StepLog.wait) is woken up by the writer
+through a Unix datagram socket as soon as the record exists, instead of
+polling for it.
+
+This module only uses the standard library, so the frontend server can use
+it without importing the backend.
+"""
+
+import contextlib
+import hashlib
+import itertools
+import json
+import os
+import re
+import socket
+import struct
+import tempfile
+import threading
+import time
+
+__all__ = [
+    "INDEX_FILE",
+    "SEGMENT_BYTES",
+    "StepLog",
+    "WAIT_POLL_SECONDS",
+    "is_segment_file",
+    "open_step_log",
+]
+
+INDEX_FILE = "steps.idx"
+# Size after which a new segment is started.
+SEGMENT_BYTES = 64 * 1024 * 1024
+
+# How often a waiting reader checks for its step even without being woken up,
+# e.g. when the record was written by something other than a StepLog.
+WAIT_POLL_SECONDS = 1.0
+
+_ENTRY = struct.Struct("<qiqi")
+_SEGMENT_PATTERN = re.compile(r"^steps-(\d{6})\.jsonl$")
+_waiter_ids = itertools.count()
+
+
+def _segment_name(segment):
+    return f"steps-{segment:06d}.jsonl"
+
+
+def is_segment_file(name):
+    """Whether <name> is the file name of a log segment."""
+    return bool(_SEGMENT_PATTERN.match(name))
+
+
+def _waiter_folder(folder):
+    """
+    The folder in which the readers waiting on the log in <folder> bind their
+    sockets. It lives in the temporary directory rather than in <folder>,
+    since socket paths are limited to about a hundred characters.
+    """
+    digest = hashlib.sha1(os.path.abspath(folder).encode()).hexdigest()[:16]
+    return os.path.join(tempfile.gettempdir(), f"steplog-{digest}")
+
+
+class StepLog:
+    def __init__(self, folder, segment_bytes=SEGMENT_BYTES):
+        self.folder = str(folder)
+        self.segment_bytes = segment_bytes
+        # <_index> maps a step to its (segment, offset, length). <_index_bytes>
+        # is how much of the index file has been read.
+        self._index = {}
+        self._index_bytes = 0
+        self._segment = None
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        """Reads the index entries appended since the last refresh."""
+        path = os.path.join(self.folder, INDEX_FILE)
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            return
+        # Only whole entries count; a writer may be halfway through one.
+        size -= size % _ENTRY.size
+        if size <= self._index_bytes:
+            return
+        with open(path, "rb") as f:
+            f.seek(self._index_bytes)
+            data = f.read(size - self._index_bytes)
+        for step, segment, offset, length in _ENTRY.iter_unpack(data):
+            self._index[step] = (segment, offset, length)
+        self._index_bytes = size
+
+    def _writable_segment(self):
+        """The segment to append to, starting a new one when needed."""
+        if self._segment is None:
+            segments = [
+                int(match.group(1))
+                for match in map(_SEGMENT_PATTERN.match, os.listdir(self.folder))
+                if match
+            ]
+            self._segment = max(segments, default=0)
+        path = os.path.join(self.folder, _segment_name(self._segment))
+        if os.path.exists(path) and (
+            os.path.getsize(path) >= self.segment_bytes
+            # A segment shared with a forked simulation (hardlinked) is never
+            # appended to; the fork continues in a segment of its own.
+            or os.stat(path).st_nlink > 1
+        ):
+            self._segment += 1
+        return self._segment
+
+    def append(self, step, data):
+        """
+        Appends the record of a step.
+
+        INPUT:
+          step: The step number.
+          data: The JSON-serializable record.
+        """
+        line = json.dumps(data, separators=(",", ":")).encode() + b"\n"
+        with self._lock:
+            os.makedirs(self.folder, exist_ok=True)
+            segment = self._writable_segment()
+            path = os.path.join(self.folder, _segment_name(segment))
+            with open(path, "ab") as f:
+                offset = f.tell()
+                f.write(line)
+            with open(os.path.join(self.folder, INDEX_FILE), "ab") as f:
+                f.write(_ENTRY.pack(step, segment, offset, len(line)))
+            self._refresh()
+        self._notify()
+
+    def _notify(self):
+        """Wakes up the readers waiting on this log."""
+        if not hasattr(socket, "AF_UNIX"):
+            return
+        waiters = _waiter_folder(self.folder)
+        try:
+            names = os.listdir(waiters)
+        except FileNotFoundError:
+            return
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.setblocking(False)
+            for name in names:
+                path = os.path.join(waiters, name)
+                try:
+                    sock.sendto(b"\0", path)
+                except BlockingIOError:
+                    # The reader has a wake-up pending already.
+                    pass
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # Left behind by a reader that did not exit cleanly.
+                    with contextlib.suppress(OSError):
+                        os.remove(path)
+                except OSError:
+                    pass
+
+    @contextlib.contextmanager
+    def _waiter(self):
+        """A socket bound for wake-ups from writers, or None if unavailable."""
+        sock = None
+        if hasattr(socket, "AF_UNIX"):
+            waiters = _waiter_folder(self.folder)
+            path = os.path.join(waiters, f"{os.getpid()}-{next(_waiter_ids)}")
+            try:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+                try:
+                    os.makedirs(waiters, exist_ok=True)
+                    sock.bind(path)
+                except FileNotFoundError:
+                    # The folder was just removed by the last reader that
+                    # stopped waiting (see below); it is created again.
+                    os.makedirs(waiters, exist_ok=True)
+                    sock.bind(path)
+            except OSError:
+                if sock is not None:
+                    sock.close()
+                sock = None
+        try:
+            yield sock
+        finally:
+            if sock is not None:
+                sock.close()
+                with contextlib.suppress(OSError):
+                    os.remove(path)
+                # The folder is removed with its last socket; this fails while
+                # other readers are waiting.
+                with contextlib.suppress(OSError):
+                    os.rmdir(waiters)
+
+    def wait(self, step, timeout=None):
+        """
+        Waits for the record of a step to be written.
+
+        INPUT:
+          step: The step number.
+          timeout: The maximum number of seconds to wait, or None to wait
+                   indefinitely.
+        OUTPUT:
+          The record, or None if it was not written within <timeout>.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        # The socket is bound before the first check, so a record written
+        # in between still wakes us up.
+        with self._waiter() as sock:
+            while True:
+                data = self.read(step)
+                if data is not None:
+                    return data
+                pause = WAIT_POLL_SECONDS
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return None
+                    pause = min(pause, remaining)
+                if sock is None:
+                    time.sleep(pause)
+                    continue
+                sock.settimeout(pause)
+                with contextlib.suppress(TimeoutError):
+                    sock.recv(16)
+
+    def read(self, step):
+        """
+        Reads the record of a step.
+
+        INPUT:
+          step: The step number.
+        OUTPUT:
+          The record, or None if the step has not been written (yet).
+        """
+        with self._lock:
+            self._refresh()
+            entry = self._index.get(step)
+        if entry is None:
+            legacy = os.path.join(self.folder, f"{step}.json")
+            if not os.path.exists(legacy):
+                return None
+            with open(legacy) as f:
+                return json.load(f)
+        segment, offset, length = entry
+        with open(os.path.join(self.folder, _segment_name(segment)), "rb") as f:
+            f.seek(offset)
+            return json.loads(f.read(length))
+
+    def __contains__(self, step):
+        with self._lock:
+            self._refresh()
+            if step in self._index:
+                return True
+        return os.path.exists(os.path.join(self.folder, f"{step}.json"))
+
+    def steps(self):
+        """All steps with a record, in the log or as legacy files, sorted."""
+        with self._lock:
+            self._refresh()
+            steps = set(self._index)
+        if os.path.isdir(self.folder):
+            for name in os.listdir(self.folder):
+                stem, extension = os.path.splitext(name)
+                if extension == ".json" and stem.isdigit():
+                    steps.add(int(stem))
+        return sorted(steps)
+
+    def last_step(self):
+        """The highest step with a record, or None if there is none."""
+        steps = self.steps()
+        return steps[-1] if steps else None
+
+
+_open_logs = {}
+_open_logs_lock = threading.Lock()
+
+
+def open_step_log(folder):
+    """
+    The StepLog of <folder>, shared within the process so that its index is
+    only read once (and then incrementally).
+    """
+    key = os.path.abspath(str(folder))
+    with _open_logs_lock:
+        if key not in _open_logs:
+            _open_logs[key] = StepLog(key)
+        return _open_logs[key]
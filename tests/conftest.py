@@ -0,0 +1,20 @@
+"""Shared fixtures for the test suite."""
+
+from unittest.mock import patch
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def isolated_embedding_store(tmp_path):
+    """Keep tests from reading or writing the real on-disk embedding store."""
+    from generative_agents.backend.persona.prompt_template.embedding_store import (
+        EmbeddingStore,
+    )
+
+    store = EmbeddingStore(tmp_path / "embeddings.sqlite3")
+    with patch(
+        "generative_agents.backend.persona.prompt_template.gpt_structure.embedding_store",
+        store,
+    ):
+        yield store
@@ -0,0 +1,126 @@
+"""Tests and recall benchmark for the approximate retrieval index."""
+
+import datetime
+import json
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from generative_agents.backend.persona.cognitive_modules import retrieve
+from generative_agents.backend.persona.memory_structures import associative_memory
+from generative_agents.backend.persona.memory_structures.ann_index import IVFIndex
+
+
+def clustered_vectors(rng, n, dim=64, n_clusters=60, spread=0.35):
+    """Unit vectors around a set of topics, like real memory embeddings."""
+    centers = rng.normal(size=(n_clusters, dim))
+    vectors = centers[rng.integers(n_clusters, size=n)] + spread * rng.normal(
+        size=(n, dim)
+    )
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype(np.float32), centers
+
+
+def build_persona(folder, vectors, mode):
+    (folder / "embeddings.json").write_text("{}")
+    (folder / "nodes.json").write_text("{}")
+    (folder / "kw_strength.json").write_text(
+        json.dumps({"kw_strength_event": {}, "kw_strength_thought": {}})
+    )
+    rng = np.random.default_rng(3)
+    with patch.object(associative_memory, "RETRIEVAL_MODE", mode):
+        a_mem = associative_memory.AssociativeMemory(str(folder))
+    start = datetime.datetime(2023, 2, 13)
+    for i, vector in enumerate(vectors):
+        a_mem.add_event(
+            start + datetime.timedelta(minutes=i),
+            None,
+            "Klaus",
+            "is",
+            f"thing {i}",
+            f"memory {i}",
+            {"Klaus"},
+            int(rng.integers(1, 10)),
+            (f"memory {i}", vector.tolist()),
+            None,
+        )
+    scratch = SimpleNamespace(
+        recency_w=1,
+        relevance_w=1,
+        importance_w=1,
+        recency_decay=0.99,
+        curr_time=start + datetime.timedelta(days=7),
+    )
+    return SimpleNamespace(a_mem=a_mem, scratch=scratch)
+
+
+class TestIVFIndex:
+    def test_recall_against_brute_force(self):
+        rng = np.random.default_rng(0)
+        vectors, centers = clustered_vectors(rng, 4000)
+        index = IVFIndex(n_probe=8)
+        for row in range(len(vectors)):
+            index.add(vectors, row)
+        queries, _ = clustered_vectors(rng, 50)
+
+        hits = 0
+        for query, (rows, far) in zip(queries, index.search(vectors, queries, 20)):
+            exact = np.argsort(-(vectors @ query))[:20]
+            hits += len(set(rows.tolist()) & set(exact.tolist()))
+            assert len(far) > 0
+        assert hits / (20 * len(queries)) >= 0.9
+
+    def test_rows_added_after_training_are_searchable(self):
+        rng = np.random.default_rng(1)
+        vectors, _ = clustered_vectors(rng, 500)
+        index = IVFIndex(n_probe=4)
+        for row in range(400):
+            index.add(vectors, row)
+        index.search(vectors, vectors[:1], 5)  # trains on 400 rows
+        for row in range(400, 500):
+            index.add(vectors, row)
+        assert index.trained_size == 400
+        rows, _ = index.search(vectors, vectors[450:451], 1)[0]
+        assert rows.tolist() == [450]
+
+    def test_retrains_after_doubling(self):
+        rng = np.random.default_rng(2)
+        vectors, _ = clustered_vectors(rng, 300)
+        index = IVFIndex()
+        for row in range(100):
+            index.add(vectors, row)
+        index.search(vectors, vectors[:1], 5)
+        for row in range(100, 300):
+            index.add(vectors, row)
+        index.search(vectors, vectors[:1], 5)
+        assert index.trained_size == 300
+        assert sum(len(members) for members in index.lists) == 300
+
+
+@pytest.mark.parametrize("retrieve_fn", ["new_retrieve", "batch_retrieve"])
+def test_approximate_retrieve_recall(tmp_path, retrieve_fn):
+    """Recall of approximate retrieval against exact mode."""
+    rng = np.random.default_rng(5)
+    vectors, _ = clustered_vectors(rng, 3000)
+    focal_vectors, _ = clustered_vectors(rng, 8)
+    focal_points = [f"focal {i}" for i in range(len(focal_vectors))]
+
+    (tmp_path / "exact").mkdir()
+    (tmp_path / "approximate").mkdir()
+    exact = build_persona(tmp_path / "exact", vectors, "exact")
+    approximate = build_persona(tmp_path / "approximate", vectors, "approximate")
+
+    with (
+        patch.object(retrieve, "get_embeddings", lambda texts: focal_vectors),
+        patch.object(retrieve, "RETRIEVAL_ANN_MIN_NODES", 1000),
+    ):
+        expected = getattr(retrieve, retrieve_fn)(exact, focal_points, 30)
+        result = getattr(retrieve, retrieve_fn)(approximate, focal_points, 30)
+
+    hits = sum(
+        len({n.node_id for n in result[f]} & {n.node_id for n in expected[f]})
+        for f in focal_points
+    )
+    assert hits / (30 * len(focal_points)) >= 0.9
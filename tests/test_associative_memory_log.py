@@ -0,0 +1,216 @@
+"""Tests for the append-only persistence of the associative memory."""
+
+import datetime
+import json
+import os
+import sys
+import threading
+
+import pytest
+
+from generative_agents.backend.persona.memory_structures.associative_memory import (
+    LEGACY_NODES_FILE,
+    NODE_LOG_FILE,
+    AssociativeMemory,
+)
+
+START = datetime.datetime(2023, 2, 13, 8)
+
+
+def add_nodes(a_mem, first, count):
+    for i in range(first, first + count):
+        add = a_mem.add_thought if i % 3 == 0 else a_mem.add_event
+        add(
+            START + datetime.timedelta(minutes=i),
+            None,
+            "Isabella",
+            "is",
+            f"thing {i}",
+            f"memory {i}",
+            {"Isabella", f"thing {i}"},
+            i % 9 + 1,
+            (f"memory {i}", [float(i), 1.0, 0.5]),
+            None,
+        )
+
+
+@pytest.fixture
+def legacy_folder(tmp_path):
+    (tmp_path / "embeddings.json").write_text("{}")
+    (tmp_path / LEGACY_NODES_FILE).write_text("{}")
+    (tmp_path / "kw_strength.json").write_text(
+        json.dumps({"kw_strength_event": {}, "kw_strength_thought": {}})
+    )
+    return tmp_path
+
+
+def summary(a_mem):
+    records = [AssociativeMemory.node_record(node) for node in a_mem._nodes]
+    for record in records:
+        # Keywords are a set; their order is not preserved.
+        record["keywords"] = sorted(record["keywords"])
+    return records
+
+
+class TestNodeLog:
+    def test_legacy_json_is_converted(self, legacy_folder):
+        a_mem = AssociativeMemory(str(legacy_folder))
+        add_nodes(a_mem, 0, 5)
+        a_mem.save(str(legacy_folder))
+        assert not (legacy_folder / LEGACY_NODES_FILE).exists()
+
+        reloaded = AssociativeMemory(str(legacy_folder))
+        assert summary(reloaded) == summary(a_mem)
+        assert reloaded.kw_strength_event == a_mem.kw_strength_event
+        assert list(reloaded.id_to_node) == list(a_mem.id_to_node)
+
+    def test_shared_log_is_continued_in_a_new_segment(self, legacy_folder, tmp_path):
+        a_mem = AssociativeMemory(str(legacy_folder))
+        add_nodes(a_mem, 0, 5)
+        a_mem.save(str(legacy_folder))
+        before = (legacy_folder / NODE_LOG_FILE).read_bytes()
+        # A fork hardlinks the log (see linkanything).
+        os.link(legacy_folder / NODE_LOG_FILE, tmp_path / "fork_nodes.jsonl")
+
+        add_nodes(a_mem, 5, 2)
+        a_mem.save(str(legacy_folder))
+        assert (legacy_folder / NODE_LOG_FILE).read_bytes() == before
+        assert (legacy_folder / "nodes.1.jsonl").read_bytes().count(b"\n") == 2
+        reloaded = AssociativeMemory(str(legacy_folder))
+        assert summary(reloaded) == summary(a_mem)
+
+        add_nodes(a_mem, 7, 1)
+        a_mem.save(str(legacy_folder))
+        assert (legacy_folder / "nodes.1.jsonl").read_bytes().count(b"\n") == 3
+
+        a_mem.save(str(legacy_folder), compact=True)
+        assert not (legacy_folder / "nodes.1.jsonl").exists()
+        assert summary(AssociativeMemory(str(legacy_folder))) == summary(a_mem)
+
+    def test_save_only_appends_new_nodes(self, legacy_folder):
+        a_mem = AssociativeMemory(str(legacy_folder))
+        add_nodes(a_mem, 0, 5)
+        a_mem.save(str(legacy_folder))
+        before = (legacy_folder / NODE_LOG_FILE).read_bytes()
+
+        a_mem = AssociativeMemory(str(legacy_folder))
+        add_nodes(a_mem, 5, 2)
+        a_mem.save(str(legacy_folder))
+        after = (legacy_folder / NODE_LOG_FILE).read_bytes()
+        assert after.startswith(before)
+        assert after[len(before) :].count(b"\n") == 2
+
+        a_mem.save(str(legacy_folder))
+        assert (legacy_folder / NODE_LOG_FILE).read_bytes() == after
+        assert summary(AssociativeMemory(str(legacy_folder))) == summary(a_mem)
+
+    def test_partial_last_line_is_ignored(self, legacy_folder):
+        a_mem = AssociativeMemory(str(legacy_folder))
+        add_nodes(a_mem, 0, 3)
+        a_mem.save(str(legacy_folder))
+        with open(legacy_folder / NODE_LOG_FILE, "ab") as f:
+            f.write(b'{"node_id": "node_4", "ty')
+
+        a_mem = AssociativeMemory(str(legacy_folder))
+        assert len(a_mem._nodes) == 3
+        add_nodes(a_mem, 3, 1)
+        a_mem.save(str(legacy_folder))
+        reloaded = AssociativeMemory(str(legacy_folder))
+        assert summary(reloaded) == summary(a_mem)
+
+    def test_save_to_other_folder_writes_everything(self, legacy_folder, tmp_path):
+        a_mem = AssociativeMemory(str(legacy_folder))
+        add_nodes(a_mem, 0, 4)
+        a_mem.save(str(legacy_folder))
+
+        a_mem = AssociativeMemory(str(legacy_folder))
+        add_nodes(a_mem, 4, 1)
+        fork = tmp_path / "fork"
+        fork.mkdir()
+        a_mem.save(str(fork))
+        assert summary(AssociativeMemory(str(fork))) == summary(a_mem)
+        assert len(AssociativeMemory(str(legacy_folder))._nodes) == 4
+
+    def test_compaction_drops_superseded_embeddings(self, legacy_folder):
+        a_mem = AssociativeMemory(str(legacy_folder))
+        add_nodes(a_mem, 0, 4)
+        a_mem.save(str(legacy_folder))
+        a_mem.embeddings["memory 0"] = [7.0, 7.0, 7.0]
+        a_mem.save(str(legacy_folder), compact=True)
+        assert a_mem.embeddings.dead_rows() == 0
+        assert (legacy_folder / "embeddings.f32").stat().st_size == 4 * 3 * 4
+        assert summary(AssociativeMemory(str(legacy_folder))) == summary(a_mem)
+
+
+class TestNewestFirstViews:
+    def test_sequences_and_keyword_indexes_are_newest_first(self, legacy_folder):
+        a_mem = AssociativeMemory(str(legacy_folder))
+        add_nodes(a_mem, 0, 7)
+        events = [node for node in a_mem._nodes if node.type == "event"][::-1]
+        assert list(a_mem.seq_event) == events
+        assert a_mem.seq_event[0] is events[0]
+        assert a_mem.seq_event[-1] is events[-1]
+        assert a_mem.seq_event[:2] == events[:2]
+        assert a_mem.seq_event + a_mem.seq_thought == events + list(
+            a_mem.seq_thought
+        )
+        assert [node.type_count for node in a_mem.seq_thought] == [3, 2, 1]
+        assert list(a_mem.kw_to_event["isabella"]) == events
+        assert "thing 1" in a_mem.kw_to_event
+        assert a_mem.get_summarized_latest_events(1) == {events[0].spo_summary()}
+
+
+class TestConceptNode:
+    def test_node_fields_are_views_of_the_columns(self, legacy_folder):
+        a_mem = AssociativeMemory(str(legacy_folder))
+        add_nodes(a_mem, 0, 4)
+        node = a_mem.id_to_node["node_2"]
+        assert not hasattr(node, "__dict__")
+        assert node.node_count == 2
+        assert node.type == "event"
+        assert node.created == START + datetime.timedelta(minutes=1)
+        assert node.last_accessed == node.created
+        assert node.expiration is None
+        assert node.poignancy == 2
+        assert node.keywords == {"Isabella", "thing 1"}
+
+        later = START + datetime.timedelta(hours=3)
+        node.last_accessed = later
+        assert node.last_accessed == later
+        assert a_mem._last_accessed[1] - a_mem._last_accessed[0] == (
+            (later - START) // datetime.timedelta(microseconds=1)
+        )
+        a_mem.mark_accessed([a_mem.id_to_node["node_1"]], later)
+        assert a_mem.id_to_node["node_1"].last_accessed == later
+
+    def test_concurrent_accesses_keep_the_recency_order_consistent(
+        self, legacy_folder
+    ):
+        a_mem = AssociativeMemory(str(legacy_folder))
+        add_nodes(a_mem, 0, 60)
+        nodes = list(a_mem.id_to_node.values())
+
+        def access(offset):
+            for step in range(200):
+                curr_time = START + datetime.timedelta(hours=1, seconds=step)
+                a_mem.mark_accessed(nodes[offset::4], curr_time)
+
+        # Switch threads as often as possible to provoke interleaved updates.
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        threads = [threading.Thread(target=access, args=(i,)) for i in range(4)]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(interval)
+
+        assert a_mem._recency_keys == sorted(a_mem._recency_keys)
+        assert sorted(a_mem.recency_order()) == sorted(
+            node.node_count - 1 for node in nodes
+        )
+        assert [a_mem._recency_key(row) for row in a_mem.recency_order()] == (
+            a_mem._recency_keys
+        )
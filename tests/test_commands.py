@@ -129,6 +129,12 @@ class TestSimulationCommands:
         dispatch(server, "run 500")
         server.start_server.assert_called_once_with(500)
 
+    def test_cmd_run_headless(self):
+        server = MagicMock()
+        result = dispatch(server, "run headless 20")
+        server.start_server.assert_called_once_with(20, headless=True)
+        assert result.action == CommandAction.CONTINUE
+
 
 class TestInspectionCommands:
     """Tests for inspection commands."""
@@ -196,6 +202,19 @@ class TestInspectionCommands:
         assert "world" in result.output
         assert "test_world" in result.output
 
+    def test_cmd_print_path_cache_stats(self):
+        server = MagicMock()
+        server.maze.path_cache.stats.return_value = {
+            "hits": 3,
+            "misses": 1,
+            "entries": 1,
+            "max_entries": 10,
+        }
+        server.maze.collision_revision = 0
+        result = dispatch(server, "print path cache stats")
+        assert "hits: 3" in result.output
+        assert "hit rate: 75.0%" in result.output
+
 
 class TestToolsCommands:
     """Tests for tool commands."""
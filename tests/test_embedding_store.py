@@ -0,0 +1,164 @@
+"""Tests for the shared embedding store."""
+
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from generative_agents.backend.persona.prompt_template import gpt_structure
+from generative_agents.backend.persona.prompt_template.embedding_store import (
+    EmbeddingStore,
+    normalize_embedding_text,
+)
+
+
+def _raw_response(response):
+    """What a with_raw_response create method returns."""
+    return MagicMock(headers={}, parse=MagicMock(return_value=response))
+
+
+def _raw_embeddings():
+    return gpt_structure.transport.client.embeddings.with_raw_response
+
+
+def _embedding_response(vector):
+    response = MagicMock()
+    response.data = [MagicMock(embedding=vector)]
+    return _raw_response(response)
+
+
+class TestEmbeddingStore:
+    def test_put_get_roundtrip_is_exact(self, tmp_path):
+        store = EmbeddingStore(tmp_path / "e.sqlite3")
+        vector = [0.1, -0.2, 1 / 3]
+        store.put("m", "idle", vector)
+        assert EmbeddingStore(tmp_path / "e.sqlite3").get("m", "idle") == vector
+
+    def test_keyed_on_model(self, tmp_path):
+        store = EmbeddingStore(tmp_path / "e.sqlite3")
+        store.put("m1", "idle", [1.0])
+        assert store.get("m2", "idle") is None
+        assert len(store) == 1
+
+    def test_put_many_writes_one_transaction(self, tmp_path):
+        store = EmbeddingStore(tmp_path / "e.sqlite3")
+        store.put_many("m", [("a", [1.0]), ("b", [2.0, 0.5])])
+        reopened = EmbeddingStore(tmp_path / "e.sqlite3")
+        assert reopened.get_many("m", ["a", "b", "c"]) == {
+            "a": [1.0],
+            "b": [2.0, 0.5],
+        }
+        assert reopened.cached("m", ["a", "c"]) == {"a": [1.0]}
+
+    def test_memory_is_bounded(self, tmp_path):
+        # Room for two 4-dimensional float64 vectors.
+        store = EmbeddingStore(tmp_path / "e.sqlite3", max_memory_bytes=64)
+        store.put_many("m", [(text, [1.0] * 4) for text in "abc"])
+        assert list(store.memory) == [("m", "b"), ("m", "c")]
+        # Dropped embeddings are read from the file again.
+        assert store.get("m", "a") == [1.0] * 4
+        assert list(store.memory) == [("m", "c"), ("m", "a")]
+
+    def test_normalization(self):
+        assert normalize_embedding_text(" bed\nis idle ") == "bed is idle"
+        assert normalize_embedding_text("\n") == "this is blank"
+
+
+class TestGetEmbedding:
+    def test_one_request_per_text(self, isolated_embedding_store):
+        create = AsyncMock(return_value=_embedding_response([0.5, 0.5]))
+        with patch.object(_raw_embeddings(), "create", create):
+            assert gpt_structure.get_embedding("bed is idle") == [0.5, 0.5]
+            assert gpt_structure.get_embedding("bed is idle\n") == [0.5, 0.5]
+        assert create.call_count == 1
+        assert len(isolated_embedding_store) == 1
+
+    def test_concurrent_requests_share_one_call(self):
+        create = AsyncMock(return_value=_embedding_response([0.5]))
+        with patch.object(_raw_embeddings(), "create", create):
+            results = gpt_structure.gather_requests(
+                *(gpt_structure.get_embedding_async("idle") for _ in range(5))
+            )
+        assert results == [[0.5]] * 5
+        assert create.call_count == 1
+
+    def test_callers_during_a_store_lookup_share_one_call(
+        self, isolated_embedding_store
+    ):
+        get_many = isolated_embedding_store.get_many
+
+        def slow_get_many(model, texts):
+            time.sleep(0.05)
+            return get_many(model, texts)
+
+        create = AsyncMock(return_value=_embedding_response([0.5]))
+        with (
+            patch.object(isolated_embedding_store, "get_many", slow_get_many),
+            patch.object(_raw_embeddings(), "create", create),
+        ):
+            results = gpt_structure.gather_requests(
+                gpt_structure.get_embedding_async("idle"),
+                gpt_structure.get_embeddings_async(["idle", "bed"]),
+            )
+        assert results == [[0.5], [[0.5], [0.5]]]
+        # Each text is requested once, although both callers missed it.
+        requested = [text for c in create.call_args_list for text in c.kwargs["input"]]
+        assert sorted(requested) == ["bed", "idle"]
+
+    def test_store_errors_do_not_lose_embeddings(self, isolated_embedding_store):
+        create = AsyncMock(return_value=_embedding_response([0.5]))
+        with (
+            patch.object(
+                isolated_embedding_store, "put_many", side_effect=OSError("disk full")
+            ),
+            patch.object(_raw_embeddings(), "create", create),
+        ):
+            assert gpt_structure.get_embedding("idle") == [0.5]
+        assert create.call_count == 1
+
+
+class TestGetEmbeddings:
+    @staticmethod
+    def _create():
+        async def create(input, model):
+            response = MagicMock()
+            response.data = [MagicMock(embedding=[float(len(text))]) for text in input]
+            return _raw_response(response)
+
+        return AsyncMock(side_effect=create)
+
+    def test_one_request_in_input_order(self):
+        create = self._create()
+        with patch.object(_raw_embeddings(), "create", create):
+            result = gpt_structure.get_embeddings(["a", "bbb", "a", "cc\n"])
+        assert result == [[1.0], [3.0], [1.0], [2.0]]
+        create.assert_called_once()
+        assert create.call_args.kwargs["input"] == ["a", "bbb", "cc"]
+
+    def test_skips_stored_texts(self, isolated_embedding_store):
+        isolated_embedding_store.put(
+            gpt_structure.MODEL_RETRIEVE_EMBEDDING, "idle", [9.0]
+        )
+        create = self._create()
+        with patch.object(_raw_embeddings(), "create", create):
+            assert gpt_structure.get_embeddings(["idle", "ab"]) == [[9.0], [2.0]]
+        assert create.call_args.kwargs["input"] == ["ab"]
+
+    def test_chunks_by_item_limit(self):
+        create = self._create()
+        with (
+            patch.object(gpt_structure, "EMBEDDING_BATCH_SIZE", 2),
+            patch.object(_raw_embeddings(), "create", create),
+        ):
+            result = gpt_structure.get_embeddings(["a", "b", "c", "d", "e"])
+        assert result == [[1.0]] * 5
+        assert [len(c.kwargs["input"]) for c in create.call_args_list] == [2, 2, 1]
+
+    def test_chunks_by_token_limit(self):
+        with patch.object(gpt_structure, "EMBEDDING_BATCH_TOKENS", 14):
+            batches = list(
+                gpt_structure._embedding_batches(["x" * 30, "x" * 9, "x" * 9])
+            )
+        # 30 chars ~ 11 tokens, 9 chars ~ 4 tokens.
+        assert batches == [["x" * 30], ["x" * 9, "x" * 9]]
+
+    def test_empty(self):
+        assert gpt_structure.get_embeddings([]) == []
@@ -0,0 +1,88 @@
+"""Tests for the binary, memory-mapped embedding table."""
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+from generative_agents.backend.persona.memory_structures.embedding_table import (
+    KEYS_FILE,
+    LEGACY_FILE,
+    ROWS_FILE,
+    EmbeddingTable,
+)
+
+
+@pytest.fixture
+def legacy_folder(tmp_path):
+    embeddings = {"bed is idle": [0.1, 0.2, 0.3], 'quote " and\nnewline': [1, 2, 3]}
+    (tmp_path / LEGACY_FILE).write_text(json.dumps(embeddings))
+    return tmp_path
+
+
+class TestEmbeddingTable:
+    def test_reads_and_converts_legacy_json(self, legacy_folder):
+        table = EmbeddingTable(legacy_folder)
+        assert len(table) == 2
+        np.testing.assert_allclose(table["bed is idle"], [0.1, 0.2, 0.3], rtol=1e-6)
+
+        table.save(legacy_folder)
+        assert not (legacy_folder / LEGACY_FILE).exists()
+        reloaded = EmbeddingTable(legacy_folder)
+        assert isinstance(reloaded._segments[0], np.memmap)
+        assert set(reloaded) == {"bed is idle", 'quote " and\nnewline'}
+        assert reloaded['quote " and\nnewline'].tolist() == [1, 2, 3]
+
+    def test_save_only_appends(self, legacy_folder):
+        table = EmbeddingTable(legacy_folder)
+        table.save(legacy_folder)
+        before = (legacy_folder / ROWS_FILE).read_bytes()
+
+        table = EmbeddingTable(legacy_folder)
+        table["new"] = [4, 5, 6]
+        table.save(legacy_folder)
+        after = (legacy_folder / ROWS_FILE).read_bytes()
+        assert after.startswith(before)
+        assert len(after) - len(before) == 3 * 4
+        assert EmbeddingTable(legacy_folder)["new"].tolist() == [4, 5, 6]
+
+    def test_setting_same_vector_adds_no_row(self, legacy_folder):
+        table = EmbeddingTable(legacy_folder)
+        table.save(legacy_folder)
+        table["bed is idle"] = table["bed is idle"]
+        table.save(legacy_folder)
+        assert os.path.getsize(legacy_folder / ROWS_FILE) == 2 * 3 * 4
+
+    def test_updated_key_last_row_wins(self, legacy_folder):
+        table = EmbeddingTable(legacy_folder)
+        table.save(legacy_folder)
+        table["bed is idle"] = [9, 9, 9]
+        table.save(legacy_folder)
+        reloaded = EmbeddingTable(legacy_folder)
+        assert reloaded["bed is idle"].tolist() == [9, 9, 9]
+        assert len(reloaded) == 2
+
+    def test_ignores_interrupted_append(self, legacy_folder):
+        table = EmbeddingTable(legacy_folder)
+        table.save(legacy_folder)
+        # A row whose key never made it to disk, and a partial key line.
+        with open(legacy_folder / ROWS_FILE, "ab") as f:
+            f.write(np.zeros(3, np.float32).tobytes())
+        with open(legacy_folder / KEYS_FILE, "ab") as f:
+            f.write(b'"partial')
+
+        table = EmbeddingTable(legacy_folder)
+        assert len(table) == 2
+        table["next"] = [7, 8, 9]
+        table.save(legacy_folder)
+        reloaded = EmbeddingTable(legacy_folder)
+        assert reloaded["next"].tolist() == [7, 8, 9]
+        assert len(reloaded) == 3
+
+    def test_save_to_other_folder_writes_full_copy(self, legacy_folder, tmp_path):
+        table = EmbeddingTable(legacy_folder)
+        table.save(legacy_folder)
+        other = tmp_path / "other"
+        EmbeddingTable(legacy_folder).save(other)
+        assert len(EmbeddingTable(other)) == 2
@@ -0,0 +1,139 @@
+"""Tests for copy-on-write forking of simulation folders."""
+
+import json
+import os
+
+import pytest
+
+from generative_agents.backend.global_methods import (
+    linkanything,
+    segment_base_name,
+    segment_path,
+    segment_paths,
+)
+from generative_agents.backend.persona.memory_structures.embedding_table import (
+    EmbeddingTable,
+)
+from generative_agents.backend.server import is_fork_history
+
+
+@pytest.fixture
+def sim(tmp_path):
+    sim = tmp_path / "base"
+    for step in range(3):
+        (sim / "environment").mkdir(parents=True, exist_ok=True)
+        (sim / "environment" / f"{step}.json").write_text(json.dumps({"step": step}))
+    (sim / "movement").mkdir()
+    (sim / "movement" / "0.json").write_text("{}")
+    (sim / "movement" / "1.json").write_text("{}")
+    (sim / "reverie").mkdir()
+    (sim / "reverie" / "meta.json").write_text(json.dumps({"step": 2}))
+    memory = sim / "personas" / "A" / "bootstrap_memory" / "associative_memory"
+    memory.mkdir(parents=True)
+    (memory / "kw_strength.json").write_text("{}")
+    (memory / "embeddings.json").write_text(json.dumps({"key": [1.0, 2.0]}))
+    table = EmbeddingTable(memory)
+    table.save(memory)
+    return sim
+
+
+def fork(sim, tmp_path):
+    dst = tmp_path / "fork"
+    linkanything(sim, dst, lambda path: is_fork_history(path, 2))
+    return dst
+
+
+def linked(a, b):
+    return os.path.samefile(a, b)
+
+
+class TestFork:
+    def test_history_is_linked_and_state_copied(self, sim, tmp_path):
+        dst = fork(sim, tmp_path)
+        memory = "personas/A/bootstrap_memory/associative_memory"
+        assert linked(sim / "environment/0.json", dst / "environment/0.json")
+        assert linked(sim / "movement/1.json", dst / "movement/1.json")
+        assert linked(sim / memory / "embeddings.f32", dst / memory / "embeddings.f32")
+        # The current step and files that are rewritten in place are copies.
+        assert not linked(sim / "environment/2.json", dst / "environment/2.json")
+        assert not linked(sim / "reverie/meta.json", dst / "reverie/meta.json")
+        assert not linked(
+            sim / memory / "kw_strength.json", dst / memory / "kw_strength.json"
+        )
+
+    def test_appending_in_fork_leaves_parent_unchanged(self, sim, tmp_path):
+        dst = fork(sim, tmp_path)
+        memory = "personas/A/bootstrap_memory/associative_memory"
+        before = (sim / memory / "embeddings.f32").read_bytes()
+
+        table = EmbeddingTable(dst / memory)
+        table["new"] = [3.0, 4.0]
+        table.save(dst / memory)
+        assert (sim / memory / "embeddings.f32").read_bytes() == before
+        assert "new" not in EmbeddingTable(sim / memory)
+        assert EmbeddingTable(dst / memory)["new"].tolist() == [3.0, 4.0]
+
+    def test_shared_segments_stay_linked(self, sim, tmp_path):
+        dst = fork(sim, tmp_path)
+        memory = "personas/A/bootstrap_memory/associative_memory"
+
+        table = EmbeddingTable(dst / memory)
+        table["new"] = [3.0, 4.0]
+        table.save(dst / memory)
+        # The rows saved before the fork are still shared; the new row went
+        # to a segment of the fork's own.
+        for name in ("embeddings.f32", "embedding_keys.jsonl"):
+            assert linked(sim / memory / name, dst / memory / name)
+        assert (dst / memory / "embeddings.1.f32").stat().st_size == 2 * 4
+        assert not (sim / memory / "embeddings.1.f32").exists()
+
+        # Further saves append to the fork's segment.
+        table["newer"] = [5.0, 6.0]
+        table.save(dst / memory)
+        assert (dst / memory / "embeddings.1.f32").stat().st_size == 2 * 2 * 4
+        reloaded = EmbeddingTable(dst / memory)
+        assert reloaded["key"].tolist() == [1.0, 2.0]
+        assert reloaded["newer"].tolist() == [5.0, 6.0]
+
+    def test_parent_continues_in_a_new_segment(self, sim, tmp_path):
+        dst = fork(sim, tmp_path)
+        memory = "personas/A/bootstrap_memory/associative_memory"
+
+        table = EmbeddingTable(sim / memory)
+        table["parent"] = [7.0, 8.0]
+        table.save(sim / memory)
+        assert linked(sim / memory / "embeddings.f32", dst / memory / "embeddings.f32")
+        assert "parent" not in EmbeddingTable(dst / memory)
+
+    def test_compaction_removes_later_segments(self, sim, tmp_path):
+        dst = fork(sim, tmp_path)
+        memory = dst / "personas/A/bootstrap_memory/associative_memory"
+
+        table = EmbeddingTable(memory)
+        table["new"] = [3.0, 4.0]
+        table.save(memory)
+        table.save(memory, compact=True)
+        assert segment_paths(memory, "embeddings.f32") == [
+            str(memory / "embeddings.f32")
+        ]
+        assert sorted(EmbeddingTable(memory)) == ["key", "new"]
+
+
+class TestSegments:
+    def test_segment_names(self, tmp_path):
+        assert segment_path(tmp_path, "nodes.jsonl", 0) == str(
+            tmp_path / "nodes.jsonl"
+        )
+        assert segment_path(tmp_path, "nodes.jsonl", 2) == str(
+            tmp_path / "nodes.2.jsonl"
+        )
+        assert segment_base_name("nodes.2.jsonl") == "nodes.jsonl"
+        assert segment_base_name("embeddings.1.f32") == "embeddings.f32"
+        assert segment_base_name("nodes.jsonl") == "nodes.jsonl"
+        assert segment_base_name("embeddings_meta.json") == "embeddings_meta.json"
+
+    def test_memory_segments_are_fork_history(self):
+        memory = "personas/A/bootstrap_memory/associative_memory"
+        assert is_fork_history(f"{memory}/nodes.3.jsonl", 2)
+        assert is_fork_history(f"{memory}/embedding_keys.1.jsonl", 2)
+        assert not is_fork_history(f"{memory}/embeddings_meta.json", 2)
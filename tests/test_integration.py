@@ -3,7 +3,7 @@
 import os
 import sys
 import pytest
-from unittest.mock import patch, MagicMock
+from unittest.mock import AsyncMock, patch, MagicMock
 
 
 @pytest.fixture
@@ -26,27 +26,31 @@ def test_gpt_structure_functions_use_configured_models(mock_env):
         MODEL_RETRIEVE_EMBEDDING,
     )
 
-    # Mock the OpenAI client
+    # Mock the transport's AsyncOpenAI client
     with patch(
-        "generative_agents.backend.persona.prompt_template.gpt_structure.client"
+        "generative_agents.backend.persona.prompt_template.gpt_structure.transport.client"
     ) as mock_client:
         # Setup mock responses
         mock_completion = MagicMock()
         mock_completion.choices = [
             MagicMock(message=MagicMock(content="test response"))
         ]
-        mock_client.chat.completions.create.return_value = mock_completion
+        mock_client.chat.completions.with_raw_response.create = AsyncMock(
+            return_value=MagicMock(
+                headers={}, parse=MagicMock(return_value=mock_completion)
+            )
+        )
 
         # Test ChatGPT_request uses MODEL_PLAN
         result = ChatGPT_request("test prompt")
-        mock_client.chat.completions.create.assert_called_with(
+        mock_client.chat.completions.with_raw_response.create.assert_called_with(
             model=MODEL_PLAN, messages=[{"role": "user", "content": "test prompt"}]
         )
         assert result == "test response"
 
         # Test GPT4_request uses MODEL_REFLECT
         result = GPT4_request("test prompt")
-        mock_client.chat.completions.create.assert_called_with(
+        mock_client.chat.completions.with_raw_response.create.assert_called_with(
             model=MODEL_REFLECT, messages=[{"role": "user", "content": "test prompt"}]
         )
         assert result == "test response"
@@ -54,10 +58,14 @@ def test_gpt_structure_functions_use_configured_models(mock_env):
         # Test get_embedding uses MODEL_RETRIEVE_EMBEDDING
         mock_embedding = MagicMock()
         mock_embedding.data = [MagicMock(embedding=[0.1, 0.2, 0.3])]
-        mock_client.embeddings.create.return_value = mock_embedding
+        mock_client.embeddings.with_raw_response.create = AsyncMock(
+            return_value=MagicMock(
+                headers={}, parse=MagicMock(return_value=mock_embedding)
+            )
+        )
 
         result = get_embedding("test text")
-        mock_client.embeddings.create.assert_called_with(
+        mock_client.embeddings.with_raw_response.create.assert_called_with(
             input=["test text"], model=MODEL_RETRIEVE_EMBEDDING
         )
         assert result == [0.1, 0.2, 0.3]
@@ -0,0 +1,250 @@
+"""Tests for the persistent LLM response cache."""
+
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from generative_agents.backend.commands import dispatch
+from generative_agents.backend.commands import inspection
+from generative_agents.backend.persona.prompt_template import gpt_structure
+from generative_agents.backend.persona.prompt_template.embedding_store import (
+    EmbeddingStore,
+)
+from generative_agents.backend.persona.prompt_template.llm_cache import (
+    CacheMissError,
+    ResponseCache,
+)
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return tmp_path / "llm_responses.sqlite3"
+
+
+class TestResponseCache:
+    def test_miss_then_hit(self, cache_path):
+        cache = ResponseCache(cache_path, 1024 * 1024)
+        assert cache.get("gpt-5", "prompt", {}) is None
+        cache.put("gpt-5", "prompt", {}, "response")
+        assert cache.get("gpt-5", "prompt", {}) == "response"
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+        assert cache.stats()["entries"] == 1
+
+    def test_key_covers_model_and_params(self, cache_path):
+        cache = ResponseCache(cache_path, 1024 * 1024)
+        cache.put("gpt-5", "prompt", {"max_tokens": 50}, "response")
+        assert cache.get("gpt-5-mini", "prompt", {"max_tokens": 50}) is None
+        assert cache.get("gpt-5", "prompt", {"max_tokens": 100}) is None
+        assert cache.get("gpt-5", "prompt", {"max_tokens": 50}) == "response"
+
+    def test_persists_across_instances(self, cache_path):
+        ResponseCache(cache_path, 1024 * 1024).put("gpt-5", "p", {}, "r")
+        assert ResponseCache(cache_path, 1024 * 1024).get("gpt-5", "p", {}) == "r"
+
+    def test_evicts_least_recently_used(self, cache_path):
+        # Each entry is 2 bytes of prompt + 8 bytes of response.
+        cache = ResponseCache(cache_path, 25)
+        cache.put("m", "p1", {}, "r" * 8)
+        cache.put("m", "p2", {}, "r" * 8)
+        cache.get("m", "p1", {})  # p1 is now more recent than p2
+        cache.put("m", "p3", {}, "r" * 8)
+        assert cache.get("m", "p2", {}) is None
+        assert cache.get("m", "p1", {}) is not None
+        assert cache.get("m", "p3", {}) is not None
+        assert cache.stats()["size_bytes"] <= 25
+
+    def test_size_is_shared_between_processes(self, cache_path):
+        # Two connections to one file stand for two processes.
+        first = ResponseCache(cache_path, 25)
+        second = ResponseCache(cache_path, 25)
+        first.put("m", "p1", {}, "r" * 8)
+        second.put("m", "p2", {}, "r" * 8)
+        first.put("m", "p3", {}, "r" * 8)
+        assert first.stats()["size_bytes"] <= 25
+        assert first.stats()["entries"] == 2
+        assert second.stats()["size_bytes"] == first.stats()["size_bytes"]
+
+    def test_hits_defer_last_used_updates(self, cache_path):
+        cache = ResponseCache(cache_path, 1024 * 1024)
+        cache.put("m", "p", {}, "r")
+
+        def last_used():
+            return cache._conn.execute("SELECT last_used FROM responses").fetchone()[0]
+
+        stored = last_used()
+        assert cache.get("m", "p", {}) == "r"
+        assert last_used() == stored
+        cache.flush()
+        assert last_used() > stored
+
+    def test_replay_is_read_only(self, cache_path):
+        ResponseCache(cache_path, 1024 * 1024).put("gpt-5", "p", {}, "r")
+        cache = ResponseCache(cache_path, 1024 * 1024, "replay")
+        assert cache.get("gpt-5", "p", {}) == "r"
+        cache.put("gpt-5", "other", {}, "r")
+        with pytest.raises(CacheMissError):
+            cache.get("gpt-5", "other", {})
+
+
+class TestSafeGenerateCaching:
+    @staticmethod
+    def _generate():
+        return gpt_structure.ChatGPT_safe_generate_response(
+            "prompt",
+            "example",
+            "",
+            repeat=3,
+            func_validate=lambda response, prompt: response != "bad",
+        )
+
+    def test_stores_only_validated_responses(self, cache_path):
+        cache = ResponseCache(cache_path, 1024 * 1024)
+        request = MagicMock(side_effect=['{"output": "bad"}', '{"output": "good"}'])
+        with (
+            patch.object(gpt_structure, "response_cache", cache),
+            patch.object(gpt_structure, "ChatGPT_request", request),
+        ):
+            assert self._generate() == "good"
+            assert self._generate() == "good"
+        # The second call is served from the cache.
+        assert request.call_count == 2
+        assert cache.stats()["entries"] == 1
+
+    def test_hits_are_not_stored_again(self, cache_path):
+        cache = ResponseCache(cache_path, 1024 * 1024)
+        cache.put("gpt-5", "prompt", {}, '{"output": "good"}')
+        with (
+            patch.object(gpt_structure, "response_cache", cache),
+            patch.object(cache, "put") as put,
+        ):
+            assert (
+                gpt_structure.safe_generate_response(
+                    "prompt", {}, func_validate=lambda response, prompt: True
+                )
+                == '{"output": "good"}'
+            )
+        put.assert_not_called()
+
+    def test_error_responses_are_not_cached(self, cache_path):
+        cache = ResponseCache(cache_path, 1024 * 1024)
+        with (
+            patch.object(gpt_structure, "response_cache", cache),
+            patch.object(
+                gpt_structure, "GPT_request", MagicMock(return_value="ChatGPT ERROR")
+            ),
+        ):
+            gpt_structure.safe_generate_response(
+                "prompt", {}, func_validate=lambda response, prompt: True
+            )
+        assert cache.stats()["entries"] == 0
+
+    def test_replay_miss_does_not_call_api(self, cache_path):
+        ResponseCache(cache_path, 1024 * 1024)  # create the file
+        cache = ResponseCache(cache_path, 1024 * 1024, "replay")
+        request = MagicMock(return_value='{"output": "good"}')
+        with (
+            patch.object(gpt_structure, "response_cache", cache),
+            patch.object(gpt_structure, "ChatGPT_request", request),
+            pytest.raises(CacheMissError),
+        ):
+            self._generate()
+        request.assert_not_called()
+
+    def test_replay_does_not_retry_a_response_that_fails_validation(self, cache_path):
+        ResponseCache(cache_path, 1024 * 1024).put(
+            gpt_structure.MODEL_PLAN, "prompt", {}, "bad"
+        )
+        cache = ResponseCache(cache_path, 1024 * 1024, "replay")
+        request = MagicMock(return_value="good")
+        with (
+            patch.object(gpt_structure, "response_cache", cache),
+            patch.object(gpt_structure, "GPT_request", request),
+        ):
+            response = gpt_structure.safe_generate_response(
+                "prompt", {}, func_validate=lambda response, prompt: response != "bad"
+            )
+        assert response == "error"
+        assert cache.stats()["hits"] == 1
+        request.assert_not_called()
+
+
+
+class TestReplayStaysOffline:
+    @pytest.fixture
+    def replay_cache(self, cache_path):
+        ResponseCache(cache_path, 1024 * 1024).put(
+            gpt_structure.MODEL_PLAN, "cached", {}, "response"
+        )
+        cache = ResponseCache(cache_path, 1024 * 1024, "replay")
+        with patch.object(gpt_structure, "response_cache", cache):
+            yield cache
+
+    @staticmethod
+    def _raw_chat():
+        return gpt_structure.transport.client.chat.completions.with_raw_response
+
+    def test_single_request_is_served_from_the_cache(self, replay_cache):
+        create = AsyncMock()
+        with patch.object(self._raw_chat(), "create", create):
+            assert gpt_structure.ChatGPT_single_request("cached") == "response"
+            with pytest.raises(CacheMissError):
+                gpt_structure.ChatGPT_single_request("other")
+        create.assert_not_called()
+
+    def test_request_functions_do_not_call_the_api(self, replay_cache):
+        create = AsyncMock()
+        with patch.object(self._raw_chat(), "create", create):
+            for request in (
+                lambda: gpt_structure.GPT4_request("other"),
+                lambda: gpt_structure.ChatGPT_request("other"),
+                lambda: gpt_structure.GPT_request("other", {}),
+                lambda: gpt_structure.ChatGPT_safe_generate_response_OLD("other"),
+            ):
+                with pytest.raises(CacheMissError):
+                    request()
+        create.assert_not_called()
+
+    def test_embeddings_come_from_the_store_only(self, replay_cache, tmp_path):
+        store = EmbeddingStore(tmp_path / "replay_embeddings.sqlite3")
+        store.put(gpt_structure.MODEL_RETRIEVE_EMBEDDING, "idle", [1.0])
+        create = AsyncMock()
+        embeddings = gpt_structure.transport.client.embeddings.with_raw_response
+        with (
+            patch.object(gpt_structure, "embedding_store", store),
+            patch.object(embeddings, "create", create),
+        ):
+            assert gpt_structure.get_embedding("idle") == [1.0]
+            with pytest.raises(CacheMissError):
+                gpt_structure.get_embedding("bed")
+        create.assert_not_called()
+
+
+def test_single_request_responses_are_cached(cache_path):
+    cache = ResponseCache(cache_path, 1024 * 1024)
+    response = MagicMock(
+        headers={},
+        parse=MagicMock(
+            return_value=MagicMock(
+                choices=[MagicMock(message=MagicMock(content="response"))]
+            )
+        ),
+    )
+    create = AsyncMock(return_value=response)
+    raw_chat = gpt_structure.transport.client.chat.completions.with_raw_response
+    with (
+        patch.object(gpt_structure, "response_cache", cache),
+        patch.object(raw_chat, "create", create),
+    ):
+        assert gpt_structure.ChatGPT_single_request("prompt") == "response"
+        assert gpt_structure.ChatGPT_single_request("prompt") == "response"
+    assert create.call_count == 1
+
+def test_cmd_print_llm_cache_stats(cache_path):
+    cache = ResponseCache(cache_path, 1024 * 1024)
+    cache.put("gpt-5", "p", {}, "r")
+    cache.get("gpt-5", "p", {})
+    with patch.object(inspection.gpt_structure, "response_cache", cache):
+        result = dispatch(MagicMock(), "print llm cache stats")
+    assert "hits: 1" in result.output
+    assert "entries: 1" in result.output
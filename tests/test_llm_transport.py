@@ -0,0 +1,106 @@
+"""Tests for the asynchronous LLM transport."""
+
+import asyncio
+from unittest.mock import MagicMock
+
+import pytest
+
+from generative_agents.backend.persona.prompt_template.llm_transport import (
+    LLMTransport,
+)
+
+
+def make_raw(response, headers=None):
+    """What a with_raw_response create method returns."""
+    return MagicMock(headers=headers or {}, parse=MagicMock(return_value=response))
+
+
+def make_completion(content):
+    completion = MagicMock()
+    completion.choices = [MagicMock(message=MagicMock(content=content))]
+    return make_raw(completion)
+
+
+class ConcurrencyProbe:
+    """Fake chat.completions.create that records peak concurrency per model."""
+
+    def __init__(self):
+        self.running = {}
+        self.peak = {}
+        self.peak_total = 0
+
+    async def create(self, model, messages, **params):
+        self.running[model] = self.running.get(model, 0) + 1
+        self.peak[model] = max(self.peak.get(model, 0), self.running[model])
+        self.peak_total = max(self.peak_total, sum(self.running.values()))
+        await asyncio.sleep(0.02)
+        self.running[model] -= 1
+        return make_completion(messages[0]["content"])
+
+
+@pytest.fixture
+def probe_transport():
+    def _make(max_in_flight, model_limits=None):
+        transport = LLMTransport("test-key", max_in_flight, model_limits)
+        probe = ConcurrencyProbe()
+        transport.client = MagicMock()
+        transport.client.chat.completions.with_raw_response.create = probe.create
+        return transport, probe
+
+    return _make
+
+
+class TestLLMTransport:
+    def test_run_returns_completion_content(self, probe_transport):
+        transport, _ = probe_transport(4)
+        assert transport.run(transport.chat_completion("gpt-5", "hello")) == "hello"
+
+    def test_gather_keeps_order(self, probe_transport):
+        transport, _ = probe_transport(4)
+        prompts = [f"prompt {i}" for i in range(6)]
+        results = transport.gather(
+            *(transport.chat_completion("gpt-5", p) for p in prompts)
+        )
+        assert results == prompts
+
+    def test_global_in_flight_limit(self, probe_transport):
+        transport, probe = probe_transport(3)
+        transport.gather(
+            *(transport.chat_completion(f"model-{i % 2}", "x") for i in range(10))
+        )
+        assert probe.peak_total == 3
+
+    def test_per_model_limit(self, probe_transport):
+        transport, probe = probe_transport(8, {"gpt-5": 2})
+        transport.gather(
+            *(transport.chat_completion("gpt-5", "x") for _ in range(6)),
+            *(transport.chat_completion("gpt-5-mini", "x") for _ in range(6)),
+        )
+        assert probe.peak["gpt-5"] == 2
+        assert probe.peak["gpt-5-mini"] == 6
+
+    def test_sync_callers_on_threads_share_limit(self, probe_transport):
+        from concurrent.futures import ThreadPoolExecutor
+
+        transport, probe = probe_transport(2)
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            list(
+                pool.map(
+                    lambda i: transport.run(transport.chat_completion("gpt-5", "x")),
+                    range(6),
+                )
+            )
+        assert probe.peak_total == 2
+
+    def test_embeddings(self):
+        transport = LLMTransport("test-key")
+        response = MagicMock()
+        response.data = [MagicMock(embedding=[1.0]), MagicMock(embedding=[2.0])]
+
+        async def create(input, model):
+            return make_raw(response)
+
+        transport.client = MagicMock()
+        transport.client.embeddings.with_raw_response.create = create
+        result = transport.run(transport.create_embeddings("emb", ["a", "b"]))
+        assert result == [[1.0], [2.0]]
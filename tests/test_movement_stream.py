@@ -0,0 +1,113 @@
+"""Tests for the server-sent event stream of persona movements."""
+
+import json
+import os
+import sys
+import threading
+from pathlib import Path
+from unittest.mock import patch
+
+import django
+import pytest
+from django.test import RequestFactory
+from django.urls import resolve
+
+FRONTEND_SERVER_PATH = Path(__file__).parent.parent / "environment" / "frontend_server"
+sys.path.insert(0, str(FRONTEND_SERVER_PATH))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "frontend_server.settings")
+django.setup()
+
+from translator import views  # noqa: E402
+
+from generative_agents.steplog import StepLog  # noqa: E402
+
+
+def parse(event):
+    """The (id, data) of an event, or None for a keep-alive comment."""
+    if event.startswith(":"):
+        return None
+    lines = dict(line.split(": ", 1) for line in event.strip().split("\n"))
+    return int(lines["id"]), json.loads(lines["data"])
+
+
+@pytest.fixture
+def movement_log(tmp_path):
+    log = StepLog(tmp_path / "movement")
+    for step in range(3):
+        log.append(step, {"persona": {"A": {"movement": [step, 0]}}})
+    return log
+
+
+class TestMovementEvents:
+    def test_sends_the_steps_already_in_the_log(self, movement_log):
+        events = views.movement_events(movement_log, 1, keepalive=0.05)
+        assert parse(next(events)) == (
+            1,
+            {"persona": {"A": {"movement": [1, 0]}}, "<step>": 1},
+        )
+        assert parse(next(events))[0] == 2
+        events.close()
+
+    def test_keeps_alive_while_waiting_for_a_step(self, movement_log):
+        events = views.movement_events(movement_log, 3, keepalive=0.05)
+        assert next(events) == ": keep-alive\n\n"
+
+        writer = threading.Timer(
+            0.1, movement_log.append, (3, {"persona": {"A": {"movement": [3, 0]}}})
+        )
+        writer.start()
+        try:
+            event = next(events)
+            while event == ": keep-alive\n\n":
+                event = next(events)
+        finally:
+            writer.join()
+            events.close()
+        assert parse(event)[0] == 3
+
+    def test_ends_after_idling(self, movement_log):
+        events = views.movement_events(
+            movement_log, 2, keepalive=0.05, idle_timeout=0.2
+        )
+        received = list(events)
+        assert parse(received[0])[0] == 2
+        assert set(received[1:]) == {": keep-alive\n\n"}
+
+    def test_closing_a_waiting_stream_is_clean(self, movement_log):
+        events = views.movement_events(movement_log, 3, keepalive=0.05)
+        assert next(events) == ": keep-alive\n\n"
+        events.close()
+        with pytest.raises(StopIteration):
+            next(events)
+
+
+class TestMovementStream:
+    @staticmethod
+    def stream(tmp_path, step, **headers):
+        request = RequestFactory().get(f"/movement_stream/sim/{step}/", **headers)
+        with patch.object(
+            views, "safe_storage_path", return_value=tmp_path / "movement"
+        ):
+            return views.movement_stream(request, "sim", step)
+
+    def test_streams_from_the_requested_step(self, movement_log, tmp_path):
+        response = self.stream(tmp_path, "1")
+        assert response["Content-Type"] == "text/event-stream"
+        assert response["Cache-Control"] == "no-cache"
+        content = iter(response.streaming_content)
+        assert parse(next(content).decode())[0] == 1
+        response.close()
+
+    def test_resumes_after_the_last_event_id(self, movement_log, tmp_path):
+        response = self.stream(tmp_path, "0", HTTP_LAST_EVENT_ID="1")
+        content = iter(response.streaming_content)
+        assert parse(next(content).decode())[0] == 2
+        response.close()
+
+    def test_invalid_step_is_rejected(self, tmp_path):
+        assert self.stream(tmp_path, "-1").status_code == 400
+
+    def test_route(self):
+        match = resolve("/movement_stream/base_the_ville/12/")
+        assert match.func is views.movement_stream
+        assert match.kwargs == {"sim_code": "base_the_ville", "step": "12"}
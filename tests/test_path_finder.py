@@ -0,0 +1,267 @@
+"""Tests for the A* path finder."""
+
+import random
+
+import numpy as np
+import pytest
+
+from generative_agents.backend import maze as maze_module
+from generative_agents.backend.maze import Maze
+from generative_agents.backend.path_finder import (
+    PathCache,
+    RegionGraph,
+    descend_distance_field,
+    distance_field,
+    find_path,
+    find_path_to_any,
+    path_finder_v2,
+)
+from generative_agents.backend.utils import collision_block_id
+
+
+def legacy_path(collision_maze, start, end, collision_block_char):
+    """path_finder_v2 in (x, y) coordinates, as path_finder used to call it."""
+    path = path_finder_v2(
+        collision_maze, start[::-1], end[::-1], collision_block_char
+    )
+    return [(j, i) for i, j in path]
+
+
+@pytest.fixture(scope="module")
+def maze():
+    return Maze("the_ville")
+
+
+class TestFindPath:
+    def test_matches_legacy_path_finder_on_random_grids(self):
+        rng = random.Random(0)
+        for _ in range(200):
+            width, height = rng.randint(1, 12), rng.randint(1, 12)
+            grid = [
+                ["#" if rng.random() < 0.3 else " " for _ in range(width)]
+                for _ in range(height)
+            ]
+            start = (rng.randrange(width), rng.randrange(height))
+            end = (rng.randrange(width), rng.randrange(height))
+            expected = legacy_path(grid, start, end, "#")
+            assert find_path(np.array(grid) == "#", start, end) == expected
+
+    def test_matches_legacy_path_finder_on_the_ville(self, maze):
+        rng = random.Random(1)
+        walkable = list(zip(*np.nonzero(~maze.collision_grid)))
+        for _ in range(10):
+            start, end = (
+                (int(x), int(y)) for y, x in rng.sample(walkable, 2)
+            )
+            expected = legacy_path(
+                maze.collision_maze, start, end, collision_block_id
+            )
+            path = find_path(maze.collision_grid, start, end)
+            # path_finder_v2 gives up after 150 steps.
+            if len(expected) > 1:
+                assert path == expected
+            assert path[-1] == end
+
+    def test_paths_longer_than_150_steps(self):
+        grid = np.zeros((1, 400), dtype=bool)
+        path = find_path(grid, (0, 0), (399, 0))
+        assert path == [(x, 0) for x in range(400)]
+
+    def test_unreachable_end_and_same_tile(self):
+        grid = np.array([[False, True, False]])
+        assert find_path(grid, (0, 0), (2, 0)) == [(2, 0)]
+        assert find_path(grid, (0, 0), (1, 0)) == [(1, 0)]
+        assert find_path(grid, (2, 0), (2, 0)) == [(2, 0)]
+
+
+class TestDistanceField:
+    def test_descent_gives_shortest_path_to_closest_source(self):
+        rng = random.Random(3)
+        for _ in range(100):
+            width, height = rng.randint(1, 10), rng.randint(1, 10)
+            grid = np.array(
+                [[rng.random() < 0.3 for _ in range(width)] for _ in range(height)]
+            )
+            tiles = [(x, y) for y in range(height) for x in range(width)]
+            sources = rng.sample(tiles, min(len(tiles), rng.randint(1, 3)))
+            start = rng.choice(tiles)
+            field = distance_field(grid, sources)
+            path = descend_distance_field(field, start)
+
+            searched = [find_path(grid, start, source) for source in sources]
+            reachable = [
+                p for p in searched if p[0] == start and not grid[p[-1][1], p[-1][0]]
+            ]
+            if not reachable:
+                assert path is None
+                continue
+            assert len(path) == min(len(p) for p in reachable)
+            assert path[0] == start and path[-1] in sources
+            for (x, y), (next_x, next_y) in zip(path, path[1:]):
+                assert abs(x - next_x) + abs(y - next_y) == 1
+                assert not grid[next_y, next_x]
+
+    def test_maze_caches_fields_on_disk(self, maze, tmp_path, monkeypatch):
+        monkeypatch.setattr(maze_module, "DISTANCE_FIELDS_FOLDER", str(tmp_path))
+        monkeypatch.setattr(maze, "_distance_fields", {})
+        address = "the Ville:Hobbs Cafe:cafe:cafe customer seating"
+        field = maze.distance_field(address)
+        assert maze.distance_field(address) is field
+        assert len(list(tmp_path.glob(f"{maze.maze_name}/*/*.npy"))) == 1
+
+        monkeypatch.setattr(maze, "_distance_fields", {})
+        with monkeypatch.context() as patched:
+            patched.setattr(maze_module, "distance_field", None)
+            assert np.array_equal(maze.distance_field(address), field)
+
+        start = (72, 14)
+        path = maze.path_to_address(start, address)
+        assert path[-1] in maze.address_tiles[address]
+        assert len(path) == min(
+            len(find_path(maze.collision_grid, start, tile))
+            for tile in maze.address_tiles[address]
+        )
+
+
+class TestFindPathToAny:
+    def test_matches_separate_searches(self):
+        rng = random.Random(4)
+        for _ in range(200):
+            width, height = rng.randint(1, 10), rng.randint(1, 10)
+            grid = np.array(
+                [[rng.random() < 0.3 for _ in range(width)] for _ in range(height)]
+            )
+            tiles = [(x, y) for y in range(height) for x in range(width)]
+            start = rng.choice(tiles)
+            ends = [rng.choice(tiles) for _ in range(rng.randint(1, 4))]
+
+            path, end = find_path_to_any(grid, start, ends)
+
+            searched = [(find_path(grid, start, tile), tile) for tile in ends]
+            reachable = [(p, tile) for p, tile in searched if p[0] == start]
+            if not reachable:
+                assert (path, end) == ([ends[0]], ends[0])
+                continue
+            expected = min(reachable, key=lambda found: len(found[0]))
+            assert (path, end) == expected
+
+    def test_returns_the_given_tile(self):
+        grid = np.zeros((3, 3), dtype=bool)
+        path, end = find_path_to_any(grid, (0, 0), [[2, 2], [0, 2]])
+        assert end == [0, 2]
+        assert path == [(0, 0), (0, 1), (0, 2)]
+
+
+class TestPathCache:
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = PathCache(2)
+        for n in range(3):
+            if n == 2:
+                assert cache.get(PathCache.make_key((0, 0), [(0, 0)], 0, "exact"))
+            cache.put(
+                PathCache.make_key((n, 0), [(n, 0)], 0, "exact"), ([(n, 0)], 0)
+            )
+        assert cache.get(PathCache.make_key((1, 0), [(1, 0)], 0, "exact")) is None
+        assert cache.stats() == {
+            "hits": 1,
+            "misses": 1,
+            "entries": 2,
+            "max_entries": 2,
+        }
+
+    def test_maze_reuses_searches_until_collisions_change(self, maze, monkeypatch):
+        monkeypatch.setattr(maze, "path_cache", PathCache(100))
+        start, end = (72, 14), (126, 46)
+        path = maze.find_path(start, end)
+        assert path == find_path(maze.collision_grid, start, end)
+        assert maze.find_path(start, end) == path
+        assert maze.path_cache.stats()["hits"] == 1
+
+        tile = path[len(path) // 2]
+        revision = maze.collision_revision
+        maze.set_collision(tile, True)
+        try:
+            detour = maze.find_path(start, end)
+            assert tile not in detour
+            assert maze.path_cache.stats()["misses"] == 2
+        finally:
+            maze.set_collision(tile, False)
+        assert maze.collision_revision == revision + 2
+
+    def test_saved_paths_are_loaded_for_the_same_collisions(
+        self, maze, tmp_path, monkeypatch
+    ):
+        cache_file = tmp_path / "path_cache.json"
+        monkeypatch.setattr(maze, "path_cache", PathCache(100))
+        path, end = maze.find_path_to_any((72, 14), [[126, 46], (123, 57)])
+        maze.save_path_cache(cache_file)
+
+        monkeypatch.setattr(maze, "path_cache", PathCache(100))
+        maze.load_path_cache(cache_file)
+        assert maze.find_path_to_any((72, 14), [[126, 46], (123, 57)]) == (
+            path,
+            end,
+        )
+        assert maze.path_cache.stats()["hits"] == 1
+
+        monkeypatch.setattr(maze, "path_cache", PathCache(100))
+        maze.path_cache.load(cache_file, 0, "another maze", maze.path_mode())
+        assert maze.path_cache.stats()["entries"] == 0
+
+    def test_paths_are_not_shared_across_path_modes(self, maze, tmp_path, monkeypatch):
+        cache_file = tmp_path / "path_cache.json"
+        monkeypatch.setattr(maze, "path_cache", PathCache(100))
+        start, end = (72, 14), (126, 46)
+        exact = maze.find_path(start, end)
+        maze.save_path_cache(cache_file)
+
+        monkeypatch.setattr(maze_module, "PATH_MODE", "hierarchical")
+        assert maze.find_path(start, end) == maze.region_graph.find_path(start, end)
+        assert maze.path_cache.stats()["hits"] == 0
+
+        monkeypatch.setattr(maze, "path_cache", PathCache(100))
+        maze.load_path_cache(cache_file)
+        assert maze.path_cache.stats()["entries"] == 0
+        monkeypatch.setattr(maze_module, "PATH_MODE", "exact")
+        maze.load_path_cache(cache_file)
+        assert maze.find_path(start, end) == exact
+        assert maze.path_cache.stats()["hits"] == 1
+
+
+class TestRegionGraph:
+    def test_routes_are_valid_and_close_to_shortest(self, maze):
+        graph = maze.region_graph
+        rng = random.Random(5)
+        walkable = list(zip(*np.nonzero(~maze.collision_grid)))
+        planned = 0
+        while planned < 20:
+            start, end = ((int(x), int(y)) for y, x in rng.sample(walkable, 2))
+            shortest = find_path(maze.collision_grid, start, end)
+            path = graph.find_path(start, end)
+            if len(shortest) == 1 or graph.region_of(start) == graph.region_of(end):
+                continue
+            planned += 1
+            assert path[0] == start and path[-1] == end
+            for (x, y), (next_x, next_y) in zip(path, path[1:]):
+                assert abs(x - next_x) + abs(y - next_y) == 1
+                assert not maze.collision_grid[next_y, next_x]
+            assert len(shortest) <= len(path) <= 2 * len(shortest)
+
+    def test_unlabeled_tiles_are_split_into_blocks(self):
+        grid = np.zeros((4, 8), dtype=bool)
+        graph = RegionGraph(grid, np.zeros((4, 8), dtype=np.int32), block_size=4)
+        assert graph.region_of((0, 0)) != graph.region_of((4, 0))
+        assert graph.find_path((0, 0), (3, 3)) is None
+        # The border between the blocks is crossed at its portal, midway.
+        path = graph.find_path((0, 0), (7, 0))
+        assert path[0] == (0, 0) and path[-1] == (7, 0)
+        assert path[path.index((3, 2)) + 1] == (4, 2)
+        assert len(path) == 12
+
+    def test_maze_plans_long_routes_hierarchically(self, maze, monkeypatch):
+        monkeypatch.setattr(maze_module, "PATH_MODE", "hierarchical")
+        monkeypatch.setattr(maze, "path_cache", PathCache(100))
+        start, end = (72, 14), (126, 46)
+        assert maze.find_path(start, end) == maze.region_graph.find_path(start, end)
+        near = (start[0] + 1, start[1])
+        assert maze.find_path(start, near) == [start, near]
@@ -0,0 +1,104 @@
+"""Tests for lazy loading of persona memories."""
+
+import json
+import shutil
+import threading
+from pathlib import Path
+
+import pytest
+
+from generative_agents.backend.persona.persona import Persona
+from generative_agents.backend.persona.cognitive_modules.plan import _reaction_lock
+
+BASE_PERSONA = (
+    Path(__file__).parent.parent
+    / "environment/frontend_server/storage/base_the_ville_isabella_maria_klaus"
+    / "personas/Isabella Rodriguez"
+)
+
+
+@pytest.fixture
+def persona_folder(tmp_path):
+    folder = tmp_path / "Isabella Rodriguez"
+    shutil.copytree(BASE_PERSONA, folder)
+    return folder
+
+
+class TestLazyPersona:
+    def test_memory_loads_on_first_access(self, persona_folder):
+        persona = Persona("Isabella Rodriguez", str(persona_folder), lazy=True)
+        assert persona._a_mem is None and persona._s_mem is None
+        assert persona.scratch.name == "Isabella Rodriguez"
+
+        eager = Persona("Isabella Rodriguez", str(persona_folder))
+        assert persona.s_mem.tree == eager.s_mem.tree
+        assert persona._a_mem is not None
+        assert list(persona.a_mem.id_to_node) == list(eager.a_mem.id_to_node)
+
+    def test_embeddings_are_read_when_retrieval_needs_them(self, persona_folder):
+        persona = Persona("Isabella Rodriguez", str(persona_folder))
+        a_mem = persona.a_mem
+        assert a_mem._embedded_rows == 0
+        matrix = a_mem.embedding_matrix()
+        assert a_mem._embedded_rows == len(a_mem.id_to_node) == len(matrix)
+
+    def test_unloaded_memory_is_not_rewritten(self, persona_folder):
+        persona = Persona("Isabella Rodriguez", str(persona_folder), lazy=True)
+        memory = persona_folder / "bootstrap_memory"
+        nodes = (memory / "associative_memory/nodes.json").read_bytes()
+        persona.save(str(memory))
+        assert (memory / "associative_memory/nodes.json").read_bytes() == nodes
+        assert json.loads((memory / "scratch.json").read_text())["name"] == (
+            "Isabella Rodriguez"
+        )
+
+        persona.a_mem
+        persona.save(str(memory))
+        assert (memory / "associative_memory/nodes.jsonl").exists()
+
+
+class TestReactionLock:
+    @pytest.fixture
+    def personas(self, persona_folder):
+        return {
+            name: Persona(name, str(persona_folder), lazy=True)
+            for name in ("Isabella Rodriguez", "Klaus Mueller")
+        }
+
+    def test_reaction_holds_the_target_lock(self, personas):
+        isabella, klaus = personas.values()
+        with isabella.cognition_lock:
+            with _reaction_lock(isabella, klaus) as can_react:
+                assert can_react
+                assert klaus.cognition_lock.locked()
+            assert not klaus.cognition_lock.locked()
+            assert isabella.cognition_lock.locked()
+
+    def test_personas_reacting_to_each_other_defer_instead_of_waiting(self, personas):
+        barrier = threading.Barrier(2)
+        outcomes = {}
+
+        def react(name, target_name):
+            persona = personas[name]
+            with persona.cognition_lock:
+                # Both personas are in the middle of their move.
+                barrier.wait()
+                with _reaction_lock(persona, personas[target_name]) as can_react:
+                    outcomes[name] = can_react
+                    assert persona.cognition_lock.locked()
+                barrier.wait()
+
+        threads = [
+            threading.Thread(target=react, args=pair)
+            for pair in [
+                ("Isabella Rodriguez", "Klaus Mueller"),
+                ("Klaus Mueller", "Isabella Rodriguez"),
+            ]
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=5)
+
+        assert outcomes == {"Isabella Rodriguez": False, "Klaus Mueller": False}
+        assert not any(p.cognition_lock.locked() for p in personas.values())
@@ -0,0 +1,150 @@
+"""Tests for rate limiting and retries of the LLM transport."""
+
+import asyncio
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+from openai import RateLimitError
+
+from generative_agents.backend.persona.prompt_template import llm_transport
+from generative_agents.backend.persona.prompt_template.llm_transport import (
+    LLMTransport,
+)
+from generative_agents.backend.persona.prompt_template.rate_limiter import (
+    ModelRateLimiter,
+    TokenBucket,
+    backoff_delay,
+    retry_after_seconds,
+)
+
+
+def make_raw(response, headers=None):
+    return MagicMock(headers=headers or {}, parse=MagicMock(return_value=response))
+
+
+def make_completion(content, total_tokens=None):
+    completion = MagicMock()
+    completion.choices = [MagicMock(message=MagicMock(content=content))]
+    completion.usage.total_tokens = total_tokens
+    return completion
+
+
+def rate_limit_error(headers=None, code=None):
+    response = MagicMock(status_code=429, headers=headers or {})
+    body = {"code": code} if code else None
+    return RateLimitError("rate limited", response=response, body=body)
+
+
+class TestTokenBucket:
+    def test_unlimited_never_waits(self):
+        bucket = TokenBucket()
+        start = time.monotonic()
+        asyncio.run(bucket.acquire(10**9))
+        assert time.monotonic() - start < 0.05
+
+    def test_waits_for_refill(self):
+        bucket = TokenBucket(600)  # 10 per second
+        bucket.level = 0
+        start = time.monotonic()
+        asyncio.run(bucket.acquire(1))
+        assert time.monotonic() - start >= 0.09
+
+    def test_oversized_request_is_capped_at_budget(self):
+        bucket = TokenBucket(60)
+        asyncio.run(bucket.acquire(1000))
+        assert bucket.level < 1
+
+    def test_set_limit_from_unlimited(self):
+        bucket = TokenBucket()
+        bucket.set_limit(100)
+        assert bucket.per_minute == 100
+        assert bucket.level == 100
+
+
+class TestModelRateLimiter:
+    def test_update_from_headers(self):
+        limiter = ModelRateLimiter()
+        limiter.update(
+            {
+                "x-ratelimit-limit-requests": "500",
+                "x-ratelimit-remaining-requests": "10",
+                "x-ratelimit-limit-tokens": "30000",
+                "x-ratelimit-remaining-tokens": "29000",
+            }
+        )
+        assert limiter.requests.per_minute == 500
+        assert limiter.requests.level == pytest.approx(10, abs=1)
+        assert limiter.tokens.per_minute == 30000
+        assert limiter.tokens.level == pytest.approx(29000, abs=10)
+
+    def test_update_ignores_missing_headers(self):
+        limiter = ModelRateLimiter(rpm=100)
+        limiter.update({})
+        limiter.update(None)
+        assert limiter.requests.per_minute == 100
+        assert limiter.tokens.per_minute is None
+
+
+class TestBackoff:
+    def test_exponential_with_cap(self):
+        for attempt in range(10):
+            delay = backoff_delay(attempt, base=0.5, maximum=4)
+            assert 0 <= delay <= min(4, 0.5 * 2**attempt)
+
+    def test_respects_retry_after(self):
+        assert backoff_delay(0, retry_after=3) >= 3
+
+    def test_retry_after_headers(self):
+        assert retry_after_seconds({"retry-after-ms": "250"}) == 0.25
+        assert retry_after_seconds({"retry-after": "2"}) == 2
+        assert retry_after_seconds({}) is None
+
+
+class TestTransportRetries:
+    @pytest.fixture(autouse=True)
+    def no_backoff(self):
+        with patch.object(llm_transport, "backoff_delay", return_value=0):
+            yield
+
+    def _transport(self, side_effect, max_retries=3):
+        transport = LLMTransport("test-key", max_retries=max_retries)
+        transport.client = MagicMock()
+        create = MagicMock(side_effect=side_effect)
+
+        async def acreate(**kwargs):
+            return create(**kwargs)
+
+        transport.client.chat.completions.with_raw_response.create = acreate
+        return transport, create
+
+    def test_retries_rate_limit_then_succeeds(self):
+        transport, create = self._transport(
+            [rate_limit_error(), make_raw(make_completion("ok"))]
+        )
+        assert transport.run(transport.chat_completion("gpt-5", "hi")) == "ok"
+        assert create.call_count == 2
+
+    def test_gives_up_after_max_retries(self):
+        transport, create = self._transport(
+            [rate_limit_error() for _ in range(3)], max_retries=2
+        )
+        with pytest.raises(RateLimitError):
+            transport.run(transport.chat_completion("gpt-5", "hi"))
+        assert create.call_count == 3
+
+    def test_insufficient_quota_is_not_retried(self):
+        transport, create = self._transport(
+            [rate_limit_error(code="insufficient_quota")]
+        )
+        with pytest.raises(RateLimitError):
+            transport.run(transport.chat_completion("gpt-5", "hi"))
+        assert create.call_count == 1
+
+    def test_headers_update_limiter(self):
+        headers = {"x-ratelimit-limit-requests": "500"}
+        transport, _ = self._transport(
+            [make_raw(make_completion("ok", total_tokens=50), headers)]
+        )
+        transport.run(transport.chat_completion("gpt-5", "hi"))
+        assert transport._limiters["gpt-5"].requests.per_minute == 500
@@ -0,0 +1,219 @@
+"""Tests for the vectorized memory retrieval."""
+
+import datetime
+import json
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from generative_agents.backend.persona.cognitive_modules import retrieve
+from generative_agents.backend.persona.memory_structures.associative_memory import (
+    AssociativeMemory,
+)
+
+
+def empty_memory(folder):
+    (folder / "embeddings.json").write_text("{}")
+    (folder / "nodes.json").write_text("{}")
+    (folder / "kw_strength.json").write_text(
+        json.dumps({"kw_strength_event": {}, "kw_strength_thought": {}})
+    )
+    return AssociativeMemory(str(folder))
+
+
+@pytest.fixture
+def persona(tmp_path):
+    rng = np.random.default_rng(7)
+    a_mem = empty_memory(tmp_path)
+    start = datetime.datetime(2023, 2, 13, 8)
+    for i in range(60):
+        # Several nodes share a creation time to exercise the tie-breaking.
+        created = start + datetime.timedelta(minutes=i // 3)
+        add = a_mem.add_thought if i % 4 == 0 else a_mem.add_event
+        key = "bed is idle" if i % 10 == 9 else f"memory {i}"
+        add(
+            created,
+            None,
+            "Isabella",
+            "is",
+            f"thing {i}",
+            key,
+            {"Isabella"},
+            int(rng.integers(1, 10)),
+            (key, rng.normal(size=16).tolist()),
+            None,
+        )
+    scratch = SimpleNamespace(
+        recency_w=1,
+        relevance_w=1,
+        importance_w=1,
+        recency_decay=0.99,
+        curr_time=start + datetime.timedelta(hours=2),
+    )
+    return SimpleNamespace(a_mem=a_mem, scratch=scratch)
+
+
+def normalize_dict_floats(d, target_min, target_max):
+    min_val = min(d.values())
+    max_val = max(d.values())
+    range_val = max_val - min_val
+    for key, val in d.items():
+        if range_val == 0:
+            d[key] = (target_max - target_min) / 2
+        else:
+            d[key] = (val - min_val) * (
+                target_max - target_min
+            ) / range_val + target_min
+    return d
+
+
+def reference_retrieve(persona, focal_embeddings, n_count):
+    """The original per-node implementation of new_retrieve."""
+    retrieved = {}
+    for focal_pt, focal_embedding in focal_embeddings.items():
+        nodes = [
+            [i.last_accessed, i]
+            for i in persona.a_mem.seq_event + persona.a_mem.seq_thought
+            if "idle" not in i.embedding_key
+        ]
+        nodes = [i for created, i in sorted(nodes, key=lambda x: x[0])]
+        recency_out = normalize_dict_floats(
+            {
+                node.node_id: persona.scratch.recency_decay ** count
+                for count, node in enumerate(nodes, start=1)
+            },
+            0,
+            1,
+        )
+        importance_out = normalize_dict_floats(
+            {node.node_id: node.poignancy for node in nodes}, 0, 1
+        )
+        relevance_out = normalize_dict_floats(
+            {
+                node.node_id: retrieve.cos_sim(
+                    persona.a_mem.embeddings[node.embedding_key], focal_embedding
+                )
+                for node in nodes
+            },
+            0,
+            1,
+        )
+        master_out = {
+            key: recency_out[key] * 0.5
+            + relevance_out[key] * 3
+            + importance_out[key] * 2
+            for key in recency_out
+        }
+        master_out = dict(
+            sorted(master_out.items(), key=lambda item: item[1], reverse=True)[
+                :n_count
+            ]
+        )
+        master_nodes = [persona.a_mem.id_to_node[key] for key in master_out]
+        for n in master_nodes:
+            n.last_accessed = persona.scratch.curr_time
+        retrieved[focal_pt] = master_nodes
+    return retrieved
+
+
+class TestNewRetrieve:
+    def test_matches_reference(self, persona, tmp_path):
+        rng = np.random.default_rng(11)
+        focal_embeddings = {f"focal {i}": rng.normal(size=16).tolist() for i in range(4)}
+
+        def get_embeddings(texts):
+            return [focal_embeddings[t] for t in texts]
+
+        with patch.object(retrieve, "get_embeddings", get_embeddings):
+            result = retrieve.new_retrieve(persona, list(focal_embeddings), 10)
+        # Both implementations update last_accessed, so the reference starts
+        # again from the initial state.
+        for node in persona.a_mem.id_to_node.values():
+            node.last_accessed = node.created
+        expected = reference_retrieve(persona, focal_embeddings, 10)
+
+        assert {k: [n.node_id for n in v] for k, v in result.items()} == {
+            k: [n.node_id for n in v] for k, v in expected.items()
+        }
+
+    def test_marks_nodes_accessed(self, persona):
+        with patch.object(retrieve, "get_embeddings", lambda t: [[1.0] * 16]):
+            nodes = retrieve.new_retrieve(persona, ["focal"], 5)["focal"]
+        assert len(nodes) == 5
+        for node in nodes:
+            assert node.last_accessed == persona.scratch.curr_time
+        assert "idle" not in " ".join(n.embedding_key for n in nodes)
+
+    def test_recency_order_is_maintained(self, persona):
+        a_mem = persona.a_mem
+
+        def sorted_order():
+            nodes = [
+                i
+                for i in a_mem.seq_event + a_mem.seq_thought
+                if "idle" not in i.embedding_key
+            ]
+            return [
+                i.node_count - 1 for i in sorted(nodes, key=lambda x: x.last_accessed)
+            ]
+
+        with patch.object(retrieve, "get_embeddings", lambda t: [[1.0] * 16] * len(t)):
+            retrieve.new_retrieve(persona, ["a", "b"], 7)
+        assert a_mem.recency_order().tolist() == sorted_order()
+        a_mem.id_to_node["node_3"].last_accessed = persona.scratch.curr_time
+        assert a_mem.recency_order().tolist() == sorted_order()
+        assert a_mem.importance_range() == (
+            min(a_mem.poignancy_array()[sorted_order()]),
+            max(a_mem.poignancy_array()[sorted_order()]),
+        )
+
+    def test_empty_memory(self, tmp_path):
+        persona = SimpleNamespace(a_mem=empty_memory(tmp_path), scratch=None)
+        assert retrieve.new_retrieve(persona, ["focal"]) == {"focal": []}
+
+
+class TestBatchRetrieve:
+    def test_each_focal_point_sees_the_same_state(self, persona):
+        rng = np.random.default_rng(5)
+        focal_embeddings = {f"focal {i}": rng.normal(size=16).tolist() for i in range(3)}
+
+        def get_embeddings(texts):
+            return [focal_embeddings[t] for t in texts]
+
+        with patch.object(retrieve, "get_embeddings", get_embeddings):
+            result = retrieve.batch_retrieve(persona, list(focal_embeddings), 8)
+            accessed = {n.node_id for nodes in result.values() for n in nodes}
+            assert all(
+                persona.a_mem.id_to_node[node_id].last_accessed
+                == persona.scratch.curr_time
+                for node_id in accessed
+            )
+
+            # Each focal point on its own, from the initial state.
+            for focal_pt in focal_embeddings:
+                for node in persona.a_mem.id_to_node.values():
+                    node.last_accessed = node.created
+                expected = retrieve.new_retrieve(persona, [focal_pt], 8)[focal_pt]
+                assert [n.node_id for n in result[focal_pt]] == [
+                    n.node_id for n in expected
+                ]
+
+    def test_empty_memory(self, tmp_path):
+        persona = SimpleNamespace(a_mem=empty_memory(tmp_path), scratch=None)
+        assert retrieve.batch_retrieve(persona, ["focal"]) == {"focal": []}
+
+
+class TestTopK:
+    def test_highest_first_with_stable_ties(self):
+        scores = np.array([1.0, 3.0, 2.0, 3.0, 2.0, 0.5])
+        assert retrieve.top_k_indices(scores, 4).tolist() == [1, 3, 2, 4]
+        assert retrieve.top_k_indices(scores, 3).tolist() == [1, 3, 2]
+        assert retrieve.top_k_indices(scores, 10).tolist() == [1, 3, 2, 4, 0, 5]
+
+    def test_normalize_array_constant(self):
+        assert retrieve.normalize_array(np.array([2.0, 2.0]), 0, 1).tolist() == [
+            0.5,
+            0.5,
+        ]
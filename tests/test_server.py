@@ -0,0 +1,149 @@
+"""Tests for the ReverieServer simulation loop helpers."""
+
+import datetime
+import os
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+
+@pytest.fixture
+def server_cls():
+    with patch.dict(
+        os.environ, {"OPENAI_API_KEY": "test-key", "KEY_OWNER": "test-owner"}
+    ):
+        from generative_agents.backend.server import ReverieServer
+
+        yield ReverieServer
+
+
+def make_server(server_cls, persona_names, workers):
+    """Build a ReverieServer without touching the storage folder."""
+    server = server_cls.__new__(server_cls)
+    server.maze = MagicMock()
+    server.curr_time = MagicMock()
+    server.persona_workers = workers
+    server.personas = {}
+    server.personas_tile = {}
+    for count, name in enumerate(persona_names):
+        persona = MagicMock()
+        persona.scratch.chat = None
+        server.personas[name] = persona
+        server.personas_tile[name] = (count, count)
+    return server
+
+
+class TestMovePersonas:
+    def test_sequential_moves_in_persona_order(self, server_cls):
+        server = make_server(server_cls, ["A", "B", "C"], workers=1)
+        for count, persona in enumerate(server.personas.values()):
+            persona.move.return_value = ((count, 0), "emoji", f"desc {count}")
+
+        movements = server._move_personas()
+
+        assert list(movements["persona"]) == ["A", "B", "C"]
+        assert movements["persona"]["B"]["movement"] == (1, 0)
+        assert movements["persona"]["C"]["description"] == "desc 2"
+        server.personas["A"].move.assert_called_once_with(
+            server.maze,
+            server.personas,
+            (0, 0),
+            server.curr_time,
+            {"A": (0, 0), "B": (1, 1), "C": (2, 2)},
+        )
+
+    def test_concurrent_moves_keep_deterministic_order(self, server_cls):
+        names = ["A", "B", "C", "D"]
+        server = make_server(server_cls, names, workers=4)
+        running = set()
+        overlap = threading.Event()
+        lock = threading.Lock()
+
+        def slow_move(name, delay):
+            def move(maze, personas, curr_tile, curr_time, persona_tiles):
+                with lock:
+                    running.add(name)
+                    if len(running) > 1:
+                        overlap.set()
+                time.sleep(delay)
+                with lock:
+                    running.discard(name)
+                return curr_tile, "emoji", name
+
+            return move
+
+        # Earlier personas finish last.
+        for count, name in enumerate(names):
+            server.personas[name].move.side_effect = slow_move(
+                name, 0.05 * (len(names) - count)
+            )
+
+        movements = server._move_personas()
+
+        assert overlap.is_set()
+        assert list(movements["persona"]) == names
+        assert [m["description"] for m in movements["persona"].values()] == names
+
+
+class TestHeadlessRun:
+    def test_personas_start_each_step_where_they_moved(self, server_cls, tmp_path):
+        from generative_agents.steplog import StepLog
+
+        server = make_server(server_cls, ["A", "B"], workers=1)
+        server.maze.maze_name = "the_ville"
+        server.step = 0
+        server.curr_time = datetime.datetime(2023, 2, 13, 8)
+        server.sec_per_step = 10
+        server.server_sleep = 10
+        server.environment_log = StepLog(tmp_path / "environment")
+        server.movement_log = StepLog(tmp_path / "movement")
+        seen = []
+        for offset, persona in enumerate(server.personas.values()):
+
+            def move(
+                maze, personas, curr_tile, curr_time, persona_tiles, offset=offset
+            ):
+                seen.append(curr_tile)
+                return (curr_tile[0] + 1, offset), "emoji", "walking"
+
+            persona.move.side_effect = move
+
+        server.start_server(3, headless=True)
+
+        assert seen == [(0, 0), (1, 1), (1, 0), (2, 1), (2, 0), (3, 1)]
+        assert server.step == 3
+        assert server.movement_log.steps() == [0, 1, 2]
+        assert server.environment_log.steps() == [3]
+        assert server.environment_log.read(3) == {
+            "A": {"maze": "the_ville", "x": 3, "y": 0},
+            "B": {"maze": "the_ville", "x": 4, "y": 1},
+        }
+
+
+class TestEnvironmentWait:
+    def test_failed_wait_is_logged_and_backs_off(self, server_cls, tmp_path, capsys):
+        from generative_agents.steplog import StepLog
+
+        server = make_server(server_cls, ["A"], workers=1)
+        server.maze.maze_name = "the_ville"
+        server.step = 0
+        server.curr_time = datetime.datetime(2023, 2, 13, 8)
+        server.sec_per_step = 10
+        server.step_wait = 0.5
+        server.movement_log = StepLog(tmp_path / "movement")
+        server.environment_log = MagicMock()
+        server.environment_log.wait.side_effect = [
+            OSError("log unavailable"),
+            {"A": {"maze": "the_ville", "x": 1, "y": 0}},
+        ]
+        server.personas["A"].move.return_value = ((2, 0), "emoji", "walking")
+
+        with patch("generative_agents.backend.server.time.sleep") as sleep:
+            server.start_server(1)
+
+        sleep.assert_called_once_with(0.5)
+        assert "log unavailable" in capsys.readouterr().err
+        assert server.environment_log.wait.call_count == 2
+        assert server.movement_log.steps() == [0]
@@ -0,0 +1,111 @@
+"""Tests for the segmented per-step log."""
+
+import json
+import os
+import threading
+import time
+
+from generative_agents import steplog
+from generative_agents.steplog import INDEX_FILE, StepLog, open_step_log
+
+
+class TestStepLog:
+    def test_append_and_read_by_step(self, tmp_path):
+        log = StepLog(tmp_path)
+        for step in range(5):
+            log.append(step, {"step": step, "persona": {"A": [step, step]}})
+        assert log.read(3) == {"step": 3, "persona": {"A": [3, 3]}}
+        assert log.read(5) is None
+        assert 4 in log and 5 not in log
+        assert log.steps() == [0, 1, 2, 3, 4]
+        assert log.last_step() == 4
+
+    def test_last_record_of_a_step_wins(self, tmp_path):
+        log = StepLog(tmp_path)
+        log.append(0, {"v": 1})
+        log.append(0, {"v": 2})
+        assert log.read(0) == {"v": 2}
+        assert StepLog(tmp_path).read(0) == {"v": 2}
+
+    def test_reader_sees_records_of_another_writer(self, tmp_path):
+        reader = StepLog(tmp_path)
+        assert reader.read(0) is None
+        StepLog(tmp_path).append(0, {"v": 1})
+        assert reader.read(0) == {"v": 1}
+
+    def test_partial_index_entry_is_ignored(self, tmp_path):
+        log = StepLog(tmp_path)
+        log.append(0, {"v": 1})
+        with open(tmp_path / INDEX_FILE, "ab") as f:
+            f.write(b"\x01\x02\x03")
+        assert StepLog(tmp_path).steps() == [0]
+
+    def test_segments_roll_over(self, tmp_path):
+        log = StepLog(tmp_path, segment_bytes=64)
+        for step in range(10):
+            log.append(step, {"data": "x" * 40})
+        segments = [name for name in os.listdir(tmp_path) if name.endswith(".jsonl")]
+        assert len(segments) == 5
+        assert StepLog(tmp_path).read(7) == {"data": "x" * 40}
+
+    def test_legacy_step_files_are_read(self, tmp_path):
+        (tmp_path / "0.json").write_text(json.dumps({"legacy": True}))
+        log = StepLog(tmp_path)
+        log.append(1, {"legacy": False})
+        assert log.read(0) == {"legacy": True}
+        assert log.steps() == [0, 1]
+
+    def test_shared_segment_is_not_appended_to(self, tmp_path):
+        parent, fork = tmp_path / "parent", tmp_path / "fork"
+        StepLog(parent).append(0, {"v": 0})
+        fork.mkdir()
+        os.link(parent / "steps-000000.jsonl", fork / "steps-000000.jsonl")
+        (fork / INDEX_FILE).write_bytes((parent / INDEX_FILE).read_bytes())
+
+        StepLog(fork).append(1, {"v": 1})
+        assert StepLog(parent).steps() == [0]
+        assert (fork / "steps-000001.jsonl").exists()
+        assert StepLog(fork).read(0) == {"v": 0}
+        assert StepLog(fork).read(1) == {"v": 1}
+
+    def test_open_step_log_is_shared(self, tmp_path):
+        assert open_step_log(tmp_path) is open_step_log(str(tmp_path))
+
+
+class TestWait:
+    def test_wait_returns_an_existing_record(self, tmp_path):
+        log = StepLog(tmp_path)
+        log.append(0, {"v": 0})
+        assert log.wait(0, timeout=0) == {"v": 0}
+
+    def test_wait_times_out(self, tmp_path):
+        assert StepLog(tmp_path).wait(0, timeout=0.05) is None
+
+    def test_writer_wakes_up_waiting_reader(self, tmp_path, monkeypatch):
+        # Without the wake-up, the reader would only see the record after
+        # polling again.
+        monkeypatch.setattr(steplog, "WAIT_POLL_SECONDS", 30)
+        writer = StepLog(tmp_path)
+
+        def write_later():
+            time.sleep(0.1)
+            writer.append(0, {"v": 0})
+
+        thread = threading.Thread(target=write_later)
+        thread.start()
+        started = time.monotonic()
+        assert StepLog(tmp_path).wait(0, timeout=10) == {"v": 0}
+        assert time.monotonic() - started < 5
+        thread.join()
+
+    def test_waiter_folder_is_removed(self, tmp_path):
+        waiters = steplog._waiter_folder(tmp_path)
+        log = StepLog(tmp_path)
+        assert log.wait(0, timeout=0.01) is None
+        assert not os.path.exists(waiters)
+
+        # It stays while another reader is still waiting.
+        with log._waiter():
+            assert log.wait(0, timeout=0.01) is None
+            assert os.path.exists(waiters)
+        assert not os.path.exists(waiters)